@@ -0,0 +1,6 @@
+"""
+Benchmarks y datos sintéticos del gestor documentario.
+Los scripts se ejecutan desde la carpeta backend, p. ej.:
+    python -m benchmarks.generar_datos --db /tmp/bench.db --uploads /tmp/bench_uploads
+    python -m benchmarks.carga --url http://localhost:8000
+"""
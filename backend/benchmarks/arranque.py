@@ -0,0 +1,118 @@
+"""
+Benchmark de arranque en frío.
+1. `python -X importtime -c "import main"`: tiempo de importación y los módulos más caros.
+2. Tiempo desde lanzar uvicorn hasta que /api/health responde 200 (el primer arranque
+   incluye los pasos de inicialización de la base; los siguientes los omiten).
+
+Uso (desde backend/):
+    python -m benchmarks.arranque
+    python -m benchmarks.arranque --db /tmp/bench.db --repeticiones 5
+"""
+import argparse
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _parsear_argumentos():
+    parser = argparse.ArgumentParser(description="Benchmark de arranque del backend")
+    parser.add_argument("--db", help="Base a usar (se copia a una carpeta temporal); por defecto una base nueva")
+    parser.add_argument("--repeticiones", type=int, default=3)
+    parser.add_argument("--puerto", type=int, default=8799)
+    parser.add_argument("--top", type=int, default=15, help="Módulos a listar en el reporte de importtime")
+    parser.add_argument("--timeout", type=float, default=60)
+    return parser.parse_args()
+
+
+def _entorno(carpeta: str) -> dict:
+    env = dict(os.environ)
+    env["DATABASE_PATH"] = os.path.join(carpeta, "arranque.db")
+    env["UPLOAD_DIR"] = os.path.join(carpeta, "uploads")
+    return env
+
+
+def medir_importacion(env: dict, top: int) -> float:
+    """Ejecuta `import main` con -X importtime y muestra los módulos de mayor costo acumulado."""
+    t0 = time.perf_counter()
+    base = subprocess.run([sys.executable, "-c", "pass"], cwd=BACKEND_DIR, env=env)
+    t_interprete = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    r = subprocess.run([sys.executable, "-X", "importtime", "-c", "import main"],
+                       cwd=BACKEND_DIR, env=env, capture_output=True, text=True)
+    t_import = time.perf_counter() - t0 - t_interprete
+    if r.returncode != 0 or base.returncode != 0:
+        print(r.stderr[-2000:])
+        raise SystemExit("Falló la importación de main")
+
+    modulos = []
+    for linea in r.stderr.splitlines():
+        if not linea.startswith("import time:") or "cumulative" in linea:
+            continue
+        _, acumulado, columna_nombre = linea.split("|")
+        # La sangría del nombre indica la profundidad: 1 = importado directamente por main
+        profundidad = (len(columna_nombre) - len(columna_nombre.lstrip()) - 1) // 2
+        if profundidad == 1:
+            modulos.append((int(acumulado), columna_nombre.strip()))
+
+    print(f"Importar main: {t_import * 1000:.0f} ms (sin contar el arranque del intérprete)")
+    print(f"{'importado por main':<40}{'acumulado ms':>14}")
+    for acumulado, nombre in sorted(modulos, reverse=True)[:top]:
+        print(f"{nombre:<40}{acumulado / 1000:>14.1f}")
+    return t_import
+
+
+def medir_salud(env: dict, puerto: int, timeout: float) -> float:
+    """Segundos desde lanzar uvicorn hasta el primer 200 de /api/health."""
+    url = f"http://127.0.0.1:{puerto}/api/health"
+    t0 = time.perf_counter()
+    proceso = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(puerto), "--log-level", "warning"],
+        cwd=BACKEND_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        while time.perf_counter() - t0 < timeout:
+            if proceso.poll() is not None:
+                raise SystemExit("uvicorn terminó antes de responder")
+            try:
+                if httpx.get(url, timeout=1).status_code == 200:
+                    return time.perf_counter() - t0
+            except httpx.HTTPError:
+                pass
+            time.sleep(0.01)
+        raise SystemExit(f"/api/health no respondió en {timeout:.0f} s")
+    finally:
+        proceso.terminate()
+        proceso.wait(timeout=10)
+
+
+def main():
+    args = _parsear_argumentos()
+    carpeta = tempfile.mkdtemp(prefix="bench_arranque_")
+    env = _entorno(carpeta)
+    os.makedirs(env["UPLOAD_DIR"], exist_ok=True)
+    if args.db:
+        shutil.copy(args.db, env["DATABASE_PATH"])
+
+    try:
+        medir_importacion(env, args.top)
+
+        primero = medir_salud(env, args.puerto, args.timeout)
+        print(f"\nPrimer arranque hasta /api/health: {primero * 1000:.0f} ms (incluye inicialización de la base)")
+        tiempos = [medir_salud(env, args.puerto, args.timeout) for _ in range(args.repeticiones)]
+        print(f"Arranques siguientes ({args.repeticiones}): mínimo {min(tiempos) * 1000:.0f} ms, "
+              f"mediana {statistics.median(tiempos) * 1000:.0f} ms")
+    finally:
+        shutil.rmtree(carpeta, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
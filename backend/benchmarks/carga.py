@@ -0,0 +1,182 @@
+"""
+Prueba de carga de extremo a extremo contra un servidor en ejecución.
+Varios hilos ejecutan escenarios ponderados (listados, búsquedas, seguimiento,
+subida de PDF y exportación a Excel) y al final se reporta p50/p95/p99 y throughput.
+
+Uso (desde backend/, con el servidor apuntando a una base sintética):
+    python -m benchmarks.carga --url http://localhost:8000 --duracion 60 --concurrencia 16
+    python -m benchmarks.carga --escenarios documentos_busqueda,seguimiento --json resultado.json
+"""
+import argparse
+import json
+import random
+import threading
+import time
+from collections import defaultdict
+
+import httpx
+
+from benchmarks.pdf_sintetico import pdf_oficio
+
+BUSQUEDAS = ["conformidad", "ampliacion", "SAN COSME", "liquidacion", "CONSORCIO", "000123", "dossier"]
+
+
+def _percentil(valores_ordenados: list, p: float) -> float:
+    if not valores_ordenados:
+        return 0.0
+    k = (len(valores_ordenados) - 1) * p / 100
+    inferior = int(k)
+    superior = min(inferior + 1, len(valores_ordenados) - 1)
+    return valores_ordenados[inferior] + (valores_ordenados[superior] - valores_ordenados[inferior]) * (k - inferior)
+
+
+# Escenarios: nombre -> (peso, función(cliente, rng) -> response)
+def _documentos_lista(c, rng):
+    return c.get("/api/documentos", params={"pagina": rng.randint(1, 50), "ordenar_por": rng.choice(["numero", "fecha"])})
+
+
+def _documentos_filtro(c, rng):
+    return c.get("/api/documentos", params={
+        "tipo_documento": rng.choice(["oficio", "carta"]),
+        "direccion": rng.choice(["recibido", "enviado"]),
+        "pagina": rng.randint(1, 20),
+    })
+
+
+def _documentos_busqueda(c, rng):
+    return c.get("/api/documentos", params={"busqueda": rng.choice(BUSQUEDAS)})
+
+
+def _contratos(c, rng):
+    params = {"pagina": rng.randint(1, 20)}
+    if rng.random() < 0.5:
+        params["busqueda"] = rng.choice(BUSQUEDAS)
+    return c.get("/api/contratos", params=params)
+
+
+def _seguimiento(c, rng):
+    return c.get("/api/seguimiento")
+
+
+def _subida(c, rng):
+    pdf = pdf_oficio(f"OFICIO N°{rng.randint(1, 999999):06d}-2026-MIDIS/FONCODES/UGPE", "Prueba de carga",
+                     "NEMAEC", paginas_extra=rng.choice([0, 1, 4]))
+    return c.post("/api/subir-temporal", files={"archivo": ("carga.pdf", pdf, "application/pdf")})
+
+
+def _exportar_excel(c, rng):
+    return c.get("/api/seguimiento/exportar-excel")
+
+
+ESCENARIOS = {
+    "documentos_lista": (30, _documentos_lista),
+    "documentos_filtro": (20, _documentos_filtro),
+    "documentos_busqueda": (15, _documentos_busqueda),
+    "contratos": (15, _contratos),
+    "seguimiento": (12, _seguimiento),
+    "subida": (5, _subida),
+    "exportar_excel": (3, _exportar_excel),
+}
+
+
+def _parsear_argumentos():
+    parser = argparse.ArgumentParser(description="Prueba de carga del gestor documentario")
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--usuario", default="adminnemaec")
+    parser.add_argument("--clave", default="AdminNemaec123*")
+    parser.add_argument("--duracion", type=float, default=30, help="Segundos de medición")
+    parser.add_argument("--calentamiento", type=float, default=3, help="Segundos previos sin medir")
+    parser.add_argument("--concurrencia", type=int, default=8)
+    parser.add_argument("--escenarios", default=",".join(ESCENARIOS), help="Lista separada por comas")
+    parser.add_argument("--semilla", type=int, default=1)
+    parser.add_argument("--json", help="Guardar resultados en este archivo")
+    return parser.parse_args()
+
+
+def _login(url: str, usuario: str, clave: str) -> str:
+    r = httpx.post(f"{url}/api/login", json={"username": usuario, "password": clave}, timeout=30)
+    r.raise_for_status()
+    return r.json()["token"]
+
+
+def ejecutar(url, token, escenarios, duracion, calentamiento, concurrencia, semilla) -> dict:
+    nombres = list(escenarios)
+    pesos = [ESCENARIOS[n][0] for n in nombres]
+    latencias = defaultdict(list)
+    errores = defaultdict(int)
+    lock = threading.Lock()
+    inicio_medicion = time.perf_counter() + calentamiento
+    fin = inicio_medicion + duracion
+
+    def trabajador(indice):
+        rng = random.Random(semilla * 1000 + indice)
+        with httpx.Client(base_url=url, headers={"Authorization": f"Bearer {token}"}, timeout=120) as cliente:
+            while True:
+                ahora = time.perf_counter()
+                if ahora >= fin:
+                    return
+                nombre = rng.choices(nombres, weights=pesos)[0]
+                t0 = time.perf_counter()
+                try:
+                    ok = ESCENARIOS[nombre][1](cliente, rng).status_code < 400
+                except httpx.HTTPError:
+                    ok = False
+                t1 = time.perf_counter()
+                if t0 < inicio_medicion:
+                    continue
+                with lock:
+                    latencias[nombre].append(t1 - t0)
+                    if not ok:
+                        errores[nombre] += 1
+
+    hilos = [threading.Thread(target=trabajador, args=(i,)) for i in range(concurrencia)]
+    for h in hilos:
+        h.start()
+    for h in hilos:
+        h.join()
+
+    resultados = {}
+    for nombre in nombres + ["TOTAL"]:
+        valores = sorted(v for n in nombres for v in latencias[n]) if nombre == "TOTAL" else sorted(latencias[nombre])
+        n_errores = sum(errores.values()) if nombre == "TOTAL" else errores[nombre]
+        resultados[nombre] = {
+            "requests": len(valores),
+            "errores": n_errores,
+            "rps": round(len(valores) / duracion, 2),
+            "p50_ms": round(_percentil(valores, 50) * 1000, 1),
+            "p95_ms": round(_percentil(valores, 95) * 1000, 1),
+            "p99_ms": round(_percentil(valores, 99) * 1000, 1),
+            "max_ms": round(valores[-1] * 1000, 1) if valores else 0.0,
+        }
+    return resultados
+
+
+def imprimir_tabla(resultados: dict):
+    print(f"{'escenario':<22}{'req':>8}{'err':>6}{'req/s':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+    for nombre, r in resultados.items():
+        print(f"{nombre:<22}{r['requests']:>8}{r['errores']:>6}{r['rps']:>9}"
+              f"{r['p50_ms']:>10}{r['p95_ms']:>10}{r['p99_ms']:>10}{r['max_ms']:>10}")
+
+
+def main():
+    args = _parsear_argumentos()
+    escenarios = [e.strip() for e in args.escenarios.split(",") if e.strip()]
+    desconocidos = [e for e in escenarios if e not in ESCENARIOS]
+    if desconocidos:
+        raise SystemExit(f"Escenarios desconocidos: {', '.join(desconocidos)} (disponibles: {', '.join(ESCENARIOS)})")
+
+    token = _login(args.url, args.usuario, args.clave)
+    print(f"Carga contra {args.url}: {args.concurrencia} hilos, {args.duracion:.0f} s "
+          f"(+{args.calentamiento:.0f} s de calentamiento)")
+    resultados = ejecutar(args.url, token, escenarios, args.duracion, args.calentamiento,
+                          args.concurrencia, args.semilla)
+    imprimir_tabla(resultados)
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"parametros": vars(args), "resultados": resultados}, f, indent=2, ensure_ascii=False)
+        print(f"Resultados guardados en {args.json}")
+
+
+if __name__ == "__main__":
+    main()
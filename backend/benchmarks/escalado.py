@@ -0,0 +1,124 @@
+"""
+Benchmark de escalado por workers.
+Levanta uvicorn con 1, 2, 4, ... workers sobre una copia de la base sintética, ejecuta la
+misma carga (benchmarks.carga) contra cada configuración y reporta throughput y latencias.
+Los escenarios por defecto son los de CPU (exportación a Excel, subida de PDF, búsquedas),
+que con un solo proceso compiten por el mismo GIL.
+
+Uso (desde backend/, en una máquina con varios núcleos):
+    python -m benchmarks.escalado --db /tmp/bench.db --uploads /tmp/bench_up
+    python -m benchmarks.escalado --db /tmp/bench.db --workers 1,2,4,8 --duracion 30 --concurrencia 32
+"""
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+from benchmarks.carga import _login, ejecutar
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ESCENARIOS_CPU = ["exportar_excel", "subida", "documentos_busqueda", "seguimiento"]
+
+
+def _parsear_argumentos():
+    parser = argparse.ArgumentParser(description="Throughput del backend con 1..N workers")
+    parser.add_argument("--db", required=True, help="Base sintética (se copia para cada corrida)")
+    parser.add_argument("--uploads", help="Carpeta de uploads de la base sintética")
+    parser.add_argument("--workers", default=None, help="Lista separada por comas (por defecto 1,2,4..núcleos)")
+    parser.add_argument("--escenarios", default=",".join(ESCENARIOS_CPU))
+    parser.add_argument("--duracion", type=float, default=20)
+    parser.add_argument("--calentamiento", type=float, default=3)
+    parser.add_argument("--concurrencia", type=int, default=16)
+    parser.add_argument("--puerto", type=int, default=8798)
+    parser.add_argument("--usuario", default="adminnemaec")
+    parser.add_argument("--clave", default="AdminNemaec123*")
+    parser.add_argument("--json", help="Guardar resultados en este archivo")
+    return parser.parse_args()
+
+
+def _workers_por_defecto() -> list:
+    nucleos = os.cpu_count() or 1
+    workers, n = [], 1
+    while n < nucleos:
+        workers.append(n)
+        n *= 2
+    return workers + [nucleos]
+
+
+def _levantar(workers: int, carpeta: str, args) -> subprocess.Popen:
+    env = dict(os.environ)
+    env["DATABASE_PATH"] = os.path.join(carpeta, "escalado.db")
+    env["UPLOAD_DIR"] = args.uploads or os.path.join(carpeta, "uploads")
+    env["STATE_DIR"] = os.path.join(carpeta, "estado")
+    env["WEB_CONCURRENCY"] = str(workers)
+    # La carga hace un login por corrida; los límites de login no deben interferir
+    env.setdefault("LOGIN_RAFAGA_IP", "1000")
+    os.makedirs(env["UPLOAD_DIR"], exist_ok=True)
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(args.puerto),
+         "--workers", str(workers), "--log-level", "warning"],
+        cwd=BACKEND_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+
+
+def _esperar_salud(url: str, proceso: subprocess.Popen, timeout: float = 120):
+    limite = time.perf_counter() + timeout
+    while time.perf_counter() < limite:
+        if proceso.poll() is not None:
+            raise SystemExit("uvicorn terminó antes de responder")
+        try:
+            if httpx.get(f"{url}/api/health", timeout=1).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.1)
+    raise SystemExit(f"/api/health no respondió en {timeout:.0f} s")
+
+
+def main():
+    args = _parsear_argumentos()
+    lista_workers = [int(w) for w in args.workers.split(",")] if args.workers else _workers_por_defecto()
+    escenarios = [e.strip() for e in args.escenarios.split(",") if e.strip()]
+    url = f"http://127.0.0.1:{args.puerto}"
+    print(f"Núcleos: {os.cpu_count()}. Workers a probar: {lista_workers}. "
+          f"Carga: {args.concurrencia} hilos, {args.duracion:.0f} s, escenarios {', '.join(escenarios)}")
+
+    resultados = {}
+    for workers in lista_workers:
+        carpeta = tempfile.mkdtemp(prefix="bench_escalado_")
+        shutil.copy(args.db, os.path.join(carpeta, "escalado.db"))
+        proceso = _levantar(workers, carpeta, args)
+        try:
+            _esperar_salud(url, proceso)
+            token = _login(url, args.usuario, args.clave)
+            total = ejecutar(url, token, escenarios, args.duracion, args.calentamiento,
+                             args.concurrencia, semilla=1)["TOTAL"]
+        finally:
+            proceso.terminate()
+            proceso.wait(timeout=30)
+            shutil.rmtree(carpeta, ignore_errors=True)
+        resultados[workers] = total
+        print(f"  {workers} worker(s): {total['rps']} req/s, p50 {total['p50_ms']} ms, "
+              f"p99 {total['p99_ms']} ms, errores {total['errores']}")
+
+    base = resultados[lista_workers[0]]["rps"] or 1
+    print(f"\n{'workers':>8}{'req/s':>10}{'escala':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'err':>6}")
+    for workers, r in resultados.items():
+        print(f"{workers:>8}{r['rps']:>10}{r['rps'] / base:>9.2f}{r['p50_ms']:>10}{r['p95_ms']:>10}"
+              f"{r['p99_ms']:>10}{r['errores']:>6}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"parametros": vars(args), "nucleos": os.cpu_count(), "resultados": resultados},
+                      f, indent=2, ensure_ascii=False)
+        print(f"Resultados guardados en {args.json}")
+
+
+if __name__ == "__main__":
+    main()
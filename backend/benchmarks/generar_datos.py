@@ -0,0 +1,240 @@
+"""
+Generador de datos sintéticos con volúmenes realistas para benchmarks.
+Llena una base SQLite NUEVA (nunca la de producción) con documentos encadenados
+(oficio -> respuestas), contratos con comisarías y expediente, filas de seguimiento
+con detalles y un lote de PDFs de prueba en la carpeta de uploads.
+
+Uso (desde backend/):
+    python -m benchmarks.generar_datos --db /tmp/bench.db --uploads /tmp/bench_uploads
+    python -m benchmarks.generar_datos --db /tmp/bench.db --uploads /tmp/bench_uploads --documentos 20000
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+TAMANO_LOTE = 5000
+
+REMITENTES = [
+    "MIDIS/FONCODES/UGPE", "MININTER - DIRECCION DE INFRAESTRUCTURA", "POLICIA NACIONAL DEL PERU",
+    "CONSORCIO LIMA NORTE", "CONSORCIO SAN JUAN", "CONSTRUCTORA ANDINA S.A.C.", "NEMAEC",
+    "OFICINA GENERAL DE ADMINISTRACION", "SUPERVISION DE OBRA", "PROCURADURIA PUBLICA",
+]
+TEMAS = [
+    "conformidad de obra", "ampliacion de plazo", "modificacion de partidas", "dossier de culminacion",
+    "liquidacion final", "valorizacion mensual", "observaciones al expediente", "entrega de equipamiento",
+    "adenda al contrato", "pago a cuenta", "informe tecnico", "acta de recepcion",
+]
+COMISARIAS = [
+    "SAN CAYETANO", "SAN COSME", "COLLIQUE", "TAHUANTINSUYO", "CHANCAY", "JICAMARCA", "CARABAYLLO",
+    "LA ENSENADA", "MARISCAL CACERES", "SANTA CLARA", "SANTA ANITA", "ALFONSO UGARTE", "SAN GENARO",
+    "JOSE GALVEZ", "VILLA EL SALVADOR", "PAMPLONA ALTA", "CIUDAD Y CAMPO", "ZARATE", "APOLO", "COTABAMBAS",
+]
+TIPOS_EXPEDIENTE = ["Carta Recibida", "Carta Enviada", "Informe Técnico", "Acta", "Oficio", "Otro"]
+VALORES_SIONO = ["SI", "SI", "NO", "NO", "NO", "NA", "-"]
+
+
+def _parsear_argumentos():
+    parser = argparse.ArgumentParser(description="Genera una base de datos sintética para benchmarks")
+    parser.add_argument("--db", required=True, help="Ruta de la base SQLite a crear (no debe existir)")
+    parser.add_argument("--uploads", required=True, help="Carpeta donde escribir los PDFs de prueba")
+    parser.add_argument("--documentos", type=int, default=100_000)
+    parser.add_argument("--contratos", type=int, default=3_000)
+    parser.add_argument("--seguimiento", type=int, default=500, help="Filas de seguimiento por comisaría")
+    parser.add_argument("--pdfs", type=int, default=300, help="PDFs de prueba compartidos por los registros")
+    parser.add_argument("--semilla", type=int, default=2026)
+    parser.add_argument("--sobrescribir", action="store_true", help="Borra la base si ya existe")
+    return parser.parse_args()
+
+
+def _insertar_lotes(db, modelo, filas):
+    from sqlalchemy import insert
+    for i in range(0, len(filas), TAMANO_LOTE):
+        db.execute(insert(modelo), filas[i:i + TAMANO_LOTE])
+    db.commit()
+
+
+def generar_pdfs(rng: random.Random, carpeta: str, cantidad: int) -> list:
+    """Escribe `cantidad` PDFs de 1 a 12 páginas y retorna sus nombres."""
+    from benchmarks.pdf_sintetico import pdf_oficio
+
+    os.makedirs(carpeta, exist_ok=True)
+    nombres = []
+    for i in range(cantidad):
+        numero = f"OFICIO N°{i + 1:06d}-2026-MIDIS/FONCODES/UGPE"
+        contenido = pdf_oficio(numero, f"Remite {rng.choice(TEMAS)}", rng.choice(REMITENTES),
+                               paginas_extra=rng.choice([0, 0, 1, 2, 4, 11]))
+        nombre = f"bench_{i + 1:06d}.pdf"
+        with open(os.path.join(carpeta, nombre), "wb") as f:
+            f.write(contenido)
+        nombres.append(nombre)
+    return nombres
+
+
+def generar_documentos(db, rng: random.Random, cantidad: int, pdfs: list):
+    """
+    Documentos con cadenas padre -> respuesta: ~35% responde a un documento anterior,
+    lo que produce hilos de varias generaciones como en producción.
+    """
+    from models import Documento
+
+    inicio = datetime(2024, 1, 1)
+    filas = []
+    for i in range(1, cantidad + 1):
+        tipo = "oficio" if rng.random() < 0.7 else "carta"
+        direccion = "recibido" if rng.random() < 0.55 else "enviado"
+        fecha = inicio + timedelta(days=rng.randint(0, 900), minutes=rng.randint(0, 1440))
+        anio = fecha.year
+        tema = rng.choice(TEMAS)
+        comisaria = rng.choice(COMISARIAS)
+        padre = rng.randint(1, i - 1) if i > 1 and rng.random() < 0.35 else None
+        filas.append({
+            "id": i,
+            "tipo_documento": tipo,
+            "direccion": direccion,
+            "numero": f"{tipo.upper()} N°{i:06d}-{anio}-MIDIS/FONCODES/UGPE",
+            "fecha": fecha,
+            "remitente": rng.choice(REMITENTES),
+            "destinatario": rng.choice(REMITENTES),
+            "titulo": f"{tema.capitalize()} - Comisaría {comisaria}",
+            "asunto": f"Remite {tema} de la comisaría {comisaria}",
+            "resumen": f"Documento sintético {i} sobre {tema} en la comisaría {comisaria}.",
+            "anio_oficio": anio,
+            "correlativo_oficio": i,
+            "archivo_local": rng.choice(pdfs) if pdfs and rng.random() < 0.6 else None,
+            "documento_padre_id": padre,
+            "estado": rng.choice(["enviado", "recibido", "respondido", "pendiente"]),
+            "created_at": fecha,
+        })
+    _insertar_lotes(db, Documento, filas)
+
+
+def generar_contratos(db, rng: random.Random, cantidad: int, pdfs: list):
+    """Contratos con 1-5 comisarías y 0-8 documentos de expediente cada uno."""
+    from models import Contrato, ComisariaContrato, ExpedienteContrato
+
+    contratos, comisarias, expediente = [], [], []
+    for i in range(1, cantidad + 1):
+        fecha = datetime(2025, 1, 1) + timedelta(days=rng.randint(0, 500))
+        tipo = rng.choice(["equipamiento", "mantenimiento"])
+        cantidad_items = rng.randint(1, 200)
+        precio = round(rng.uniform(500, 50_000), 2)
+        contratos.append({
+            "id": i,
+            "numero": f"CONTRATO N°{i:04d}-2025-MIDIS/FONCODES",
+            "fecha": fecha,
+            "tipo_contrato": tipo,
+            "contratante": "MIDIS/FONCODES",
+            "tipo_contratado": rng.choice(["empresa", "consorcio"]),
+            "ruc_contratado": f"20{rng.randint(100_000_000, 999_999_999)}",
+            "contratado": rng.choice(REMITENTES[3:6]),
+            "item_contratado": f"{tipo.capitalize()} de comisarías - lote {i}",
+            "plazo_dias": rng.choice([30, 60, 90, 120, 180]),
+            "dias_adicionales": rng.choice([0, 0, 0, 15, 30]),
+            "cantidad": cantidad_items,
+            "precio_unitario": precio,
+            "monto_total": round(cantidad_items * precio, 2),
+            "asunto": f"Contrato de {tipo} lote {i}",
+            "archivo_local": rng.choice(pdfs) if pdfs else None,
+            "estado_ejecucion": rng.choice(["PENDIENTE", "EN PROCESO", "EN VALIDACIÓN", "CONFORME"]),
+            "created_at": fecha,
+        })
+        for nombre in rng.sample(COMISARIAS, rng.randint(1, 5)):
+            comisarias.append({
+                "contrato_id": i, "nombre_cpnp": nombre,
+                "monto": round(rng.uniform(10_000, 500_000), 2), "created_at": fecha,
+            })
+        for n in range(rng.randint(0, 8)):
+            expediente.append({
+                "contrato_id": i,
+                "tipo_doc": rng.choice(TIPOS_EXPEDIENTE),
+                "numero": f"EXP-{i:04d}-{n + 1:02d}",
+                "fecha": fecha + timedelta(days=7 * n),
+                "asunto": f"Remite {rng.choice(TEMAS)}",
+                "archivo_local": rng.choice(pdfs) if pdfs and rng.random() < 0.8 else None,
+                "created_at": fecha,
+            })
+    _insertar_lotes(db, Contrato, contratos)
+    _insertar_lotes(db, ComisariaContrato, comisarias)
+    _insertar_lotes(db, ExpedienteContrato, expediente)
+
+
+def generar_seguimiento(db, rng: random.Random, cantidad: int, pdfs: list):
+    """Filas de seguimiento con valores SI/NO/NA/- y 0-5 detalles por fila."""
+    from models import SeguimientoComisaria, SeguimientoCeldaDetalle
+    from services.seguimiento_service import CAMPOS_SIONO
+
+    campos = sorted(CAMPOS_SIONO)
+    filas, detalles = [], []
+    for i in range(1, cantidad + 1):
+        fila = {
+            "id": i,
+            "numero": i,
+            "comisaria": f"{rng.choice(COMISARIAS)} {i}",
+            "avance_programado": 1,
+            "avance_fisico": round(rng.uniform(0.5, 1), 4),
+            "fecha_fin_contractual": datetime(2026, 1, 1) + timedelta(days=rng.randint(0, 120)),
+            "dossier_monto_pagado": round(rng.uniform(100_000, 900_000), 2) if rng.random() < 0.2 else None,
+            "dossier_monto_merge": False,
+        }
+        for campo in campos:
+            fila[campo] = rng.choice(VALORES_SIONO)
+        filas.append(fila)
+        for _ in range(rng.randint(0, 5)):
+            detalles.append({
+                "comisaria_id": i,
+                "campo": rng.choice(campos),
+                "observacion": f"Observación sintética sobre {rng.choice(TEMAS)}",
+                "archivo_local": rng.choice(pdfs) if pdfs and rng.random() < 0.3 else None,
+                "usuario": rng.choice(["adminnemaec", "rpaiva", "eagreda"]),
+                "fecha_actualizacion": datetime(2026, 1, 1) + timedelta(hours=rng.randint(0, 2000)),
+            })
+    _insertar_lotes(db, SeguimientoComisaria, filas)
+    _insertar_lotes(db, SeguimientoCeldaDetalle, detalles)
+
+
+def main():
+    args = _parsear_argumentos()
+    if os.path.exists(args.db):
+        if not args.sobrescribir:
+            sys.exit(f"La base {args.db} ya existe (use --sobrescribir para reemplazarla)")
+        os.remove(args.db)
+
+    # database.py lee DATABASE_PATH al importarse
+    os.environ["DATABASE_PATH"] = os.path.abspath(args.db)
+    os.environ["UPLOAD_DIR"] = os.path.abspath(args.uploads)
+
+    from database import engine, SessionLocal, Base
+    from init_users import crear_usuarios_iniciales
+    from services.seguimiento_service import recalcular_agregados
+
+    Base.metadata.create_all(bind=engine)
+    crear_usuarios_iniciales()
+    rng = random.Random(args.semilla)
+
+    db = SessionLocal()
+    try:
+        t0 = time.perf_counter()
+        pdfs = generar_pdfs(rng, args.uploads, args.pdfs)
+        print(f"PDFs: {len(pdfs)} en {time.perf_counter() - t0:.1f} s")
+
+        for nombre, paso in [
+            ("documentos", lambda: generar_documentos(db, rng, args.documentos, pdfs)),
+            ("contratos", lambda: generar_contratos(db, rng, args.contratos, pdfs)),
+            ("seguimiento", lambda: generar_seguimiento(db, rng, args.seguimiento, pdfs)),
+            ("agregados", lambda: recalcular_agregados(db)),
+        ]:
+            t0 = time.perf_counter()
+            paso()
+            print(f"{nombre}: {time.perf_counter() - t0:.1f} s")
+    finally:
+        db.close()
+
+    print(f"Base sintética lista en {args.db}")
+    print(f"Para usarla: DATABASE_PATH={os.path.abspath(args.db)} UPLOAD_DIR={os.path.abspath(args.uploads)} uvicorn main:app")
+
+
+if __name__ == "__main__":
+    main()
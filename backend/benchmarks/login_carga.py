@@ -0,0 +1,122 @@
+"""
+Prueba de carga del login bajo un ataque de credential stuffing.
+1. Línea base: tráfico legítimo autenticado (listados y seguimiento) sin ataque.
+2. El mismo tráfico mientras otros hilos envían logins con contraseñas incorrectas.
+Se comparan p50/p95/p99 del tráfico legítimo y se reporta cómo respondió el
+servidor a los intentos del atacante (429 = frenado antes de bcrypt, 401 = verificado).
+
+Uso (desde backend/, con el servidor en ejecución):
+    python -m benchmarks.login_carga --url http://localhost:8000 --duracion 20 --atacantes 32
+    python -m benchmarks.login_carga --ips-falsas   # comprueba que el servidor ignore los X-Forwarded-For falsos
+"""
+import argparse
+import json
+import random
+import threading
+import time
+from collections import Counter
+
+import httpx
+
+from benchmarks.carga import _login, _percentil, ejecutar, imprimir_tabla
+
+ESCENARIOS_LEGITIMOS = ["documentos_lista", "documentos_filtro", "contratos", "seguimiento"]
+USUARIOS_ATAQUE = ["adminnemaec", "admin", "administrador", "rpaiva", "soporte", "usuario"]
+
+
+def _parsear_argumentos():
+    parser = argparse.ArgumentParser(description="Tráfico legítimo durante una ráfaga de logins fallidos")
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--usuario", default="adminnemaec")
+    parser.add_argument("--clave", default="AdminNemaec123*")
+    parser.add_argument("--duracion", type=float, default=20, help="Segundos de medición por fase")
+    parser.add_argument("--calentamiento", type=float, default=2)
+    parser.add_argument("--concurrencia", type=int, default=4, help="Hilos de tráfico legítimo")
+    parser.add_argument("--atacantes", type=int, default=32, help="Hilos enviando logins fallidos")
+    parser.add_argument("--ips-falsas", action="store_true",
+                        help="Enviar X-Forwarded-For aleatorio en cada intento (simula una botnet)")
+    parser.add_argument("--semilla", type=int, default=1)
+    parser.add_argument("--json", help="Guardar resultados en este archivo")
+    return parser.parse_args()
+
+
+def atacar(url: str, hilos: int, hasta: float, ips_falsas: bool, semilla: int) -> tuple:
+    """Envía logins con contraseñas incorrectas hasta `hasta`. Retorna (Counter de status, latencias)."""
+    estados = Counter()
+    latencias = []
+    lock = threading.Lock()
+
+    def atacante(indice):
+        rng = random.Random(semilla * 7919 + indice)
+        with httpx.Client(base_url=url, timeout=60) as cliente:
+            while time.perf_counter() < hasta:
+                headers = {}
+                if ips_falsas:
+                    headers["X-Forwarded-For"] = f"10.{rng.randint(0, 255)}.{rng.randint(0, 255)}.{rng.randint(1, 254)}"
+                datos = {"username": rng.choice(USUARIOS_ATAQUE), "password": f"clave{rng.randint(0, 10**6)}"}
+                t0 = time.perf_counter()
+                try:
+                    estado = cliente.post("/api/login", json=datos, headers=headers).status_code
+                except httpx.HTTPError:
+                    estado = "error"
+                t1 = time.perf_counter()
+                with lock:
+                    estados[estado] += 1
+                    latencias.append(t1 - t0)
+
+    hilos_ataque = [threading.Thread(target=atacante, args=(i,), daemon=True) for i in range(hilos)]
+    for h in hilos_ataque:
+        h.start()
+    for h in hilos_ataque:
+        h.join()
+    return estados, sorted(latencias)
+
+
+def main():
+    args = _parsear_argumentos()
+    token = _login(args.url, args.usuario, args.clave)
+
+    print(f"Línea base: {args.concurrencia} hilos legítimos, {args.duracion:.0f} s")
+    base = ejecutar(args.url, token, ESCENARIOS_LEGITIMOS, args.duracion, args.calentamiento,
+                    args.concurrencia, args.semilla)
+    imprimir_tabla(base)
+
+    print(f"\nCon ataque: {args.atacantes} hilos de login fallido"
+          f"{' con IPs falsas' if args.ips_falsas else ''}")
+    hasta = time.perf_counter() + args.calentamiento + args.duracion
+    resultado_ataque = []
+
+    def lanzar_ataque():
+        resultado_ataque.extend(atacar(args.url, args.atacantes, hasta, args.ips_falsas, args.semilla))
+
+    hilo_ataque = threading.Thread(target=lanzar_ataque)
+    hilo_ataque.start()
+    bajo_ataque = ejecutar(args.url, token, ESCENARIOS_LEGITIMOS, args.duracion, args.calentamiento,
+                           args.concurrencia, args.semilla)
+    hilo_ataque.join()
+    imprimir_tabla(bajo_ataque)
+
+    estados, latencias = resultado_ataque
+    total = sum(estados.values()) or 1
+    print(f"\nIntentos del atacante: {total} ({total / (args.calentamiento + args.duracion):.0f}/s), "
+          f"p50 {_percentil(latencias, 50) * 1000:.1f} ms, p99 {_percentil(latencias, 99) * 1000:.1f} ms")
+    for estado, cantidad in estados.most_common():
+        print(f"  {estado}: {cantidad} ({cantidad / total * 100:.1f}%)")
+
+    p99_base, p99_ataque = base["TOTAL"]["p99_ms"], bajo_ataque["TOTAL"]["p99_ms"]
+    if p99_base:
+        print(f"\np99 legítimo: {p99_base} ms sin ataque, {p99_ataque} ms con ataque (x{p99_ataque / p99_base:.1f})")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({
+                "parametros": vars(args),
+                "base": base,
+                "bajo_ataque": bajo_ataque,
+                "ataque": {str(k): v for k, v in estados.items()},
+            }, f, indent=2, ensure_ascii=False)
+        print(f"Resultados guardados en {args.json}")
+
+
+if __name__ == "__main__":
+    main()
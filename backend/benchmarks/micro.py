@@ -0,0 +1,304 @@
+"""
+Micro-benchmarks de las rutas pesadas de procesamiento de documentos.
+Mide el costo por llamada de cada función sobre un corpus fijo (PDFs con texto,
+PDF escaneado, plantilla y membrete DOCX, imagen de firma) generado de forma
+determinista, y guarda/compara una línea base en JSON para detectar regresiones.
+
+Uso (desde backend/):
+    python -m benchmarks.micro                                  # solo medir
+    python -m benchmarks.micro --guardar benchmarks/linea_base.json
+    python -m benchmarks.micro --comparar benchmarks/linea_base.json --tolerancia 0.15
+    python -m benchmarks.micro --filtro docx --rondas 20
+
+Los casos cuyo binario externo no está instalado (tesseract/poppler, soffice) se omiten.
+"""
+import argparse
+import importlib
+import json
+import os
+import platform
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+TEXTO_CARTA = """NOMBRE DEL ARCHIVO: Carta N° 000145-2026-NEMAEC.pdf
+NUCLEO EJECUTOR DE ADQUISICIONES DE EQUIPAMIENTO PARA COMISARIAS
+Carta N° 000145-2026-NEMAEC/PRESIDENCIA
+Lima, 12 de marzo de 2026
+Señor:
+JUAN PEREZ
+Jefe de la Unidad de Gestión de Proyectos Especiales
+Asunto: Remite informe de conformidad de la comisaría SAN COSME
+Referencia: a) OFICIO N° 000336-2025-MIDIS/FONCODES/UGPE
+            b) Contrato N° 0012-2025
+Tengo el agrado de dirigirme a usted, en atención al documento de la referencia,
+para remitir el informe de conformidad correspondiente.
+""" * 3
+
+
+def _parsear_argumentos():
+    parser = argparse.ArgumentParser(description="Micro-benchmarks de procesamiento de documentos")
+    parser.add_argument("--rondas", type=int, default=10, help="Mediciones por caso (los casos lentos usan menos)")
+    parser.add_argument("--calentamiento", type=int, default=2)
+    parser.add_argument("--filtro", help="Solo casos cuyo nombre contenga este texto")
+    parser.add_argument("--corpus", help="Carpeta donde generar el corpus (por defecto una temporal)")
+    parser.add_argument("--guardar", help="Guardar resultados como línea base en este JSON")
+    parser.add_argument("--comparar", help="Comparar contra una línea base JSON")
+    parser.add_argument("--tolerancia", type=float, default=0.15,
+                        help="Aumento relativo de la mediana considerado regresión (0.15 = 15%%)")
+    return parser.parse_args()
+
+
+# ============================================
+# CORPUS
+# ============================================
+
+def generar_corpus(carpeta: str) -> dict:
+    """Genera el corpus fijo y retorna las rutas por nombre."""
+    from benchmarks.pdf_sintetico import pdf_oficio
+    from PIL import Image, ImageDraw
+    from docx import Document
+
+    os.makedirs(carpeta, exist_ok=True)
+    rutas = {}
+
+    def escribir(nombre, contenido):
+        rutas[nombre] = os.path.join(carpeta, nombre)
+        with open(rutas[nombre], "wb") as f:
+            f.write(contenido)
+
+    numero = "OFICIO N°000336-2025-MIDIS/FONCODES/UGPE"
+    escribir("oficio_1p.pdf", pdf_oficio(numero, "Remite conformidad de obra", "NEMAEC"))
+    escribir("oficio_12p.pdf", pdf_oficio(numero, "Remite dossier de culminacion", "NEMAEC", paginas_extra=11))
+
+    # PDF escaneado: solo imagen, sin capa de texto (fuerza OCR)
+    pagina = Image.new("L", (1240, 1754), 255)
+    dibujo = ImageDraw.Draw(pagina)
+    for i, linea in enumerate(TEXTO_CARTA.splitlines()[:14]):
+        dibujo.text((100, 120 + i * 40), linea.encode("ascii", "replace").decode(), fill=0)
+    rutas["escaneado.pdf"] = os.path.join(carpeta, "escaneado.pdf")
+    pagina.save(rutas["escaneado.pdf"], "PDF", resolution=150)
+    # Escaneado de 8 páginas (OCR de todas las páginas en el pool de procesos)
+    rutas["escaneado_8p.pdf"] = os.path.join(carpeta, "escaneado_8p.pdf")
+    pagina.save(rutas["escaneado_8p.pdf"], "PDF", resolution=150, save_all=True, append_images=[pagina] * 7)
+
+    # Firma: trazos oscuros sobre fondo blanco con márgenes (se recorta al exportar)
+    firma = Image.new("RGB", (900, 400), "white")
+    dibujo = ImageDraw.Draw(firma)
+    for k in range(0, 500, 4):
+        dibujo.line([(200 + k, 200 + (k % 60) - 30), (204 + k, 200 - (k % 40) + 20)], fill=(20, 20, 60), width=5)
+    rutas["firma.png"] = os.path.join(carpeta, "firma.png")
+    firma.save(rutas["firma.png"])
+
+    membrete = Document()
+    membrete.sections[0].header.paragraphs[0].text = "NUCLEO EJECUTOR NEMAEC - Membrete institucional"
+    rutas["membrete.docx"] = os.path.join(carpeta, "membrete.docx")
+    membrete.save(rutas["membrete.docx"])
+
+    plantilla = Document()
+    for linea in TEXTO_CARTA.splitlines():
+        plantilla.add_paragraph(linea)
+    rutas["plantilla.docx"] = os.path.join(carpeta, "plantilla.docx")
+    plantilla.save(rutas["plantilla.docx"])
+    return rutas
+
+
+def _preparar_configuracion(db, upload_dir: str, rutas: dict):
+    """Copia membrete y firma a uploads y los registra en la configuración del sistema."""
+    from services.config_service import configuracion
+
+    valores = {
+        "membrete_archivo": "bench_membrete.docx",
+        "firma_imagen": "bench_firma.png",
+        "firma_nombre": "ING. JUAN PEREZ",
+        "firma_cargo": "Presidente NEMAEC",
+    }
+    shutil.copy(rutas["membrete.docx"], os.path.join(upload_dir, valores["membrete_archivo"]))
+    shutil.copy(rutas["firma.png"], os.path.join(upload_dir, valores["firma_imagen"]))
+    configuracion.guardar(db, **valores)
+
+
+# ============================================
+# MEDICIÓN
+# ============================================
+
+def medir(funcion, rondas: int, calentamiento: int) -> dict:
+    for _ in range(calentamiento):
+        funcion()
+    tiempos = []
+    for _ in range(rondas):
+        t0 = time.perf_counter()
+        funcion()
+        tiempos.append(time.perf_counter() - t0)
+    return {
+        "rondas": rondas,
+        "min_ms": round(min(tiempos) * 1000, 3),
+        "mediana_ms": round(statistics.median(tiempos) * 1000, 3),
+        "media_ms": round(statistics.fmean(tiempos) * 1000, 3),
+        "desv_ms": round(statistics.stdev(tiempos) * 1000, 3) if len(tiempos) > 1 else 0.0,
+    }
+
+
+def definir_casos(main, ia, db, rutas: dict, carpeta: str) -> list:
+    """
+    Lista de casos: (nombre, función sin argumentos, factor de rondas, motivo de omisión o None).
+    El factor reduce las rondas de los casos que tardan segundos.
+    """
+    from schemas import ExportarCartaRequest
+    from services.auth_service import create_token, decodificar_token
+
+    texto_1p = main.extraer_texto_pdf(rutas["oficio_1p.pdf"])
+    carta = ExportarCartaRequest(
+        numero_carta="Carta N° 000145-2026-NEMAEC/PRESIDENCIA",
+        fecha_texto="Lima, 12 de marzo de 2026",
+        destinatario_nombre="JUAN PEREZ",
+        destinatario_cargo="Jefe de la UGPE",
+        destinatario_institucion="MIDIS/FONCODES",
+        asunto="Remite informe de conformidad",
+        referencias="a) OFICIO N° 000336-2025-MIDIS/FONCODES/UGPE\nb) Contrato N° 0012-2025",
+        cuerpo="\n\n".join(["Tengo el agrado de dirigirme a usted para remitir la documentación."] * 6),
+        cierre="Atentamente,",
+    )
+    ruta_docx = os.path.join(carpeta, "carta.docx")
+    with open(ruta_docx, "wb") as f:
+        f.write(main._construir_docx_buffer(carta, db).getvalue())
+
+    def docx_a_pdf():
+        ruta_pdf = os.path.join(carpeta, "carta.pdf")
+        if os.path.exists(ruta_pdf):
+            os.remove(ruta_pdf)
+        if not main._docx_a_pdf(ruta_docx, ruta_pdf):
+            raise RuntimeError("La conversión DOCX -> PDF falló")
+
+    def exportar_excel():
+        respuesta = main.exportar_seguimiento_excel(db)
+        # Consumir el cuerpo (algunas versiones retornan un iterador)
+        cuerpo = getattr(respuesta, "body_iterator", None)
+        if cuerpo is not None and hasattr(cuerpo, "__iter__"):
+            for _ in cuerpo:
+                pass
+
+    # Autenticación: costo de 1000 validaciones del mismo token, sin caché (jwt.decode con
+    # verificación HS256 en cada llamada, como antes) y por la dependency con caché
+    header = f"Bearer {create_token('adminnemaec', 'Administrador')}"
+
+    def auth_sin_cache():
+        for _ in range(1000):
+            scheme, t = header.split()
+            decodificar_token(t)
+
+    def auth_con_cache():
+        for _ in range(1000):
+            main.verificar_admin(header)
+
+    # Configuración: 1000 lecturas de la numeración de cartas (caché en memoria)
+    from services.config_service import configuracion
+
+    def configuracion_x1000():
+        for _ in range(1000):
+            configuracion.obtener(db).numero_carta(145, 2026)
+
+    sin_ocr = None
+    if not ia.ocr_disponible():
+        sin_ocr = "pytesseract/pdf2image no instalados"
+    elif not shutil.which("tesseract") or not shutil.which("pdftoppm"):
+        sin_ocr = "binarios tesseract/pdftoppm no encontrados"
+
+    return [
+        ("extraer_texto_pdf[1 pág]", lambda: main.extraer_texto_pdf(rutas["oficio_1p.pdf"]), 1, None),
+        ("extraer_texto_pdf[12 pág]", lambda: main.extraer_texto_pdf(rutas["oficio_12p.pdf"]), 1, None),
+        ("extraer_texto_ocr[escaneado]", lambda: ia.extraer_texto_ocr(rutas["escaneado.pdf"]), 0.3, sin_ocr),
+        ("extraer_texto_ocr[8 pág]",
+         lambda: ia.extraer_texto_ocr(rutas["escaneado_8p.pdf"], solo_primera_pagina=False), 0.1, sin_ocr),
+        ("extraer_numero_oficio[carta]", lambda: ia.extraer_numero_oficio(TEXTO_CARTA), 10, None),
+        ("extraer_numero_oficio[oficio]", lambda: ia.extraer_numero_oficio(texto_1p), 10, None),
+        ("extraer_oficio_referencia", lambda: ia.extraer_oficio_referencia(TEXTO_CARTA), 10, None),
+        ("_leer_plantilla_docx", lambda: main._leer_plantilla_docx(rutas["plantilla.docx"]), 1, None),
+        ("_construir_docx_buffer", lambda: main._construir_docx_buffer(carta, db), 1, None),
+        ("_docx_a_pdf", docx_a_pdf, 0.3, None if shutil.which("soffice") else "soffice no encontrado"),
+        ("exportar_seguimiento_excel", exportar_excel, 1, None),
+        ("auth[sin caché] x1000", auth_sin_cache, 1, None),
+        ("auth[verificar_admin] x1000", auth_con_cache, 1, None),
+        ("configuracion x1000", configuracion_x1000, 1, None),
+    ]
+
+
+def comparar(resultados: dict, linea_base: dict, tolerancia: float) -> list:
+    """Imprime la comparación de medianas y retorna los casos con regresión."""
+    regresiones = []
+    print(f"\n{'caso':<32}{'base ms':>12}{'actual ms':>12}{'cambio':>10}")
+    for nombre, actual in resultados.items():
+        base = linea_base.get("casos", {}).get(nombre)
+        if "mediana_ms" not in actual or not base or "mediana_ms" not in base:
+            continue
+        cambio = actual["mediana_ms"] / base["mediana_ms"] - 1 if base["mediana_ms"] else 0.0
+        marca = "  REGRESIÓN" if cambio > tolerancia else ""
+        print(f"{nombre:<32}{base['mediana_ms']:>12}{actual['mediana_ms']:>12}{cambio:>+10.1%}{marca}")
+        if cambio > tolerancia:
+            regresiones.append(nombre)
+    return regresiones
+
+
+def main():
+    args = _parsear_argumentos()
+    carpeta = args.corpus or tempfile.mkdtemp(prefix="bench_micro_")
+    upload_dir = os.path.join(carpeta, "uploads")
+    os.makedirs(upload_dir, exist_ok=True)
+
+    # main.py lee DATABASE_PATH / UPLOAD_DIR al importarse: usar una base desechable
+    os.environ["DATABASE_PATH"] = os.path.join(carpeta, "bench_micro.db")
+    os.environ["UPLOAD_DIR"] = upload_dir
+
+    rutas = generar_corpus(carpeta)
+    import main as app_main
+    from database import SessionLocal
+    # services/__init__ exporta la instancia ia_service, que oculta al módulo del mismo nombre
+    ia_service = importlib.import_module("services.ia_service")
+
+    app_main.inicializar_base_datos()
+    db = SessionLocal()
+    try:
+        _preparar_configuracion(db, upload_dir, rutas)
+        resultados = {}
+        print(f"\n{'caso':<32}{'rondas':>8}{'min ms':>12}{'mediana ms':>12}{'desv ms':>10}")
+        for nombre, funcion, factor, omitir in definir_casos(app_main, ia_service, db, rutas, carpeta):
+            if args.filtro and args.filtro not in nombre:
+                continue
+            if omitir:
+                resultados[nombre] = {"omitido": omitir}
+                print(f"{nombre:<32}  omitido: {omitir}")
+                continue
+            rondas = max(3, int(args.rondas * factor))
+            r = medir(funcion, rondas, args.calentamiento)
+            resultados[nombre] = r
+            print(f"{nombre:<32}{r['rondas']:>8}{r['min_ms']:>12}{r['mediana_ms']:>12}{r['desv_ms']:>10}")
+    finally:
+        db.close()
+
+    if args.guardar:
+        datos = {
+            "fecha": datetime.now().isoformat(timespec="seconds"),
+            "python": sys.version.split()[0],
+            "plataforma": platform.platform(),
+            "procesador": platform.processor() or platform.machine(),
+            "casos": resultados,
+        }
+        with open(args.guardar, "w", encoding="utf-8") as f:
+            json.dump(datos, f, indent=2, ensure_ascii=False)
+        print(f"\nLínea base guardada en {args.guardar}")
+
+    if args.comparar:
+        with open(args.comparar, encoding="utf-8") as f:
+            linea_base = json.load(f)
+        regresiones = comparar(resultados, linea_base, args.tolerancia)
+        if regresiones:
+            print(f"\n{len(regresiones)} caso(s) con regresión mayor a {args.tolerancia:.0%}: {', '.join(regresiones)}")
+            sys.exit(1)
+        print("\nSin regresiones.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,222 @@
+"""
+Latencia y tasa de acierto del OCR del número de oficio: el método anterior (página
+completa a 300 DPI con lang='eng') contra el escalonado de ia_service (franja del
+encabezado a baja resolución, escalando a más DPI y a la página completa solo si los
+patrones no coinciden).
+Genera un corpus determinista de oficios y cartas escaneados (número en el encabezado,
+encabezado largo que empuja el número a la mitad de la página, letra chica, escaneo con
+ruido y una página sin número) o usa una carpeta existente; en ese caso no hay número
+esperado y se reporta cuántos encuentra cada método y si coinciden.
+
+Necesita tesseract (con los datos 'spa') y pdftoppm, como en el Dockerfile.
+
+Uso (desde backend/):
+    python -m benchmarks.ocr_numero
+    python -m benchmarks.ocr_numero --corpus /data/uploads --limite 50 --detalle
+    python -m benchmarks.ocr_numero --json resultados.json
+"""
+import argparse
+import glob
+import importlib
+import json
+import os
+import random
+import shutil
+import statistics
+import tempfile
+import time
+
+
+def _parsear_argumentos():
+    parser = argparse.ArgumentParser(description="OCR del número: método anterior vs. escalonado")
+    parser.add_argument("--corpus", help="Carpeta con PDFs (por defecto se genera un corpus sintético)")
+    parser.add_argument("--limite", type=int, default=50, help="Máximo de PDFs del corpus")
+    parser.add_argument("--repeticiones", type=int, default=1)
+    parser.add_argument("--semilla", type=int, default=1)
+    parser.add_argument("--detalle", action="store_true", help="Mostrar el resultado de cada documento")
+    parser.add_argument("--json", help="Guardar resultados en este archivo")
+    return parser.parse_args()
+
+
+ENCABEZADO = ["MINISTERIO DE DESARROLLO E INCLUSIÓN SOCIAL", "FONDO DE COOPERACIÓN PARA EL DESARROLLO SOCIAL",
+              "\"Año de la recuperación y consolidación de la economía peruana\""]
+CUERPO = [
+    "Tengo el agrado de dirigirme a usted para saludarlo cordialmente y, a la vez,",
+    "remitir la documentación correspondiente al expediente de la referencia, para",
+    "su revisión y trámite conforme a los términos de referencia del contrato.",
+]
+
+
+def _linea_numero(rng: random.Random, tipo: str) -> str:
+    """Línea con el número de un oficio o de una carta NEMAEC."""
+    anio = rng.choice([2025, 2026])
+    if tipo == "carta":
+        linea = f"Carta N° {rng.randint(1, 999):06d}-{anio}-NEMAEC/PRESIDENCIA"
+    else:
+        linea = f"OFICIO N° {rng.randint(1, 99999):06d}-{anio}-MIDIS/FONCODES/UGPE"
+    return linea
+
+
+def _pagina(rng: random.Random, linea_numero: str, dpi: int, escala_letra: float,
+            lineas_antes: int, ruido: float):
+    """Página A4 escaneada: encabezado, fecha, número, destinatario, referencia y cuerpo."""
+    from PIL import Image, ImageDraw, ImageFont, ImageFilter
+
+    ancho, alto = int(8.27 * dpi), int(11.69 * dpi)
+    pagina = Image.new("L", (ancho, alto), 240)
+    dibujo = ImageDraw.Draw(pagina)
+    letra = ImageFont.load_default(size=max(8, int(dpi / 300 * 38 * escala_letra)))
+    interlinea = int(letra.size * 1.6)
+    x, y = int(ancho * 0.1), int(alto * 0.05)
+
+    def escribir(texto: str, saltos: int = 1):
+        nonlocal y
+        dibujo.text((x, y), texto, fill=20, font=letra)
+        y += interlinea * saltos
+
+    for linea in ENCABEZADO:
+        escribir(linea)
+    for _ in range(lineas_antes):
+        escribir("Unidad Gerencial de Proyectos Especiales - Coordinación Técnica Zonal")
+    escribir(f"Lima, {rng.randint(1, 28)} de enero de 2026", 2)
+    if linea_numero:
+        escribir(linea_numero, 2)
+    escribir("Señor")
+    escribir("Presidente del Núcleo Ejecutor", 2)
+    escribir(f"Referencia: OFICIO N° {rng.randint(1, 99999):06d}-2025-MIDIS/FONCODES/UGPE", 2)
+    for linea in CUERPO * 4:
+        escribir(linea)
+    if ruido:
+        grano = Image.effect_noise((ancho, alto), 40).convert("L")
+        pagina = Image.blend(pagina, grano, ruido).filter(ImageFilter.SMOOTH)
+    return pagina
+
+
+def generar_corpus(carpeta: str, semilla: int) -> list:
+    """[(ruta, número esperado)] de escaneos de una página a 300 DPI."""
+    from services.ia_service import numero_en_encabezado
+
+    rng = random.Random(semilla)
+    # (nombre, tipo, escala de letra, líneas extra antes del número, ruido)
+    casos = [
+        ("oficio", "oficio", 1.0, 0, 0.0),
+        ("carta_nemaec", "carta", 1.0, 0, 0.0),
+        ("oficio_ruido", "oficio", 1.0, 0, 0.15),
+        ("oficio_letra_chica", "oficio", 0.55, 0, 0.05),
+        ("oficio_encabezado_largo", "oficio", 1.0, 18, 0.0),
+        ("sin_numero", None, 1.0, 0, 0.0),
+    ]
+    documentos = []
+    for n in range(2):
+        for nombre, tipo, escala, lineas_antes, ruido in casos:
+            linea = _linea_numero(rng, tipo) if tipo else ""
+            pagina = _pagina(rng, linea, 300, escala, lineas_antes, ruido)
+            ruta = os.path.join(carpeta, f"{nombre}_{n}.pdf")
+            pagina.save(ruta, "PDF", resolution=300, quality=85)
+            documentos.append((ruta, numero_en_encabezado(linea + "\nSeñor") if linea else ""))
+    return documentos
+
+
+def _normalizar(numero: str) -> str:
+    return "".join(numero.split()).upper()
+
+
+def _metodo_anterior(ruta: str) -> tuple:
+    """Como antes: la primera página completa a 300 DPI con lang='eng'."""
+    ia = importlib.import_module("services.ia_service")
+    texto = ia._ocr_de_pagina(ruta, 1, 300, "eng", ia.OCR_TIMEOUT_PAGINA)
+    return ia.numero_en_encabezado(texto), "pagina@300 eng"
+
+
+def _metodo_escalonado(ruta: str) -> tuple:
+    from services.ia_service import numero_con_ocr_escalonado
+    return numero_con_ocr_escalonado(ruta)
+
+
+def medir(documentos: list, metodo, repeticiones: int) -> dict:
+    tiempos, filas, etapas = [], [], {}
+    encontrados = aciertos = con_esperado = 0
+    for ruta, esperado in documentos:
+        muestras = []
+        for _ in range(repeticiones):
+            inicio = time.perf_counter()
+            numero, etapa = metodo(ruta)
+            muestras.append((time.perf_counter() - inicio) * 1000)
+        ms = statistics.median(muestras)
+        tiempos.append(ms)
+        etapas[etapa or "sin_numero"] = etapas.get(etapa or "sin_numero", 0) + 1
+        encontrados += bool(numero)
+        if esperado is not None:
+            con_esperado += 1
+            aciertos += _normalizar(numero) == _normalizar(esperado)
+        filas.append({"archivo": os.path.basename(ruta), "ms": round(ms, 1), "numero": numero,
+                      "etapa": etapa, "esperado": esperado})
+    tiempos.sort()
+    return {
+        "documentos": len(documentos),
+        "mediana_ms": round(statistics.median(tiempos), 1),
+        "p95_ms": round(tiempos[min(len(tiempos) - 1, int(len(tiempos) * 0.95))], 1),
+        "total_s": round(sum(tiempos) / 1000, 2),
+        "encontrados": encontrados,
+        "aciertos": aciertos if con_esperado else None,
+        "tasa_acierto": round(aciertos / con_esperado, 3) if con_esperado else None,
+        "etapas": etapas,
+        "detalle": filas,
+    }
+
+
+def main():
+    args = _parsear_argumentos()
+    # services exporta la instancia ia_service con el mismo nombre que el módulo
+    ia = importlib.import_module("services.ia_service")
+
+    if not ia.ocr_disponible():
+        print("pytesseract/pdf2image no instalados: no se puede medir el OCR")
+        return
+    if not shutil.which("tesseract") or not shutil.which("pdftoppm"):
+        print("binarios tesseract/pdftoppm no encontrados: no se puede medir el OCR")
+        return
+    print(f"Idioma OCR: {ia.idioma_ocr()} | escalonado: {ia._etapas_ocr_numero()} "
+          f"(franja {ia.OCR_ENCABEZADO_FRACCION:.0%})")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        if args.corpus:
+            rutas = sorted(glob.glob(os.path.join(args.corpus, "*.pdf")) + glob.glob(os.path.join(args.corpus, "*.PDF")))
+            documentos = [(r, None) for r in rutas[:args.limite]]
+        else:
+            print("Generando corpus sintético...")
+            documentos = generar_corpus(tmp, args.semilla)
+        print(f"Corpus: {len(documentos)} PDFs")
+
+        resultados = {
+            "anterior": medir(documentos, _metodo_anterior, args.repeticiones),
+            "escalonado": medir(documentos, _metodo_escalonado, args.repeticiones),
+        }
+
+    print(f"\n{'método':<12}{'docs':>6}{'mediana ms':>12}{'p95 ms':>10}{'total s':>9}{'encontrados':>13}{'aciertos':>10}")
+    for nombre, r in resultados.items():
+        aciertos = "-" if r["aciertos"] is None else f"{r['aciertos']} ({r['tasa_acierto']:.0%})"
+        print(f"{nombre:<12}{r['documentos']:>6}{r['mediana_ms']:>12}{r['p95_ms']:>10}{r['total_s']:>9}"
+              f"{r['encontrados']:>13}{aciertos:>10}")
+    print("Etapas del escalonado:", ", ".join(f"{k}: {v}" for k, v in sorted(resultados["escalonado"]["etapas"].items())))
+    anterior, escalonado = resultados["anterior"], resultados["escalonado"]
+    if escalonado["total_s"]:
+        print(f"Aceleración total: {anterior['total_s'] / escalonado['total_s']:.2f}x")
+    distintos = sum(1 for a, e in zip(anterior["detalle"], escalonado["detalle"])
+                    if _normalizar(a["numero"]) != _normalizar(e["numero"]))
+    print(f"Documentos con número distinto entre métodos: {distintos}")
+
+    if args.detalle:
+        print(f"\n{'archivo':<36}{'anterior ms':>12}{'escalonado ms':>15}  etapa / número")
+        for a, e in zip(anterior["detalle"], escalonado["detalle"]):
+            antes = "" if a["numero"] == e["numero"] else f"  (antes: {a['numero'] or '-'})"
+            print(f"{a['archivo'][:35]:<36}{a['ms']:>12}{e['ms']:>15}  {e['etapa'] or '-'} / {e['numero'] or '-'}{antes}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"parametros": vars(args), "resultados": resultados}, f, indent=2, ensure_ascii=False)
+        print(f"Resultados guardados en {args.json}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+"""
+Bytes ahorrados vs. costo de CPU del optimizador de PDFs (services/optimizacion_service).
+Genera un corpus determinista de oficios escaneados (imagen por página, en gris y en
+color, a distintas resoluciones, más un PDF con texto que no debería cambiar) o usa una
+carpeta existente, y optimiza cada archivo con cada combinación de DPI y calidad JPEG.
+Reporta por combinación: bytes antes/después, ahorro, CPU total y por MB de entrada, y
+los archivos que no llegan al ahorro mínimo.
+
+Uso (desde backend/):
+    python -m benchmarks.optimizacion_pdf
+    python -m benchmarks.optimizacion_pdf --corpus /data/uploads --limite 100
+    python -m benchmarks.optimizacion_pdf --dpi 100,150,200 --calidad 60,75 --json resultados.json
+"""
+import argparse
+import glob
+import json
+import os
+import random
+import tempfile
+import time
+
+
+def _parsear_argumentos():
+    parser = argparse.ArgumentParser(description="Ahorro y costo de CPU del optimizador de PDFs")
+    parser.add_argument("--corpus", help="Carpeta con PDFs (por defecto se genera un corpus sintético)")
+    parser.add_argument("--limite", type=int, default=50, help="Máximo de PDFs del corpus")
+    parser.add_argument("--dpi", default="100,150,200")
+    parser.add_argument("--calidad", default="60,75")
+    parser.add_argument("--semilla", type=int, default=1)
+    parser.add_argument("--json", help="Guardar resultados en este archivo")
+    return parser.parse_args()
+
+
+def _pagina_escaneada(rng: random.Random, ancho: int, alto: int, modo: str):
+    """Página de oficio escaneada: fondo con ruido de papel, líneas de texto y un sello."""
+    from PIL import Image, ImageDraw, ImageFilter
+
+    fondo = 235 if modo == "L" else (238, 234, 226)
+    pagina = Image.new(modo, (ancho, alto), fondo)
+    dibujo = ImageDraw.Draw(pagina)
+    escala = ancho / 1240
+    tinta = 30 if modo == "L" else (25, 25, 40)
+    for i in range(38):
+        y = int((150 + i * 42) * escala)
+        largo = rng.randint(int(700 * escala), int(1000 * escala))
+        dibujo.text((int(110 * escala), y), "OFICIO N° 000336-2025-MIDIS/FONCODES/UGPE " * 2, fill=tinta)
+        dibujo.line([(int(110 * escala), y + int(18 * escala)), (int(110 * escala) + largo, y + int(18 * escala))],
+                    fill=tinta, width=max(1, int(2 * escala)))
+    sello = 90 if modo == "L" else (40, 60, 160)
+    centro = (int(900 * escala), int(1500 * escala))
+    radio = int(110 * escala)
+    dibujo.ellipse([centro[0] - radio, centro[1] - radio, centro[0] + radio, centro[1] + radio],
+                   outline=sello, width=max(2, int(6 * escala)))
+    # Grano del escaneo: es lo que hace que estas imágenes pesen
+    ruido = Image.effect_noise((ancho, alto), 18).convert("L")
+    if modo == "RGB":
+        ruido = Image.merge("RGB", (ruido, ruido, ruido))
+    return Image.blend(pagina, ruido, 0.12).filter(ImageFilter.SMOOTH)
+
+
+def generar_corpus(carpeta: str, semilla: int) -> list:
+    """Escaneos A4 de 1 a 3 páginas a 200/300 DPI, en gris y color, y un PDF con texto."""
+    from benchmarks.pdf_sintetico import pdf_oficio
+
+    rng = random.Random(semilla)
+    rutas = []
+    casos = [(300, "L", 1), (300, "L", 3), (300, "RGB", 1), (300, "RGB", 2), (200, "L", 2), (200, "RGB", 1)]
+    for n, (dpi, modo, paginas) in enumerate(casos):
+        ancho, alto = int(8.27 * dpi), int(11.69 * dpi)
+        imagenes = [_pagina_escaneada(rng, ancho, alto, modo) for _ in range(paginas)]
+        ruta = os.path.join(carpeta, f"escaneo_{n:02d}_{dpi}dpi_{modo}_{paginas}p.pdf")
+        imagenes[0].save(ruta, "PDF", resolution=dpi, save_all=True, append_images=imagenes[1:], quality=92)
+        rutas.append(ruta)
+    ruta = os.path.join(carpeta, "texto_12p.pdf")
+    with open(ruta, "wb") as f:
+        f.write(pdf_oficio("OFICIO N°000336-2025-MIDIS/FONCODES/UGPE", "Remite dossier", "NEMAEC", paginas_extra=11))
+    rutas.append(ruta)
+    return rutas
+
+
+def medir(rutas: list, dpi: int, calidad: int, carpeta_salida: str, ahorro_minimo: float) -> dict:
+    from services.optimizacion_service import optimizar_pdf
+
+    antes = despues = 0
+    cpu_total = 0.0
+    sin_ahorro, errores, imagenes = 0, 0, 0
+    for ruta in rutas:
+        destino = os.path.join(carpeta_salida, os.path.basename(ruta))
+        tamano = os.path.getsize(ruta)
+        cpu = time.process_time()
+        try:
+            resultado = optimizar_pdf(ruta, destino, dpi, calidad)
+        except Exception as e:
+            errores += 1
+            print(f"  error en {os.path.basename(ruta)}: {e}")
+            continue
+        cpu_total += time.process_time() - cpu
+        imagenes += resultado["imagenes"]
+        ahorro = 1 - resultado["tamano_resultado"] / max(1, tamano)
+        # Igual que el servicio: si no ahorra lo suficiente el original se conserva
+        antes += tamano
+        if ahorro < ahorro_minimo:
+            sin_ahorro += 1
+            despues += tamano
+        else:
+            despues += resultado["tamano_resultado"]
+        os.remove(destino)
+    mb = antes / 1024 / 1024
+    return {
+        "dpi": dpi, "calidad": calidad, "archivos": len(rutas) - errores, "imagenes": imagenes,
+        "mb_antes": round(mb, 2), "mb_despues": round(despues / 1024 / 1024, 2),
+        "ahorro": round(1 - despues / max(1, antes), 3),
+        "cpu_s": round(cpu_total, 2), "cpu_s_por_mb": round(cpu_total / mb, 3) if mb else None,
+        "sin_ahorro": sin_ahorro, "errores": errores,
+    }
+
+
+def main():
+    args = _parsear_argumentos()
+    from services.optimizacion_service import OPTIMIZAR_PDF_AHORRO_MINIMO
+
+    with tempfile.TemporaryDirectory() as tmp:
+        if args.corpus:
+            rutas = sorted(glob.glob(os.path.join(args.corpus, "*.pdf")) + glob.glob(os.path.join(args.corpus, "*.PDF")))
+            rutas = rutas[:args.limite]
+        else:
+            print("Generando corpus sintético...")
+            rutas = generar_corpus(tmp, args.semilla)
+        total = sum(os.path.getsize(r) for r in rutas)
+        print(f"Corpus: {len(rutas)} PDFs, {total / 1024 / 1024:.1f} MB (ahorro mínimo {OPTIMIZAR_PDF_AHORRO_MINIMO:.0%})")
+
+        salida = os.path.join(tmp, "salida")
+        os.makedirs(salida)
+        resultados = []
+        for dpi in [int(x) for x in args.dpi.split(",")]:
+            for calidad in [int(x) for x in args.calidad.split(",")]:
+                resultados.append(medir(rutas, dpi, calidad, salida, OPTIMIZAR_PDF_AHORRO_MINIMO))
+
+    print(f"{'dpi':>5}{'calidad':>9}{'imágenes':>10}{'MB antes':>10}{'MB después':>12}{'ahorro':>8}"
+          f"{'CPU s':>8}{'CPU s/MB':>10}{'sin ahorro':>12}")
+    for r in resultados:
+        print(f"{r['dpi']:>5}{r['calidad']:>9}{r['imagenes']:>10}{r['mb_antes']:>10}{r['mb_despues']:>12}"
+              f"{r['ahorro']:>8.1%}{r['cpu_s']:>8}{str(r['cpu_s_por_mb']):>10}{r['sin_ahorro']:>12}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"parametros": vars(args), "resultados": resultados}, f, indent=2, ensure_ascii=False)
+        print(f"Resultados guardados en {args.json}")
+
+
+if __name__ == "__main__":
+    main()
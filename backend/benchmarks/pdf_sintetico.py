@@ -0,0 +1,72 @@
+"""
+PDFs mínimos escritos a mano (sin dependencias) para datos sintéticos y benchmarks.
+Cada página lleva texto real en Helvetica, así que pdfplumber puede extraerlo.
+"""
+
+
+def _escapar_texto(texto: str) -> str:
+    return texto.replace('\\', '\\\\').replace('(', '\\(').replace(')', '\\)')
+
+
+def pdf_minimo(paginas: list) -> bytes:
+    """
+    Construye un PDF válido. `paginas` es una lista de páginas y cada página
+    una lista de líneas de texto (latin-1). Tamaño A4.
+    """
+    objetos = []  # contenido de cada objeto, en orden (obj 1 = catálogo)
+    n_paginas = len(paginas)
+    id_fuente = 3 + 2 * n_paginas
+    ids_paginas = [3 + 2 * i for i in range(n_paginas)]
+
+    objetos.append(b"<< /Type /Catalog /Pages 2 0 R >>")
+    kids = " ".join(f"{i} 0 R" for i in ids_paginas)
+    objetos.append(f"<< /Type /Pages /Kids [{kids}] /Count {n_paginas} >>".encode("latin-1"))
+
+    for i, lineas in enumerate(paginas):
+        id_pagina = ids_paginas[i]
+        operaciones = ["BT", "/F1 11 Tf", "14 TL", "72 770 Td"]
+        for linea in lineas:
+            operaciones.append(f"({_escapar_texto(linea)}) Tj T*")
+        operaciones.append("ET")
+        contenido = "\n".join(operaciones).encode("latin-1", errors="replace")
+        objetos.append(
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
+            f"/Resources << /Font << /F1 {id_fuente} 0 R >> >> /Contents {id_pagina + 1} 0 R >>".encode("latin-1")
+        )
+        objetos.append(b"<< /Length " + str(len(contenido)).encode() + b" >>\nstream\n" + contenido + b"\nendstream")
+
+    objetos.append(b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>")
+
+    salida = bytearray(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+    offsets = []
+    for numero, cuerpo in enumerate(objetos, start=1):
+        offsets.append(len(salida))
+        salida += f"{numero} 0 obj\n".encode() + cuerpo + b"\nendobj\n"
+
+    inicio_xref = len(salida)
+    salida += f"xref\n0 {len(objetos) + 1}\n0000000000 65535 f \n".encode()
+    for offset in offsets:
+        salida += f"{offset:010d} 00000 n \n".encode()
+    salida += f"trailer\n<< /Size {len(objetos) + 1} /Root 1 0 R >>\nstartxref\n{inicio_xref}\n%%EOF\n".encode()
+    return bytes(salida)
+
+
+def pdf_oficio(numero: str, asunto: str, remitente: str, paginas_extra: int = 0) -> bytes:
+    """PDF con la estructura de cabecera de un oficio real (número, asunto, remitente)."""
+    primera = [
+        "MINISTERIO DE DESARROLLO E INCLUSION SOCIAL",
+        "",
+        numero,
+        "",
+        "Lima, 15 de marzo de 2026",
+        "",
+        "Senor(a):",
+        remitente,
+        "",
+        f"ASUNTO: {asunto}",
+        "",
+        "Tengo el agrado de dirigirme a usted para remitir la documentacion",
+        "correspondiente al asunto de la referencia, para su revision y tramite.",
+    ]
+    relleno = [f"Linea {n} del anexo con detalle tecnico de la obra y sus partidas." for n in range(1, 45)]
+    return pdf_minimo([primera] + [relleno for _ in range(paginas_extra)])
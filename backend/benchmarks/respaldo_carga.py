@@ -0,0 +1,96 @@
+"""
+Impacto de los respaldos en caliente sobre el tráfico.
+1. Línea base: tráfico autenticado (listados, seguimiento, subidas) sin respaldos.
+2. El mismo tráfico mientras se piden respaldos uno tras otro (POST /api/respaldos y
+   espera del trabajo en /api/trabajos/{id}).
+Se comparan p50/p95/p99 y se reportan los tiempos de cada respaldo (copia, verificación,
+compresión), los pasos y los reinicios de la copia provocados por escrituras concurrentes.
+
+Uso (desde backend/, con el servidor en ejecución sobre SQLite):
+    python -m benchmarks.respaldo_carga --url http://localhost:8000 --duracion 30
+"""
+import argparse
+import json
+import threading
+import time
+
+import httpx
+
+from benchmarks.carga import _login, ejecutar, imprimir_tabla
+
+ESCENARIOS = ["documentos_lista", "documentos_filtro", "contratos", "seguimiento", "subida"]
+
+
+def _parsear_argumentos():
+    parser = argparse.ArgumentParser(description="Tráfico legítimo durante respaldos en caliente")
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--usuario", default="adminnemaec")
+    parser.add_argument("--clave", default="AdminNemaec123*")
+    parser.add_argument("--escenarios", default=",".join(ESCENARIOS))
+    parser.add_argument("--duracion", type=float, default=20, help="Segundos de medición por fase")
+    parser.add_argument("--calentamiento", type=float, default=2)
+    parser.add_argument("--concurrencia", type=int, default=4)
+    parser.add_argument("--semilla", type=int, default=1)
+    parser.add_argument("--json", help="Guardar resultados en este archivo")
+    return parser.parse_args()
+
+
+def respaldar(url: str, token: str, hasta: float) -> list:
+    """Pide respaldos de a uno hasta `hasta`. Retorna los metadatos de cada respaldo terminado."""
+    respaldos = []
+    headers = {"Authorization": f"Bearer {token}"}
+    with httpx.Client(base_url=url, headers=headers, timeout=60) as cliente:
+        while time.perf_counter() < hasta:
+            r = cliente.post("/api/respaldos")
+            r.raise_for_status()
+            trabajo_id = r.json()["trabajo_id"]
+            while True:
+                trabajo = cliente.get(f"/api/trabajos/{trabajo_id}").json()
+                if trabajo["estado"] in ("completado", "error"):
+                    break
+                time.sleep(0.2)
+            if trabajo["estado"] == "error":
+                raise SystemExit(f"El respaldo {trabajo_id} falló: {trabajo['error']}")
+            respaldos.append(trabajo["resultado"])
+    return respaldos
+
+
+def main():
+    args = _parsear_argumentos()
+    escenarios = [e.strip() for e in args.escenarios.split(",") if e.strip()]
+    token = _login(args.url, args.usuario, args.clave)
+
+    print(f"Línea base: {args.concurrencia} hilos, {args.duracion:.0f} s")
+    base = ejecutar(args.url, token, escenarios, args.duracion, args.calentamiento,
+                    args.concurrencia, args.semilla)
+    imprimir_tabla(base)
+
+    print("\nCon respaldos continuos")
+    hasta = time.perf_counter() + args.calentamiento + args.duracion
+    respaldos = []
+    hilo = threading.Thread(target=lambda: respaldos.extend(respaldar(args.url, token, hasta)))
+    hilo.start()
+    con_respaldo = ejecutar(args.url, token, escenarios, args.duracion, args.calentamiento,
+                            args.concurrencia, args.semilla)
+    hilo.join()
+    imprimir_tabla(con_respaldo)
+
+    print(f"\n{'respaldo':<36}{'MB db':>8}{'MB gz':>8}{'pasos':>7}{'reinic':>7}"
+          f"{'copia ms':>10}{'verif ms':>10}{'gzip ms':>10}")
+    for r in respaldos:
+        print(f"{r['archivo']:<36}{r['tamano_db'] / 1024 / 1024:>8.1f}{r['tamano_gz'] / 1024 / 1024:>8.1f}"
+              f"{r['pasos']:>7}{r['reinicios']:>7}{r['copia_ms']:>10}{r['verificacion_ms']:>10}{r['compresion_ms']:>10}")
+
+    p99_base, p99_respaldo = base["TOTAL"]["p99_ms"], con_respaldo["TOTAL"]["p99_ms"]
+    if p99_base:
+        print(f"\np99: {p99_base} ms sin respaldos, {p99_respaldo} ms con respaldos (x{p99_respaldo / p99_base:.1f})")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"parametros": vars(args), "base": base, "con_respaldo": con_respaldo,
+                       "respaldos": respaldos}, f, indent=2, ensure_ascii=False)
+        print(f"Resultados guardados en {args.json}")
+
+
+if __name__ == "__main__":
+    main()
@@ -6,23 +6,25 @@ import os
 import re
 import json
 import shutil
+import time
+from contextlib import asynccontextmanager
 from dotenv import load_dotenv
+# Único punto de carga del .env (los servicios leen os.environ)
 load_dotenv(dotenv_path=os.path.join(os.path.dirname(__file__), ".env"))
 from datetime import datetime
 from typing import Optional, List
-from fastapi import FastAPI, Depends, HTTPException, UploadFile, File, Query, Header
+from fastapi import FastAPI, Depends, HTTPException, UploadFile, File, Query, Header, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse, StreamingResponse
+from fastapi.responses import FileResponse, StreamingResponse, PlainTextResponse, JSONResponse, Response, RedirectResponse
 from sqlalchemy.orm import Session
-from sqlalchemy import or_
-import pdfplumber
+from sqlalchemy import or_, inspect, text
+from sqlalchemy.exc import IntegrityError
 import io
-import openpyxl
-from openpyxl.styles import PatternFill, Font, Alignment, Border, Side
-from openpyxl.utils import get_column_letter
+# pdfplumber, openpyxl y openai se importan dentro de las funciones que los usan:
+# son pesados y la mayoría de los requests no los necesita.
 
-from database import engine, get_db, Base
+from database import engine, get_db, Base, SessionLocal, bloqueo_exclusivo, ES_POSTGRES, ES_SQLITE
 from models import Documento, Adjunto, Usuario, Contrato, AdjuntoContrato, ComisariaContrato, ExpedienteContrato, PlantillaCarta, CartaGenerada, ConfiguracionSistema, SeguimientoComisaria, SeguimientoCeldaDetalle, RegistroMejora
 from schemas import (
     DocumentoCreate, DocumentoUpdate, DocumentoResponse, DocumentoListResponse,
@@ -33,173 +35,45 @@ from schemas import (
     ExpedienteContratoCreate, ExpedienteContratoUpdate, ExpedienteContratoResponse,
     PlantillaCartaCreate, PlantillaCartaResponse,
     GenerarCartaRequest, GenerarCartaResponse, ExportarCartaRequest,
-    SeguimientoComisariaResponse, ActualizarCeldaRequest,
+    SeguimientoComisariaResponse, ActualizarCeldaRequest, SeguimientoCambioResponse,
+    SeguimientoResumenResponse,
     RegistroMejoraCreate, RegistroMejoraUpdate, RegistroMejoraResponse,
     AsistirMejoraRequest, AsistirMejoraResponse
 )
-from services.ia_service import ia_service, extraer_numero_con_ocr, OCR_DISPONIBLE
-from services.auth_service import hash_password, verify_password, create_token, verify_token
+from services.ia_service import ia_service, extraer_numero_con_ocr, ocr_disponible, detener_pool_ocr
+from services.metrics_service import metricas, medir_etapa, MetricsMiddleware
+from services.perfil_service import perfiles, PerfilMiddleware
+from services.auth_service import (
+    hash_password, verify_password, necesita_rehash, create_token, verify_token, revocar_token, extraer_token_bearer
+)
+from services.limite_service import limitador_login, LimiteExcedido
+from services.config_service import configuracion
+from services import trabajos_service as trabajos
+from services.trabajos_service import ejecutor_trabajos
+from services.backup_service import programador_respaldos, listar_respaldos, ruta_respaldo
+from services.zip_service import ZipEnStreaming, parsear_rango
+from services.expediente_service import zip_expediente
+from services import dossier_service
+from services import restauracion_service as restauracion
+from services import exportacion_service as exportacion
+from services import conciliacion_service as conciliacion
+from services import almacenamiento_service as almacenamiento
+from services import optimizacion_service as optimizacion
+from services import miniaturas_service as miniaturas
+from services.seguimiento_service import (
+    CAMPOS_SIONO, CAMPOS_FECHA, CAMPOS_FLOAT, CAMPOS_BOOL, CODIGOS_CAMPO,
+    registrar_cambio, listar_historial, reconstruir_grilla,
+    contribucion, aplicar_delta_agregados, recalcular_agregados, inicializar_agregados, obtener_resumen
+)
 from init_users import crear_usuarios_iniciales
+from migraciones import aplicar_migraciones, indice_cartas_correlativo, TSVECTOR_DOCUMENTOS
 
-# Crear tablas en la base de datos
-Base.metadata.create_all(bind=engine)
-
-# Migración: agregar columnas nuevas a contratos si no existen
-def migrar_contratos():
-    """Agrega columnas nuevas a la tabla contratos si no existen.
-    - ruc_contratado: NULL por defecto
-    - tipo_contrato: 'mantenimiento' por defecto para registros existentes
-    - precio_unitario: NULL por defecto (solo para equipamiento)
-    - monto_total: convertir de TEXT a REAL si es necesario
-    """
-    from sqlalchemy import text
-    try:
-        with engine.connect() as conn:
-            # Verificar columnas existentes
-            result = conn.execute(text("PRAGMA table_info(contratos)"))
-            columnas_info = result.fetchall()
-            columnas = [row[1] for row in columnas_info]
-
-            # Agregar columna ruc_contratado (NULL por defecto)
-            if 'ruc_contratado' not in columnas:
-                conn.execute(text("ALTER TABLE contratos ADD COLUMN ruc_contratado VARCHAR(11)"))
-                conn.commit()
-                print("Migración completada: columna ruc_contratado agregada (NULL por defecto)")
-
-            # Agregar columna tipo_contrato
-            if 'tipo_contrato' not in columnas:
-                conn.execute(text("ALTER TABLE contratos ADD COLUMN tipo_contrato VARCHAR(20)"))
-                conn.commit()
-                print("Migración completada: columna tipo_contrato agregada")
-
-            # Agregar columna precio_unitario (NULL por defecto, solo para equipamiento)
-            if 'precio_unitario' not in columnas:
-                conn.execute(text("ALTER TABLE contratos ADD COLUMN precio_unitario REAL"))
-                conn.commit()
-                print("Migración completada: columna precio_unitario agregada (NULL por defecto)")
-
-            # Agregar columna plazo_dias
-            if 'plazo_dias' not in columnas:
-                conn.execute(text("ALTER TABLE contratos ADD COLUMN plazo_dias INTEGER"))
-                conn.commit()
-                print("Migración completada: columna plazo_dias agregada")
-
-            # Agregar columna dias_adicionales (0 por defecto)
-            if 'dias_adicionales' not in columnas:
-                conn.execute(text("ALTER TABLE contratos ADD COLUMN dias_adicionales INTEGER DEFAULT 0"))
-                conn.commit()
-                print("Migración completada: columna dias_adicionales agregada (0 por defecto)")
-
-            # Agregar columna estado_ejecucion (PENDIENTE por defecto)
-            if 'estado_ejecucion' not in columnas:
-                conn.execute(text("ALTER TABLE contratos ADD COLUMN estado_ejecucion VARCHAR(30) DEFAULT 'PENDIENTE'"))
-                conn.commit()
-                print("Migración completada: columna estado_ejecucion agregada (PENDIENTE por defecto)")
-
-            # Agregar columna tipo_contratado (empresa | consorcio)
-            if 'tipo_contratado' not in columnas:
-                conn.execute(text("ALTER TABLE contratos ADD COLUMN tipo_contratado VARCHAR(20) DEFAULT 'empresa'"))
-                conn.commit()
-                print("Migración completada: columna tipo_contratado agregada")
-
-            # Agregar columnas de representante para cartas
-            if 'nombre_representante' not in columnas:
-                conn.execute(text("ALTER TABLE contratos ADD COLUMN nombre_representante VARCHAR(255)"))
-                conn.commit()
-                print("Migración completada: columna nombre_representante agregada")
-
-            if 'cargo_representante' not in columnas:
-                conn.execute(text("ALTER TABLE contratos ADD COLUMN cargo_representante VARCHAR(255)"))
-                conn.commit()
-                print("Migración completada: columna cargo_representante agregada")
-
-            if 'email_representante' not in columnas:
-                conn.execute(text("ALTER TABLE contratos ADD COLUMN email_representante VARCHAR(255)"))
-                conn.commit()
-                print("Migración completada: columna email_representante agregada")
-
-            if 'whatsapp_representante' not in columnas:
-                conn.execute(text("ALTER TABLE contratos ADD COLUMN whatsapp_representante VARCHAR(20)"))
-                conn.commit()
-                print("Migración completada: columna whatsapp_representante agregada")
-
-            # Establecer 'mantenimiento' como valor por defecto para contratos existentes sin tipo
-            result = conn.execute(text("UPDATE contratos SET tipo_contrato = 'mantenimiento' WHERE tipo_contrato IS NULL"))
-            if result.rowcount > 0:
-                conn.commit()
-                print(f"Migración completada: {result.rowcount} contratos actualizados a tipo 'mantenimiento'")
-
-            # Convertir monto_total de texto a número (extraer solo dígitos y decimales)
-            # Solo ejecutar si hay datos con formato texto
-            try:
-                conn.execute(text("""
-                    UPDATE contratos
-                    SET monto_total = CAST(
-                        REPLACE(REPLACE(REPLACE(monto_total, 'S/', ''), ',', ''), ' ', '')
-                        AS REAL
-                    )
-                    WHERE monto_total IS NOT NULL
-                    AND monto_total != ''
-                    AND typeof(monto_total) = 'text'
-                """))
-                conn.commit()
-            except:
-                pass  # Ignorar si ya es numérico o hay error de conversión
-
-    except Exception as e:
-        print(f"Error en migración (puede ignorarse si es nueva instalación): {e}")
-
-migrar_contratos()
-
-def migrar_documentos():
-    """
-    Agrega columnas nuevas a documentos si no existen.
-    - estado: 'enviado' por defecto — todos los registros existentes quedan como enviados.
-    """
-    from sqlalchemy import text
-    try:
-        with engine.connect() as conn:
-            result = conn.execute(text("PRAGMA table_info(documentos)"))
-            columnas = [row[1] for row in result.fetchall()]
-
-            if 'estado' not in columnas:
-                conn.execute(text("ALTER TABLE documentos ADD COLUMN estado VARCHAR(20) DEFAULT 'enviado'"))
-                conn.commit()
-                print("Migración completada: columna 'estado' agregada a documentos (default: 'enviado')")
-
-            if 'archivo_docx' not in columnas:
-                conn.execute(text("ALTER TABLE documentos ADD COLUMN archivo_docx VARCHAR(500)"))
-                conn.commit()
-                print("Migración completada: columna 'archivo_docx' agregada a documentos")
-
-            # Asegurar que todos los registros existentes sin estado queden como 'enviado'
-            result = conn.execute(text("UPDATE documentos SET estado='enviado' WHERE estado IS NULL"))
-            if result.rowcount > 0:
-                conn.commit()
-                print(f"Migración completada: {result.rowcount} documentos existentes marcados como 'enviado'")
-    except Exception as e:
-        print(f"Error en migración documentos: {e}")
-
-migrar_documentos()
-
-def migrar_seguimiento():
-    """Agrega columna dossier_monto_merge a seguimiento_comisaria si no existe."""
-    from sqlalchemy import text
-    try:
-        with engine.connect() as conn:
-            result = conn.execute(text("PRAGMA table_info(seguimiento_comisaria)"))
-            columnas = [row[1] for row in result.fetchall()]
-            if 'dossier_monto_merge' not in columnas:
-                conn.execute(text("ALTER TABLE seguimiento_comisaria ADD COLUMN dossier_monto_merge INTEGER NOT NULL DEFAULT 0"))
-                conn.commit()
-                print("Migración completada: columna dossier_monto_merge agregada")
-    except Exception as e:
-        print(f"Error en migración seguimiento: {e}")
-
-migrar_seguimiento()
-
-# Crear usuarios iniciales si no existen
-crear_usuarios_iniciales()
+# ============================================
+# INICIALIZACIÓN DE LA BASE DE DATOS
+# ============================================
+# El esquema se versiona en migraciones.py (tabla schema_version); los seeds de datos
+# se ejecutan en el lifespan de la app (no al importar el módulo). Cada seed retorna
+# False si falló; en ese caso se reintenta en el próximo arranque.
 
 def seed_seguimiento():
     """Pobla la tabla seguimiento_comisaria con los datos del Excel si está vacía."""
@@ -254,16 +128,118 @@ def seed_seguimiento():
     except Exception as e:
         db.rollback()
         print(f"Error en seed_seguimiento: {e}")
+        return False
+    finally:
+        db.close()
+
+def seed_agregados_seguimiento():
+    """Construye los agregados materializados del seguimiento si aún no existen."""
+    from database import SessionLocal
+    db = SessionLocal()
+    try:
+        inicializar_agregados(db)
+    except Exception as e:
+        db.rollback()
+        print(f"Error inicializando agregados de seguimiento: {e}")
+        return False
+    finally:
+        db.close()
+
+
+# Pasos de inicialización en orden. Los completados se registran en configuracion_sistema
+# y no se repiten en los siguientes arranques.
+PASOS_INICIALIZACION = [
+    ("usuarios_iniciales", crear_usuarios_iniciales),
+    ("seed_seguimiento", seed_seguimiento),
+    ("agregados_seguimiento", seed_agregados_seguimiento),
+]
+CLAVE_PASOS_INICIALIZACION = "inicializacion_pasos_completados"
+
+
+def inicializar_base_datos():
+    """
+    Crea las tablas que falten, aplica las migraciones pendientes y ejecuta los pasos
+    de inicialización pendientes. En una base ya inicializada cuesta un par de consultas.
+    Con varios workers se ejecuta bajo un lock de archivo: el primero inicializa y los
+    demás esperan y encuentran la base al día.
+    """
+    with bloqueo_exclusivo("inicializacion"):
+        _inicializar_base_datos()
+
+
+def _inicializar_base_datos():
+    inicio = time.perf_counter()
+    tablas_existentes = set(inspect(engine).get_table_names())
+    if not set(Base.metadata.tables) <= tablas_existentes:
+        Base.metadata.create_all(bind=engine)
+
+    try:
+        aplicar_migraciones(engine)
+    except Exception as e:
+        # La migración fallida no queda registrada y se reintenta en el próximo arranque.
+        # No se arranca: los modelos ya mapean las columnas de las migraciones siguientes
+        # y todos los endpoints de esas tablas fallarían.
+        print(f"Error aplicando migraciones: {e}")
+        raise RuntimeError(f"No se puede iniciar con migraciones pendientes: {e}") from e
+    # Si la migración 006 se aplicó con cartas duplicadas, reintentar el índice único
+    with engine.begin() as conn:
+        indice_cartas_correlativo(conn)
+
+    db = SessionLocal()
+    try:
+        fila = db.query(ConfiguracionSistema).filter(
+            ConfiguracionSistema.clave == CLAVE_PASOS_INICIALIZACION
+        ).first()
+        completados = set(json.loads(fila.valor)) if fila and fila.valor else set()
+
+        ejecutados = []
+        for nombre, paso in PASOS_INICIALIZACION:
+            if nombre in completados:
+                continue
+            if paso() is not False:
+                completados.add(nombre)
+            ejecutados.append(nombre)
+
+        if ejecutados:
+            valor = json.dumps(sorted(completados))
+            if fila:
+                fila.valor = valor
+            else:
+                db.add(ConfiguracionSistema(clave=CLAVE_PASOS_INICIALIZACION, valor=valor))
+            db.commit()
     finally:
         db.close()
 
-seed_seguimiento()
+    duracion_ms = (time.perf_counter() - inicio) * 1000
+    if ejecutados:
+        print(f"Inicialización: {', '.join(ejecutados)} ({duracion_ms:.0f} ms)")
+    else:
+        print(f"Inicialización: base al día ({duracion_ms:.0f} ms)")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Prepara la base de datos antes de aceptar requests."""
+    inicializar_base_datos()
+    metricas.iniciar_publicacion()
+    ejecutor_trabajos.iniciar()
+    programador_respaldos.iniciar()
+    conciliacion.programador_conciliacion.iniciar(UPLOAD_DIR)
+    optimizacion.programador_optimizacion.iniciar(UPLOAD_DIR)
+    yield
+    optimizacion.programador_optimizacion.detener()
+    conciliacion.programador_conciliacion.detener()
+    programador_respaldos.detener()
+    ejecutor_trabajos.detener()
+    detener_pool_ocr()
+
 
 # Crear aplicación FastAPI
 app = FastAPI(
     title="Sistema de Gestión de Correspondencia",
     description="MVP para gestión de oficios y cartas institucionales",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 # Configurar CORS para permitir frontend local
@@ -275,6 +251,12 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Métricas de latencia / tamaño / estado por ruta (expuestas en /metrics)
+app.add_middleware(MetricsMiddleware)
+
+# Perfilado por muestreo a pedido (header X-Perfilar: 1 con token válido)
+app.add_middleware(PerfilMiddleware)
+
 # Directorio para archivos subidos (usa variable de entorno en producción)
 UPLOAD_DIR = os.getenv("UPLOAD_DIR", os.path.join(os.path.dirname(os.path.dirname(__file__)), "uploads"))
 os.makedirs(UPLOAD_DIR, exist_ok=True)
@@ -296,14 +278,13 @@ def verificar_admin(authorization: Optional[str] = Header(None)) -> Usuario:
         raise HTTPException(status_code=401, detail="No autorizado - Token requerido")
 
     # Extraer token del header "Bearer <token>"
-    try:
-        scheme, token = authorization.split()
-        if scheme.lower() != "bearer":
+    token = extraer_token_bearer(authorization)
+    if token is None:
+        if authorization.partition(" ")[0].lower() != "bearer":
             raise HTTPException(status_code=401, detail="Esquema de autorización inválido")
-    except ValueError:
         raise HTTPException(status_code=401, detail="Header de autorización inválido")
 
-    # Verificar token
+    # Verificar token (con caché de tokens ya validados)
     payload = verify_token(token)
     if not payload:
         raise HTTPException(status_code=401, detail="Token inválido o expirado")
@@ -316,36 +297,50 @@ def verificar_admin_opcional(authorization: Optional[str] = Header(None)) -> Opt
     Dependency opcional - no falla si no hay token, solo retorna None.
     Útil para endpoints que pueden ser públicos o autenticados.
     """
-    if not authorization:
-        return None
-
-    try:
-        scheme, token = authorization.split()
-        if scheme.lower() != "bearer":
-            return None
-        payload = verify_token(token)
-        return payload
-    except:
+    token = extraer_token_bearer(authorization)
+    if token is None:
         return None
+    return verify_token(token)
 
 
 @app.post("/api/login", response_model=LoginResponse)
-def login(request: LoginRequest, db: Session = Depends(get_db)):
+def login(request: LoginRequest, http_request: Request, db: Session = Depends(get_db)):
     """
     Endpoint de login. Verifica credenciales y retorna token JWT.
+    Limitado por IP (todos los intentos) y por usuario (los fallidos); los intentos
+    excedidos se rechazan con 429 sin calcular bcrypt.
     """
+    ip = http_request.client.host if http_request.client else "desconocida"
+    try:
+        limitador_login.registrar_intento(ip, request.username)
+    except LimiteExcedido as e:
+        raise HTTPException(status_code=429, detail=e.motivo,
+                            headers={"Retry-After": str(max(1, round(e.reintentar_en)))})
+
     # Buscar usuario
     usuario = db.query(Usuario).filter(Usuario.username == request.username).first()
 
     if not usuario:
+        limitador_login.login_fallido(request.username)
         raise HTTPException(status_code=401, detail="Usuario o contraseña incorrectos")
 
     if not usuario.activo:
         raise HTTPException(status_code=401, detail="Usuario desactivado")
 
-    # Verificar contraseña
-    if not verify_password(request.password, usuario.password_hash):
-        raise HTTPException(status_code=401, detail="Usuario o contraseña incorrectos")
+    # Verificar contraseña (cantidad acotada de verificaciones bcrypt simultáneas)
+    try:
+        with limitador_login.cupo_verificacion():
+            if not verify_password(request.password, usuario.password_hash):
+                limitador_login.login_fallido(usuario.username)
+                raise HTTPException(status_code=401, detail="Usuario o contraseña incorrectos")
+            if necesita_rehash(usuario.password_hash):
+                usuario.password_hash = hash_password(request.password)
+                db.commit()
+    except LimiteExcedido as e:
+        raise HTTPException(status_code=429, detail=e.motivo,
+                            headers={"Retry-After": str(max(1, round(e.reintentar_en)))})
+
+    limitador_login.login_exitoso(usuario.username)
 
     # Generar token
     token = create_token(usuario.username, usuario.nombre)
@@ -358,6 +353,15 @@ def login(request: LoginRequest, db: Session = Depends(get_db)):
     )
 
 
+@app.post("/api/logout")
+def logout(authorization: Optional[str] = Header(None), admin: dict = Depends(verificar_admin)):
+    """
+    Revoca el token actual: deja de ser aceptado aunque no haya expirado.
+    """
+    revocar_token(extraer_token_bearer(authorization))
+    return {"mensaje": "Sesión cerrada"}
+
+
 @app.get("/api/verificar-token")
 def verificar_token_endpoint(admin: dict = Depends(verificar_admin)):
     """
@@ -396,7 +400,16 @@ def listar_documentos(
         query = query.filter(Documento.tipo_documento == tipo_documento)
     if direccion:
         query = query.filter(Documento.direccion == direccion)
-    if busqueda:
+    if busqueda and ES_POSTGRES:
+        # Texto completo con el índice GIN (migración 007); el número se sigue buscando
+        # por subcadena porque el analizador de texto parte "000123-2025-MIDIS"
+        query = query.filter(
+            or_(
+                text(f"{TSVECTOR_DOCUMENTOS} @@ plainto_tsquery('spanish', :busqueda)").bindparams(busqueda=busqueda),
+                Documento.numero.ilike(f"%{busqueda}%")
+            )
+        )
+    elif busqueda:
         busqueda_like = f"%{busqueda}%"
         query = query.filter(
             or_(
@@ -577,7 +590,7 @@ def obtener_respuestas(
 # ============================================
 
 @app.post("/api/documentos/{documento_id}/archivo")
-async def subir_archivo(
+def subir_archivo(
     documento_id: int,
     archivo: UploadFile = File(...),
     db: Session = Depends(get_db),
@@ -607,7 +620,9 @@ async def subir_archivo(
     # Actualizar documento
     documento.archivo_local = nombre_archivo
     documento.updated_at = datetime.utcnow()
+    almacenamiento.registrar_archivo(documento, UPLOAD_DIR, admin.get("sub"))
     db.commit()
+    miniaturas.precalentar(ruta_archivo)
 
     return {
         "mensaje": "Archivo subido exitosamente",
@@ -645,7 +660,7 @@ async def subir_archivo_temporal(
 
 
 @app.post("/api/documentos/{documento_id}/asociar-archivo")
-async def asociar_archivo_temporal(
+def asociar_archivo_temporal(
     documento_id: int,
     nombre_temporal: str = Query(..., description="Nombre del archivo temporal a asociar"),
     db: Session = Depends(get_db),
@@ -680,7 +695,9 @@ async def asociar_archivo_temporal(
     # Actualizar documento
     documento.archivo_local = nuevo_nombre
     documento.updated_at = datetime.utcnow()
+    almacenamiento.registrar_archivo(documento, UPLOAD_DIR, admin.get("sub"))
     db.commit()
+    miniaturas.precalentar(ruta_nueva)
 
     return {
         "mensaje": "Archivo asociado exitosamente",
@@ -758,7 +775,7 @@ async def analizar_archivo_con_ia(
 
     # Si necesitamos OCR prioritario y está disponible, extraer número con OCR primero
     numero_ocr = ""
-    if necesita_ocr_prioritario and OCR_DISPONIBLE:
+    if necesita_ocr_prioritario and ocr_disponible():
         print(f"Nombre corto Windows o texto sin número en encabezado detectado, usando OCR prioritario...")
         numero_ocr = extraer_numero_con_ocr(ruta_archivo)
         print(f"OCR encontró: '{numero_ocr}'")
@@ -780,7 +797,7 @@ async def analizar_archivo_con_ia(
         tiene_numero_valido = bool(re.search(r'\d{5,6}', numero_actual)) or (es_nemaec and bool(re.search(r'\d{1,6}', numero_actual))) or (es_carta and bool(re.search(r'\d{1,6}', numero_actual)))
 
         # Si no se encontró número válido y OCR está disponible, intentar con OCR
-        if not tiene_numero_valido and OCR_DISPONIBLE:
+        if not tiene_numero_valido and ocr_disponible():
             print(f"Número de oficio incompleto o no encontrado: '{numero_actual}', intentando OCR...")
             numero_ocr = extraer_numero_con_ocr(ruta_archivo)
             if numero_ocr:
@@ -796,8 +813,9 @@ def extraer_texto_pdf(ruta: str) -> str:
     """
     Extrae texto de un archivo PDF usando pdfplumber (mejor extracción).
     """
+    import pdfplumber
     texto = ""
-    with pdfplumber.open(ruta) as pdf:
+    with medir_etapa("pdfplumber"), pdfplumber.open(ruta) as pdf:
         for page in pdf.pages:
             texto += page.extract_text() or ""
     return texto
@@ -808,7 +826,7 @@ def extraer_texto_pdf(ruta: str) -> str:
 # ============================================
 
 @app.post("/api/documentos/{documento_id}/adjuntos", response_model=AdjuntoResponse)
-async def agregar_adjunto(
+def agregar_adjunto(
     documento_id: int,
     archivo: UploadFile = File(None),
     enlace_drive: str = Query(None),
@@ -844,6 +862,7 @@ async def agregar_adjunto(
         raise HTTPException(status_code=400, detail="Se requiere archivo o enlace Drive")
 
     adjunto = Adjunto(**adjunto_data)
+    almacenamiento.registrar_archivo(adjunto, UPLOAD_DIR, admin.get("sub"))
     db.add(adjunto)
     db.commit()
     db.refresh(adjunto)
@@ -1031,7 +1050,7 @@ def eliminar_contrato(
 
 
 @app.post("/api/contratos/{contrato_id}/asociar-archivo")
-async def asociar_archivo_contrato(
+def asociar_archivo_contrato(
     contrato_id: int,
     nombre_temporal: str = Query(..., description="Nombre del archivo temporal a asociar"),
     db: Session = Depends(get_db),
@@ -1062,6 +1081,7 @@ async def asociar_archivo_contrato(
 
     contrato.archivo_local = nuevo_nombre
     contrato.updated_at = datetime.utcnow()
+    almacenamiento.registrar_archivo(contrato, UPLOAD_DIR, admin.get("sub"))
     db.commit()
 
     return {
@@ -1072,7 +1092,7 @@ async def asociar_archivo_contrato(
 
 
 @app.post("/api/contratos/{contrato_id}/adjuntos", response_model=AdjuntoContratoResponse)
-async def agregar_adjunto_contrato(
+def agregar_adjunto_contrato(
     contrato_id: int,
     archivo: UploadFile = File(None),
     enlace_drive: str = Query(None),
@@ -1104,6 +1124,7 @@ async def agregar_adjunto_contrato(
         raise HTTPException(status_code=400, detail="Se requiere archivo o enlace Drive")
 
     adjunto = AdjuntoContrato(**adjunto_data)
+    almacenamiento.registrar_archivo(adjunto, UPLOAD_DIR, admin.get("sub"))
     db.add(adjunto)
     db.commit()
     db.refresh(adjunto)
@@ -1136,47 +1157,240 @@ def eliminar_adjunto_contrato(
 # ============================================
 
 @app.post("/api/restaurar-uploads")
-async def restaurar_uploads(
+def restaurar_uploads(
     archivo: UploadFile = File(...),
+    manifiesto: Optional[UploadFile] = File(None),
+    db: Session = Depends(get_db),
     admin: dict = Depends(verificar_admin)
 ):
     """
-    Restaura archivos de uploads desde un ZIP.
-    Solo admin puede usar este endpoint.
+    Restaura archivos de uploads desde un ZIP, incluidas subcarpetas como plantillas/
+    (nunca sobrescribe). Solo admin puede usar este endpoint. El ZIP se guarda en disco de
+    a bloques y se extrae en segundo plano: el avance y el resultado se consultan en
+    /api/trabajos/{trabajo_id}. `manifiesto` (opcional, o manifiesto.json dentro del ZIP)
+    trae el sha256 de cada archivo para verificarlo: con manifiesto se restaura todo lo
+    listado (cualquier extensión) y sin él solo PDF y .docx.
     """
     import zipfile
-    import io
 
     if not archivo.filename.lower().endswith('.zip'):
         raise HTTPException(status_code=400, detail="Solo se permiten archivos ZIP")
 
-    # Leer el ZIP
-    contenido = await archivo.read()
+    ruta_manifiesto = None
+    if manifiesto is not None:
+        datos_manifiesto = manifiesto.file.read()
+        try:
+            restauracion.leer_manifiesto(datos_manifiesto)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
 
     try:
-        archivos_restaurados = []
-        with zipfile.ZipFile(io.BytesIO(contenido), 'r') as zip_ref:
-            for nombre in zip_ref.namelist():
-                # Ignorar directorios y archivos ocultos
-                if nombre.endswith('/') or nombre.startswith('.') or '/' in nombre:
-                    continue
-
-                # Extraer solo archivos PDF
-                if nombre.lower().endswith('.pdf'):
-                    ruta_destino = os.path.join(UPLOAD_DIR, nombre)
-                    # Solo extraer si no existe (no sobrescribir)
-                    if not os.path.exists(ruta_destino):
-                        with zip_ref.open(nombre) as src, open(ruta_destino, 'wb') as dst:
-                            dst.write(src.read())
-                        archivos_restaurados.append(nombre)
-
-        return {
-            "mensaje": f"Restauración completada",
-            "archivos_restaurados": len(archivos_restaurados),
-            "lista": archivos_restaurados[:20]  # Mostrar máximo 20
-        }
+        ruta_zip = restauracion.guardar_zip(archivo.file, os.path.basename(archivo.filename))
     except zipfile.BadZipFile:
         raise HTTPException(status_code=400, detail="Archivo ZIP inválido")
+    if manifiesto is not None:
+        ruta_manifiesto = ruta_zip + ".manifiesto.json"
+        with open(ruta_manifiesto, "wb") as f:
+            f.write(datos_manifiesto)
+
+    trabajo_id = trabajos.encolar(db, "restaurar_uploads", {
+        "zip": ruta_zip,
+        "manifiesto": ruta_manifiesto,
+        "upload_dir": UPLOAD_DIR,
+    }, admin.get("sub"))
+    return {"mensaje": "Restauración encolada", "trabajo_id": trabajo_id}
+
+
+# ============================================
+# ENDPOINTS DE EXPORTACIÓN DE UPLOADS
+# ============================================
+
+def _respuesta_exportacion(request: Request, formato: str, previo: Optional[dict] = None,
+                           desde: Optional[datetime] = None):
+    try:
+        archivo, media_type, resumen = exportacion.exportar(UPLOAD_DIR, formato, previo, desde)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    tipo = "incremental" if previo is not None or desde is not None else "completo"
+    respuesta = _respuesta_archivo(request, archivo, f"uploads_{tipo}_{datetime.now():%Y%m%d}.{formato}",
+                                   media_type)
+    respuesta.headers["X-Exportacion-Archivos"] = str(resumen["incluidos"])
+    respuesta.headers["X-Exportacion-Total"] = str(resumen["total"])
+    return respuesta
+
+
+@app.get("/api/exportar-uploads")
+def exportar_uploads(
+    request: Request,
+    formato: str = Query("zip", description="zip o tar"),
+    desde: Optional[datetime] = Query(None, description="Solo archivos modificados desde esta fecha (ISO)"),
+    admin: dict = Depends(verificar_admin)
+):
+    """
+    Descarga todos los uploads en un ZIP o tar generado al vuelo, con manifiesto.json
+    (sha256 de cada archivo, se puede restaurar con /api/restaurar-uploads).
+    Admite Range para reanudar. Con `desde` la exportación es incremental por fecha.
+    """
+    return _respuesta_exportacion(request, formato, desde=desde)
+
+
+@app.post("/api/exportar-uploads")
+def exportar_uploads_incremental(
+    request: Request,
+    manifiesto: UploadFile = File(...),
+    formato: str = Query("zip", description="zip o tar"),
+    admin: dict = Depends(verificar_admin)
+):
+    """
+    Exportación incremental: recibe el manifiesto.json de la exportación anterior y
+    devuelve solo los archivos nuevos o modificados, con un manifiesto que lista además
+    el inventario completo (para la siguiente) y los archivos eliminados.
+    """
+    try:
+        previo = exportacion.leer_manifiesto_previo(manifiesto.file.read())
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return _respuesta_exportacion(request, formato, previo=previo)
+
+
+# ============================================
+# CONCILIACIÓN DE UPLOADS
+# ============================================
+
+@app.get("/api/conciliacion-uploads")
+def ultima_conciliacion(admin: dict = Depends(verificar_admin)):
+    """
+    Reporte de la última conciliación: archivos y bytes en uploads, temporales y huérfanos
+    eliminados, huérfanos pendientes y referencias a archivos inexistentes.
+    """
+    reporte = conciliacion.ultimo_reporte()
+    if reporte is None:
+        raise HTTPException(status_code=404, detail="Todavía no se ejecutó ninguna conciliación")
+    return reporte
+
+
+@app.post("/api/conciliacion-uploads")
+def conciliar_uploads(
+    simular: bool = Query(False, description="Solo reportar, sin borrar archivos"),
+    db: Session = Depends(get_db),
+    admin: dict = Depends(verificar_admin)
+):
+    """Encola una conciliación de uploads; el avance se consulta en /api/trabajos/{trabajo_id}."""
+    trabajo_id = trabajos.encolar(db, "conciliar_uploads", {
+        "upload_dir": UPLOAD_DIR,
+        "simular": simular,
+    }, admin.get("sub"))
+    return {"mensaje": "Conciliación encolada", "trabajo_id": trabajo_id}
+
+
+# ============================================
+# USO DE ALMACENAMIENTO
+# ============================================
+
+@app.get("/api/almacenamiento/uso")
+def uso_almacenamiento(db: Session = Depends(get_db), admin: dict = Depends(verificar_admin)):
+    """
+    Archivos, bytes y páginas por entidad (documentos, adjuntos, contratos, expediente,
+    seguimiento), según los metadatos guardados al subir cada archivo.
+    """
+    return almacenamiento.uso_por_entidad(db)
+
+
+@app.get("/api/almacenamiento/uso-mensual")
+def uso_almacenamiento_mensual(
+    entidad: Optional[str] = Query(None, description="Filtrar por entidad"),
+    db: Session = Depends(get_db),
+    admin: dict = Depends(verificar_admin)
+):
+    """Uso por mes de subida, con el detalle por entidad."""
+    try:
+        return almacenamiento.uso_por_mes(db, entidad)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@app.get("/api/almacenamiento/uso-por-usuario")
+def uso_almacenamiento_por_usuario(db: Session = Depends(get_db), admin: dict = Depends(verificar_admin)):
+    """Uso por usuario que subió los archivos, de mayor a menor."""
+    return almacenamiento.uso_por_usuario(db)
+
+
+# ============================================
+# OPTIMIZACIÓN DE PDFs
+# ============================================
+
+@app.get("/api/optimizacion-pdf")
+def resumen_optimizacion_pdf(db: Session = Depends(get_db), admin: dict = Depends(verificar_admin)):
+    """Bytes ahorrados por el optimizador, totales por estado y los últimos PDF procesados."""
+    return optimizacion.resumen_optimizaciones(db)
+
+
+@app.post("/api/optimizacion-pdf")
+def optimizar_pdfs(
+    dias: Optional[float] = Query(None, ge=0, description="Antigüedad mínima (por defecto OPTIMIZAR_PDF_DIAS)"),
+    limite: int = Query(optimizacion.OPTIMIZAR_PDF_LOTE, ge=1, le=10000),
+    db: Session = Depends(get_db),
+    admin: dict = Depends(verificar_admin)
+):
+    """
+    Encola la optimización de PDFs antiguos (imágenes reducidas, objetos duplicados
+    eliminados); el avance se consulta en /api/trabajos/{trabajo_id}.
+    """
+    if dias is None and optimizacion.OPTIMIZAR_PDF_DIAS <= 0:
+        raise HTTPException(status_code=400, detail="Optimizador desactivado: indicar 'dias' o configurar OPTIMIZAR_PDF_DIAS")
+    trabajo_id = trabajos.encolar(db, "optimizar_pdfs", {
+        "upload_dir": UPLOAD_DIR,
+        "dias": dias,
+        "limite": limite,
+    }, admin.get("sub"))
+    return {"mensaje": "Optimización encolada", "trabajo_id": trabajo_id}
+
+
+# ============================================
+# MINIATURAS
+# ============================================
+
+def _redirigir_a_miniatura(archivo_local: Optional[str]):
+    """
+    Redirige a la URL inmutable de la miniatura (por hash del contenido). La redirección
+    se cachea poco: si el archivo se reemplaza, la miniatura nueva tiene otra URL.
+    Si todavía no existe se genera en segundo plano y se responde 202 con Retry-After:
+    el threadpool de los requests no espera renderizados.
+    """
+    ruta = os.path.join(UPLOAD_DIR, archivo_local) if archivo_local else None
+    if not ruta or not os.path.isfile(ruta):
+        raise HTTPException(status_code=404, detail="El documento no tiene archivo")
+    estado, clave = miniaturas.consultar_miniatura(ruta)
+    if estado == "pendiente":
+        return Response(status_code=202, headers={"Retry-After": "2", "Cache-Control": "no-store"})
+    if clave is None:
+        raise HTTPException(status_code=404, detail="No se pudo generar la vista previa")
+    return RedirectResponse(f"/api/miniaturas/{clave}", status_code=302,
+                            headers={"Cache-Control": "public, max-age=60"})
+
+
+@app.get("/api/documentos/{documento_id}/miniatura")
+def miniatura_documento(documento_id: int, db: Session = Depends(get_db)):
+    """Vista previa de la primera página del archivo del documento."""
+    archivo_local = db.query(Documento.archivo_local).filter(Documento.id == documento_id).scalar()
+    return _redirigir_a_miniatura(archivo_local)
+
+
+@app.get("/api/expediente/{item_id}/miniatura")
+def miniatura_expediente(item_id: int, db: Session = Depends(get_db)):
+    """Vista previa de la primera página de un documento del expediente."""
+    archivo_local = db.query(ExpedienteContrato.archivo_local).filter(ExpedienteContrato.id == item_id).scalar()
+    return _redirigir_a_miniatura(archivo_local)
+
+
+@app.get("/api/miniaturas/{clave}")
+def servir_miniatura(clave: str):
+    """Miniatura por hash del contenido: nunca cambia, se cachea un año."""
+    ruta = miniaturas.ruta_miniatura(clave)
+    if ruta is None:
+        raise HTTPException(status_code=404, detail="Miniatura no encontrada")
+    return FileResponse(ruta, media_type=miniaturas.MIME_IMAGEN[clave.rsplit(".", 1)[1]],
+                        headers={"Cache-Control": "public, max-age=31536000, immutable"})
 
 
 # ============================================
@@ -1189,6 +1403,102 @@ def health_check():
     return {"status": "ok", "timestamp": datetime.utcnow().isoformat()}
 
 
+@app.get("/metrics", response_class=PlainTextResponse, include_in_schema=False)
+def metrics_endpoint(authorization: Optional[str] = Header(None)):
+    """
+    Métricas en formato texto de Prometheus.
+    Si METRICS_TOKEN está configurado, exige 'Authorization: Bearer <METRICS_TOKEN>'.
+    """
+    token_metricas = os.getenv("METRICS_TOKEN")
+    if token_metricas and authorization != f"Bearer {token_metricas}":
+        raise HTTPException(status_code=401, detail="No autorizado")
+    return PlainTextResponse(metricas.exponer(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+# ============================================
+# PERFILES DE REQUESTS
+# ============================================
+
+@app.get("/api/perfiles")
+def listar_perfiles(admin: dict = Depends(verificar_admin)):
+    """
+    Lista los perfiles guardados (más recientes primero).
+    Un request se perfila enviando el header 'X-Perfilar: 1' junto con el token;
+    la respuesta trae el id del perfil en 'X-Perfil-Id'.
+    """
+    return perfiles.listar()
+
+
+@app.get("/api/perfiles/{perfil_id}")
+def obtener_perfil(
+    perfil_id: str,
+    formato: str = Query("speedscope", pattern="^(speedscope|colapsado)$"),
+    admin: dict = Depends(verificar_admin)
+):
+    """
+    Descarga un perfil. 'speedscope' se abre en https://www.speedscope.app;
+    'colapsado' es el formato de pilas colapsadas de flamegraph.pl.
+    """
+    perfil = perfiles.obtener(perfil_id)
+    if not perfil:
+        raise HTTPException(status_code=404, detail="Perfil no encontrado")
+
+    if formato == "colapsado":
+        return PlainTextResponse(perfil.colapsado())
+    return JSONResponse(
+        perfil.speedscope(),
+        headers={"Content-Disposition": f'attachment; filename="perfil_{perfil.id}.speedscope.json"'}
+    )
+
+
+# ============================================
+# TRABAJOS EN SEGUNDO PLANO
+# ============================================
+
+@app.get("/api/trabajos/{trabajo_id}")
+def obtener_trabajo(
+    trabajo_id: int,
+    db: Session = Depends(get_db),
+    admin: dict = Depends(verificar_admin)
+):
+    """Estado de un trabajo en segundo plano (pendiente, en_curso, completado o error)."""
+    trabajo = trabajos.obtener(db, trabajo_id)
+    if not trabajo:
+        raise HTTPException(status_code=404, detail="Trabajo no encontrado")
+    return trabajo
+
+
+# ============================================
+# RESPALDOS
+# ============================================
+
+@app.get("/api/respaldos")
+def listar_respaldos_endpoint(admin: dict = Depends(verificar_admin)):
+    """Respaldos guardados (más recientes primero), con tiempos de copia y compresión."""
+    return listar_respaldos()
+
+
+@app.post("/api/respaldos")
+def crear_respaldo_endpoint(
+    db: Session = Depends(get_db),
+    admin: dict = Depends(verificar_admin)
+):
+    """Encola un respaldo en caliente; el avance se consulta en /api/trabajos/{trabajo_id}."""
+    if not ES_SQLITE:
+        raise HTTPException(status_code=400, detail="Los respaldos en caliente solo aplican a SQLite")
+    trabajo_id = trabajos.encolar(db, "respaldo", {"motivo": "manual", "usuario": admin.get("sub")}, admin.get("sub"))
+    return {"trabajo_id": trabajo_id}
+
+
+@app.get("/api/respaldos/{nombre}")
+def descargar_respaldo(nombre: str, admin: dict = Depends(verificar_admin)):
+    """Descarga un respaldo comprimido."""
+    ruta = ruta_respaldo(nombre)
+    if not ruta:
+        raise HTTPException(status_code=404, detail="Respaldo no encontrado")
+    return FileResponse(ruta, media_type="application/gzip", filename=nombre)
+
+
 # ============================================
 # ENDPOINT EXTRAER REFERENCIA DESDE PDF
 # ============================================
@@ -1234,9 +1544,10 @@ async def extraer_referencia_pdf(
             raise HTTPException(status_code=400, detail="Se requiere 'archivo' o 'documento_id'")
 
         # Extraer solo primera página
+        import pdfplumber
         texto_primera_pagina = ""
         try:
-            with pdfplumber.open(ruta_pdf) as pdf:
+            with medir_etapa("pdfplumber"), pdfplumber.open(ruta_pdf) as pdf:
                 if pdf.pages:
                     texto_primera_pagina = pdf.pages[0].extract_text() or ""
         except Exception as e:
@@ -1263,12 +1574,13 @@ Responde ÚNICAMENTE con JSON sin markdown:
 TEXTO DEL DOCUMENTO:
 {texto_primera_pagina[:2000]}"""
 
-        response = client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[{"role": "user", "content": prompt}],
-            temperature=0.1,
-            max_tokens=200,
-        )
+        with medir_etapa("openai"):
+            response = client.chat.completions.create(
+                model="gpt-4o-mini",
+                messages=[{"role": "user", "content": prompt}],
+                temperature=0.1,
+                max_tokens=200,
+            )
         raw = response.choices[0].message.content.strip()
         if raw.startswith("```"):
             raw = re.sub(r'^```[a-z]*\n?', '', raw)
@@ -1380,6 +1692,90 @@ def listar_expediente_contrato(
     return items
 
 
+def _respuesta_archivo(request: Request, archivo: ZipEnStreaming, nombre_descarga: str,
+                       media_type: str = "application/zip"):
+    """
+    Respuesta en streaming de un ZipEnStreaming (o TarEnStreaming) con ETag y soporte de
+    Range (un tramo), para que los gestores de descargas puedan reanudar.
+    """
+    etag = archivo.etag()
+    headers = {
+        "Accept-Ranges": "bytes",
+        "ETag": etag,
+        "Content-Disposition": f'attachment; filename="{nombre_descarga}"',
+    }
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+
+    rango = None
+    if_range = request.headers.get("if-range")
+    if if_range is None or if_range == etag:
+        try:
+            rango = parsear_rango(request.headers.get("range"), archivo.tamano)
+        except ValueError:
+            return Response(status_code=416, headers={**headers, "Content-Range": f"bytes */{archivo.tamano}"})
+
+    if rango is None:
+        headers["Content-Length"] = str(archivo.tamano)
+        return StreamingResponse(archivo.generar(), media_type=media_type, headers=headers)
+    inicio, fin = rango
+    headers["Content-Length"] = str(fin - inicio + 1)
+    headers["Content-Range"] = f"bytes {inicio}-{fin}/{archivo.tamano}"
+    return StreamingResponse(archivo.generar(inicio, fin), status_code=206,
+                             media_type=media_type, headers=headers)
+
+
+@app.get("/api/contratos/{contrato_id}/expediente/zip")
+def descargar_expediente_zip(
+    contrato_id: int,
+    request: Request,
+    db: Session = Depends(get_db)
+):
+    """
+    Descarga el expediente completo en un ZIP generado al vuelo: archivo del contrato,
+    adjuntos, documentos del expediente y cartas generadas, con un índice CSV.
+    """
+    contrato = db.query(Contrato).filter(Contrato.id == contrato_id).first()
+    if not contrato:
+        raise HTTPException(status_code=404, detail="Contrato no encontrado")
+    archivo_zip = zip_expediente(db, contrato, UPLOAD_DIR)
+    nombre = re.sub(r'[^\w\-]', '_', contrato.numero or str(contrato.id))
+    return _respuesta_archivo(request, archivo_zip, f"expediente_{nombre}.zip")
+
+
+@app.post("/api/contratos/{contrato_id}/dossier")
+def solicitar_dossier_expediente(
+    contrato_id: int,
+    db: Session = Depends(get_db),
+    admin: dict = Depends(verificar_admin)
+):
+    """
+    Pide el dossier PDF del expediente (todos los PDF unidos, con índice y numeración).
+    Si está al día retorna estado 'listo'; si no, encola su generación y retorna el
+    trabajo_id para consultar en /api/trabajos/{trabajo_id}.
+    """
+    plan = dossier_service.preparar_expediente(db, contrato_id, UPLOAD_DIR)
+    if plan is None:
+        raise HTTPException(status_code=404, detail="Contrato no encontrado")
+    return dossier_service.solicitar(db, plan, UPLOAD_DIR, admin.get("sub"))
+
+
+@app.get("/api/contratos/{contrato_id}/dossier")
+def descargar_dossier_expediente(contrato_id: int, db: Session = Depends(get_db)):
+    """Descarga el dossier PDF del expediente si está generado para los documentos actuales."""
+    plan = dossier_service.preparar_expediente(db, contrato_id, UPLOAD_DIR)
+    if plan is None:
+        raise HTTPException(status_code=404, detail="Contrato no encontrado")
+    return _respuesta_dossier(plan)
+
+
+def _respuesta_dossier(plan: dict):
+    ruta = dossier_service.dossier_disponible(plan)
+    if not ruta:
+        raise HTTPException(status_code=404, detail="El dossier no está generado o los documentos cambiaron; solicitarlo con POST")
+    return FileResponse(ruta, media_type="application/pdf", filename=f"dossier_{plan['sujeto']}.pdf")
+
+
 @app.post("/api/contratos/{contrato_id}/expediente", response_model=ExpedienteContratoResponse)
 def crear_expediente_contrato(
     contrato_id: int,
@@ -1406,9 +1802,12 @@ def crear_expediente_contrato(
         enlace_drive=data.enlace_drive,
         notas=data.notas,
     )
+    almacenamiento.registrar_archivo(item, UPLOAD_DIR, admin.get("sub"))
     db.add(item)
     db.commit()
     db.refresh(item)
+    if archivo_local:
+        miniaturas.precalentar(os.path.join(UPLOAD_DIR, archivo_local))
     return item
 
 
@@ -1430,6 +1829,8 @@ def actualizar_expediente(
             if os.path.exists(ruta_anterior):
                 os.remove(ruta_anterior)
         item.archivo_local = _mover_archivo_expediente(data.archivo_temporal, item.contrato_id)
+        almacenamiento.registrar_archivo(item, UPLOAD_DIR, admin.get("sub"))
+        miniaturas.precalentar(os.path.join(UPLOAD_DIR, item.archivo_local))
 
     update_data = data.model_dump(exclude_unset=True, exclude={'archivo_temporal'})
     for field, value in update_data.items():
@@ -1531,9 +1932,9 @@ def eliminar_plantilla(
 @app.get("/api/membrete")
 def get_membrete(db: Session = Depends(get_db)):
     """Retorna la ruta del membrete actual si existe."""
-    cfg = db.query(ConfiguracionSistema).filter(ConfiguracionSistema.clave == "membrete_archivo").first()
-    if cfg and cfg.valor:
-        return {"archivo": cfg.valor, "url": f"/uploads/{cfg.valor}"}
+    archivo = configuracion.obtener(db).membrete_archivo
+    if archivo:
+        return {"archivo": archivo, "url": f"/uploads/{archivo}"}
     return {"archivo": None, "url": None}
 
 
@@ -1548,9 +1949,9 @@ async def subir_membrete(
         raise HTTPException(status_code=400, detail="Solo se aceptan archivos .docx")
 
     # Eliminar membrete anterior si existe
-    cfg = db.query(ConfiguracionSistema).filter(ConfiguracionSistema.clave == "membrete_archivo").first()
-    if cfg and cfg.valor:
-        ruta_anterior = os.path.join(UPLOAD_DIR, cfg.valor)
+    anterior = configuracion.obtener(db).membrete_archivo
+    if anterior:
+        ruta_anterior = os.path.join(UPLOAD_DIR, anterior)
         if os.path.exists(ruta_anterior):
             os.remove(ruta_anterior)
 
@@ -1560,12 +1961,7 @@ async def subir_membrete(
     with open(ruta, "wb") as f:
         f.write(contenido)
 
-    if cfg:
-        cfg.valor = nombre_archivo
-    else:
-        cfg = ConfiguracionSistema(clave="membrete_archivo", valor=nombre_archivo)
-        db.add(cfg)
-    db.commit()
+    configuracion.guardar(db, membrete_archivo=nombre_archivo)
     return {"archivo": nombre_archivo, "url": f"/uploads/{nombre_archivo}"}
 
 
@@ -1575,25 +1971,22 @@ def eliminar_membrete(
     admin: dict = Depends(verificar_admin)
 ):
     """Elimina el membrete actual."""
-    cfg = db.query(ConfiguracionSistema).filter(ConfiguracionSistema.clave == "membrete_archivo").first()
-    if cfg and cfg.valor:
-        ruta = os.path.join(UPLOAD_DIR, cfg.valor)
+    archivo = configuracion.obtener(db).membrete_archivo
+    if archivo:
+        ruta = os.path.join(UPLOAD_DIR, archivo)
         if os.path.exists(ruta):
             os.remove(ruta)
-        cfg.valor = None
-        db.commit()
+        configuracion.guardar(db, membrete_archivo=None)
     return None
 
 
 @app.get("/api/configuracion/firma")
 def get_configuracion_firma(db: Session = Depends(get_db)):
-    def get_cfg(clave, default=""):
-        row = db.query(ConfiguracionSistema).filter(ConfiguracionSistema.clave == clave).first()
-        return row.valor if row and row.valor else default
-    archivo = get_cfg("firma_imagen")
+    cfg = configuracion.obtener(db)
+    archivo = cfg.firma_imagen or ""
     return {
-        "nombre": get_cfg("firma_nombre"),
-        "cargo": get_cfg("firma_cargo"),
+        "nombre": cfg.firma_nombre,
+        "cargo": cfg.firma_cargo,
         "imagen_archivo": archivo,
         "imagen_url": f"/uploads/{archivo}" if archivo else None,
     }
@@ -1605,16 +1998,7 @@ def guardar_configuracion_firma(
     db: Session = Depends(get_db),
     admin: dict = Depends(verificar_admin)
 ):
-    def set_cfg(clave, valor):
-        row = db.query(ConfiguracionSistema).filter(ConfiguracionSistema.clave == clave).first()
-        if row:
-            row.valor = str(valor)
-        else:
-            db.add(ConfiguracionSistema(clave=clave, valor=str(valor)))
-
-    set_cfg("firma_nombre", data.get("nombre", ""))
-    set_cfg("firma_cargo", data.get("cargo", ""))
-    db.commit()
+    configuracion.guardar(db, firma_nombre=data.get("nombre", ""), firma_cargo=data.get("cargo", ""))
     return {"ok": True}
 
 
@@ -1627,9 +2011,9 @@ async def subir_firma_imagen(
     if not archivo.filename.lower().endswith(('.png', '.jpg', '.jpeg')):
         raise HTTPException(status_code=400, detail="Solo se aceptan PNG o JPG")
 
-    cfg = db.query(ConfiguracionSistema).filter(ConfiguracionSistema.clave == "firma_imagen").first()
-    if cfg and cfg.valor:
-        ruta_anterior = os.path.join(UPLOAD_DIR, cfg.valor)
+    anterior = configuracion.obtener(db).firma_imagen
+    if anterior:
+        ruta_anterior = os.path.join(UPLOAD_DIR, anterior)
         if os.path.exists(ruta_anterior):
             os.remove(ruta_anterior)
 
@@ -1640,11 +2024,7 @@ async def subir_firma_imagen(
     with open(ruta, "wb") as f:
         f.write(contenido)
 
-    if cfg:
-        cfg.valor = nombre_archivo
-    else:
-        db.add(ConfiguracionSistema(clave="firma_imagen", valor=nombre_archivo))
-    db.commit()
+    configuracion.guardar(db, firma_imagen=nombre_archivo)
     return {"archivo": nombre_archivo, "url": f"/uploads/{nombre_archivo}"}
 
 
@@ -1653,26 +2033,22 @@ def eliminar_firma_imagen(
     db: Session = Depends(get_db),
     admin: dict = Depends(verificar_admin)
 ):
-    cfg = db.query(ConfiguracionSistema).filter(ConfiguracionSistema.clave == "firma_imagen").first()
-    if cfg and cfg.valor:
-        ruta = os.path.join(UPLOAD_DIR, cfg.valor)
+    archivo = configuracion.obtener(db).firma_imagen
+    if archivo:
+        ruta = os.path.join(UPLOAD_DIR, archivo)
         if os.path.exists(ruta):
             os.remove(ruta)
-        cfg.valor = None
-        db.commit()
+        configuracion.guardar(db, firma_imagen=None)
     return None
 
 
 @app.get("/api/configuracion/numeracion")
 def get_configuracion_numeracion(db: Session = Depends(get_db)):
     """Retorna la configuración de numeración de cartas."""
-    def get_cfg(clave, default):
-        row = db.query(ConfiguracionSistema).filter(ConfiguracionSistema.clave == clave).first()
-        return row.valor if row and row.valor else default
-
+    cfg = configuracion.obtener(db)
     return {
-        "sufijo": get_cfg("carta_sufijo", ""),
-        "digitos": int(get_cfg("carta_digitos", "6")),
+        "sufijo": cfg.valor("carta_sufijo"),
+        "digitos": cfg.carta_digitos,
     }
 
 
@@ -1683,16 +2059,7 @@ def guardar_configuracion_numeracion(
     admin: dict = Depends(verificar_admin)
 ):
     """Guarda la configuración de numeración de cartas."""
-    def set_cfg(clave, valor):
-        row = db.query(ConfiguracionSistema).filter(ConfiguracionSistema.clave == clave).first()
-        if row:
-            row.valor = str(valor)
-        else:
-            db.add(ConfiguracionSistema(clave=clave, valor=str(valor)))
-
-    set_cfg("carta_sufijo", data.get("sufijo", ""))
-    set_cfg("carta_digitos", str(data.get("digitos", 6)))
-    db.commit()
+    configuracion.guardar(db, carta_sufijo=data.get("sufijo", ""), carta_digitos=data.get("digitos", 6))
     return {"ok": True}
 
 
@@ -1700,21 +2067,13 @@ def guardar_configuracion_numeracion(
 # GENERADOR DE CARTAS CON IA
 # ============================================
 
-def _obtener_siguiente_numero_carta(db: Session) -> tuple:
+def _obtener_siguiente_numero_carta(db: Session, anio: int = None) -> tuple:
     """
-    Obtiene el siguiente número correlativo para una carta.
+    Obtiene el siguiente número correlativo para una carta (del año actual por defecto).
     Lee configuración de sufijo y dígitos desde configuracion_sistema.
     Retorna (numero_correlativo: int, numero_completo: str).
     """
-    anio = datetime.now().year
-
-    # Leer configuración
-    def get_cfg(clave, default):
-        row = db.query(ConfiguracionSistema).filter(ConfiguracionSistema.clave == clave).first()
-        return row.valor if row and row.valor else default
-
-    sufijo = get_cfg("carta_sufijo", "").strip()
-    digitos = int(get_cfg("carta_digitos", "6"))
+    anio = anio or datetime.now().year
 
     ultima = (
         db.query(CartaGenerada)
@@ -1723,14 +2082,7 @@ def _obtener_siguiente_numero_carta(db: Session) -> tuple:
         .first()
     )
     siguiente = (ultima.numero_correlativo + 1) if ultima else 1
-    correlativo_str = str(siguiente).zfill(digitos)
-
-    if sufijo:
-        numero_completo = f"Carta N° {correlativo_str}-{anio}-{sufijo}"
-    else:
-        numero_completo = f"Carta N° {correlativo_str}-{anio}"
-
-    return siguiente, numero_completo
+    return siguiente, configuracion.obtener(db).numero_carta(siguiente, anio)
 
 
 def _leer_plantilla_docx(ruta: str) -> str:
@@ -1838,15 +2190,16 @@ Genera:
 
     try:
         client = OpenAI(api_key=api_key)
-        response = client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[
-                {"role": "system", "content": prompt_sistema},
-                {"role": "user", "content": prompt_usuario}
-            ],
-            temperature=0.3,
-            max_tokens=1500,
-        )
+        with medir_etapa("openai"):
+            response = client.chat.completions.create(
+                model="gpt-4o-mini",
+                messages=[
+                    {"role": "system", "content": prompt_sistema},
+                    {"role": "user", "content": prompt_usuario}
+                ],
+                temperature=0.3,
+                max_tokens=1500,
+            )
         contenido = response.choices[0].message.content.strip()
         # Limpiar posibles bloques markdown
         if contenido.startswith("```"):
@@ -1869,6 +2222,7 @@ Genera:
     )
 
 
+@medir_etapa("docx")
 def _construir_docx_buffer(request: ExportarCartaRequest, db: Session):
     """
     Genera el .docx de una carta y lo retorna como BytesIO.
@@ -1884,17 +2238,12 @@ def _construir_docx_buffer(request: ExportarCartaRequest, db: Session):
     except ImportError:
         raise HTTPException(status_code=503, detail="python-docx no instalado.")
 
-    def get_cfg(clave, default=""):
-        row = db.query(ConfiguracionSistema).filter(ConfiguracionSistema.clave == clave).first()
-        return row.valor if row and row.valor else default
+    cfg = configuracion.obtener(db)
 
     # ── Abrir membrete como base (si existe), si no documento en blanco ──
-    cfg_membrete = db.query(ConfiguracionSistema).filter(
-        ConfiguracionSistema.clave == "membrete_archivo"
-    ).first()
     ruta_membrete = None
-    if cfg_membrete and cfg_membrete.valor:
-        ruta_membrete = os.path.join(UPLOAD_DIR, cfg_membrete.valor)
+    if cfg.membrete_archivo:
+        ruta_membrete = os.path.join(UPLOAD_DIR, cfg.membrete_archivo)
         if not os.path.exists(ruta_membrete):
             ruta_membrete = None
 
@@ -1965,9 +2314,9 @@ def _construir_docx_buffer(request: ExportarCartaRequest, db: Session):
     p_cierre.alignment = WD_ALIGN_PARAGRAPH.JUSTIFY
     agregar_parrafo("Atentamente,", space_after=0)
 
-    firma_imagen = get_cfg("firma_imagen")
-    firma_nombre = get_cfg("firma_nombre", "").strip()
-    firma_cargo  = get_cfg("firma_cargo", "").strip()
+    firma_imagen = cfg.firma_imagen
+    firma_nombre = cfg.firma_nombre.strip()
+    firma_cargo  = cfg.firma_cargo.strip()
 
     if firma_imagen:
         ruta_firma = os.path.join(UPLOAD_DIR, firma_imagen)
@@ -2047,10 +2396,11 @@ def _docx_a_pdf(ruta_docx: str, ruta_pdf: str) -> bool:
     try:
         import subprocess
         out_dir = os.path.dirname(ruta_pdf)
-        result = subprocess.run(
-            ['soffice', '--headless', '--convert-to', 'pdf', '--outdir', out_dir, ruta_docx],
-            capture_output=True, timeout=60
-        )
+        with medir_etapa("soffice"):
+            result = subprocess.run(
+                ['soffice', '--headless', '--convert-to', 'pdf', '--outdir', out_dir, ruta_docx],
+                capture_output=True, timeout=60
+            )
         # LibreOffice genera el PDF con el mismo nombre base del .docx
         nombre_base = os.path.splitext(os.path.basename(ruta_docx))[0]
         pdf_generado = os.path.join(out_dir, nombre_base + '.pdf')
@@ -2076,10 +2426,6 @@ def guardar_carta(
     - Si hay conflicto retorna 409 con el siguiente número disponible
     - Si OK: genera .docx + PDF, guarda en uploads, registra en documentos y expediente
     """
-    def get_cfg(clave, default=""):
-        row = db.query(ConfiguracionSistema).filter(ConfiguracionSistema.clave == clave).first()
-        return row.valor if row and row.valor else default
-
     m = re.search(r'(\d+)-(\d{4})', request.numero_carta)
     if not m:
         raise HTTPException(status_code=400, detail="Formato de número de carta no reconocido")
@@ -2092,17 +2438,7 @@ def guardar_carta(
     ).first()
 
     if existe:
-        ultima = (
-            db.query(CartaGenerada)
-            .filter(CartaGenerada.anio == anio)
-            .order_by(CartaGenerada.numero_correlativo.desc())
-            .first()
-        )
-        siguiente = (ultima.numero_correlativo + 1) if ultima else 1
-        digitos = int(get_cfg("carta_digitos", "6"))
-        sufijo = get_cfg("carta_sufijo", "").strip()
-        correlativo_str = str(siguiente).zfill(digitos)
-        numero_sugerido = f"Carta N° {correlativo_str}-{anio}-{sufijo}" if sufijo else f"Carta N° {correlativo_str}-{anio}"
+        numero_sugerido = _obtener_siguiente_numero_carta(db, anio)[1]
         raise HTTPException(
             status_code=409,
             detail=f"El número '{request.numero_carta}' ya existe. Número disponible: {numero_sugerido}"
@@ -2135,7 +2471,18 @@ def guardar_carta(
         estado='borrador',
     )
     db.add(nuevo_doc)
-    db.flush()  # Obtener nuevo_doc.id
+    try:
+        # Registrar el número antes de generar los archivos: así el lock de escritura de
+        # SQLite no queda tomado durante la conversión a PDF, y si otro worker guardó el
+        # mismo número en paralelo el índice único lo rechaza.
+        db.commit()
+    except IntegrityError:
+        db.rollback()
+        raise HTTPException(
+            status_code=409,
+            detail=f"El número '{request.numero_carta}' ya existe. "
+                   f"Número disponible: {_obtener_siguiente_numero_carta(db, anio)[1]}"
+        )
 
     # ── Generar y guardar .docx ──
     nombre_base = re.sub(r'[^\w\-]', '_', request.numero_carta.replace(' ', '_').replace('°', ''))
@@ -2159,6 +2506,7 @@ def guardar_carta(
     except Exception as e:
         print(f"Error generando archivos de carta: {e}")
         # Continuar sin archivos — la carta queda registrada igualmente
+    almacenamiento.registrar_archivo(nuevo_doc, UPLOAD_DIR, admin.get("sub"))
 
     # Registrar en expediente del contrato si hay contrato_id
     if contrato_id:
@@ -2172,6 +2520,7 @@ def guardar_carta(
                 asunto=request.asunto,
                 archivo_local=nombre_pdf if nuevo_doc.archivo_local else None,
             )
+            almacenamiento.registrar_archivo(expediente, UPLOAD_DIR, admin.get("sub"))
             db.add(expediente)
 
     db.commit()
@@ -2217,30 +2566,29 @@ def exportar_carta_docx(
 # SEGUIMIENTO LIQUIDACIÓN
 # ============================================
 
-CAMPOS_SIONO = {
-    'acta_revisada', 'acta_remitida_ugpe',
-    'mod_presentado_ne', 'mod_revisado_aprobado', 'mod_remitido_ugpe',
-    'amp_presentado_ne', 'amp_revisado_aprobado', 'amp_adenda_firmada', 'amp_remitido_ugpe',
-    'dossier_presentado_ne', 'dossier_revisado_aprobado', 'dossier_remitido_ugpe', 'dossier_remitido_pago',
-    'liq_presentado_ne', 'liq_revisado_aprobado', 'liq_remitido_pago',
-}
-
 def _color(hex_color):
+    from openpyxl.styles import PatternFill
     return PatternFill("solid", fgColor=hex_color)
 
 def _border():
+    from openpyxl.styles import Border, Side
     thin = Side(style='thin', color='000000')
     return Border(left=thin, right=thin, top=thin, bottom=thin)
 
 def _font(bold=False, color="000000", size=9):
+    from openpyxl.styles import Font
     return Font(bold=bold, color=color, size=size)
 
 def _align(horizontal="center", wrap=True):
+    from openpyxl.styles import Alignment
     return Alignment(horizontal=horizontal, vertical="center", wrap_text=wrap)
 
 @app.get("/api/seguimiento/exportar-excel")
+@medir_etapa("openpyxl")
 def exportar_seguimiento_excel(db: Session = Depends(get_db)):
     """Exporta la tabla de seguimiento como Excel. SI→✔ NO→✘ con formato condicional."""
+    import openpyxl
+    from openpyxl.utils import get_column_letter
     from openpyxl.styles.differential import DifferentialStyle
     from openpyxl.formatting.rule import Rule
 
@@ -2470,6 +2818,68 @@ def get_seguimiento(db: Session = Depends(get_db)):
     return db.query(SeguimientoComisaria).order_by(SeguimientoComisaria.numero).all()
 
 
+@app.get("/api/seguimiento/resumen", response_model=SeguimientoResumenResponse)
+def get_seguimiento_resumen(
+    comisaria_id: Optional[int] = Query(None, description="Resumen de una sola comisaría"),
+    db: Session = Depends(get_db)
+):
+    """
+    Resumen de avance de la liquidación (promedios de avance, monto pagado,
+    celdas SI por etapa y % de avance). Se lee de los agregados materializados,
+    sin recorrer la tabla de seguimiento. Público (igual que /api/seguimiento).
+    """
+    resumen = obtener_resumen(db, comisaria_id or 0)
+    if resumen is None:
+        if comisaria_id:
+            raise HTTPException(status_code=404, detail="Comisaría no encontrada")
+        inicializar_agregados(db)
+        resumen = obtener_resumen(db)
+    return resumen
+
+
+@app.post("/api/seguimiento/resumen/recalcular", response_model=SeguimientoResumenResponse)
+def recalcular_seguimiento_resumen(
+    db: Session = Depends(get_db),
+    admin: dict = Depends(verificar_admin)
+):
+    """Reconstruye los agregados desde la tabla de seguimiento. Requiere autenticación."""
+    recalcular_agregados(db)
+    return obtener_resumen(db)
+
+
+@app.get("/api/seguimiento/al-dia", response_model=List[SeguimientoComisariaResponse])
+def get_seguimiento_al_dia(
+    fecha: str = Query(..., description="Fecha de corte YYYY-MM-DD o YYYY-MM-DDTHH:MM:SS"),
+    db: Session = Depends(get_db)
+):
+    """
+    Reconstruye la grilla de seguimiento tal como estaba en una fecha pasada.
+    Una fecha sin hora se toma al cierre del día. Público (igual que /api/seguimiento).
+    """
+    try:
+        if len(fecha) <= 10:
+            fecha_corte = datetime.strptime(fecha, '%Y-%m-%d').replace(hour=23, minute=59, second=59)
+        else:
+            fecha_corte = datetime.fromisoformat(fecha)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Formato de fecha inválido (esperado YYYY-MM-DD)")
+    return reconstruir_grilla(db, fecha_corte)
+
+
+@app.get("/api/seguimiento/{comisaria_id}/historial", response_model=List[SeguimientoCambioResponse])
+def get_historial_comisaria(
+    comisaria_id: int,
+    campo: Optional[str] = Query(None, description="Filtrar por campo"),
+    limite: int = Query(200, ge=1, le=1000),
+    db: Session = Depends(get_db),
+    admin: dict = Depends(verificar_admin)
+):
+    """Historial de cambios de una comisaría (más reciente primero). Requiere autenticación."""
+    if campo and campo not in CODIGOS_CAMPO:
+        raise HTTPException(status_code=400, detail=f"Campo '{campo}' no existe")
+    return listar_historial(db, comisaria_id, campo, limite)
+
+
 @app.put("/api/seguimiento/{comisaria_id}/celda")
 def actualizar_celda(
     comisaria_id: int,
@@ -2483,15 +2893,13 @@ def actualizar_celda(
         raise HTTPException(status_code=404, detail="Comisaría no encontrada")
 
     campo = request.campo
-    if not hasattr(comisaria, campo):
+    if campo not in CODIGOS_CAMPO:
         raise HTTPException(status_code=400, detail=f"Campo '{campo}' no existe")
 
     valor_anterior = getattr(comisaria, campo)
+    aporte_antes = contribucion(comisaria)
 
     # Convertir el valor según el tipo del campo
-    CAMPOS_FECHA = {'fecha_fin_contractual', 'acta_fecha_firma'}
-    CAMPOS_FLOAT = {'avance_fisico', 'avance_programado', 'dossier_monto_pagado'}
-    CAMPOS_BOOL = {'dossier_monto_merge'}
     valor_convertido = request.valor
     if request.valor is not None and request.valor != '':
         if campo in CAMPOS_FECHA:
@@ -2509,11 +2917,18 @@ def actualizar_celda(
     elif request.valor == '':
         valor_convertido = None
 
+    ahora = datetime.now()
     setattr(comisaria, campo, valor_convertido)
-    comisaria.updated_at = datetime.now()
+    comisaria.updated_at = ahora
 
     nombre_usuario = payload.get("sub") or payload.get("username", "desconocido")
 
+    # Historial append-only de la celda (valor anterior y nuevo)
+    registrar_cambio(db, comisaria_id, campo, valor_anterior, valor_convertido, nombre_usuario, ahora)
+
+    # Agregados materializados: aplicar solo la diferencia de esta fila
+    agregados_ok = aplicar_delta_agregados(db, comisaria_id, aporte_antes, contribucion(comisaria))
+
     # Si cambia a SI y hay detalle, registrarlo
     if request.valor == 'SI' and campo in CAMPOS_SIONO:
         if request.observacion or request.enlace:
@@ -2523,17 +2938,19 @@ def actualizar_celda(
                 observacion=request.observacion,
                 enlace=request.enlace,
                 usuario=nombre_usuario,
-                fecha_actualizacion=datetime.now()
+                fecha_actualizacion=ahora
             )
             db.add(detalle)
 
     db.commit()
+    if not agregados_ok:
+        recalcular_agregados(db)
     db.refresh(comisaria)
     return {"ok": True, "valor_anterior": valor_anterior, "valor_nuevo": request.valor}
 
 
 @app.post("/api/seguimiento/{comisaria_id}/celda/{campo}/archivo")
-async def subir_archivo_celda(
+def subir_archivo_celda(
     comisaria_id: int,
     campo: str,
     archivo: UploadFile = File(...),
@@ -2551,7 +2968,7 @@ async def subir_archivo_celda(
     nombre_archivo = f"seg_{comisaria_id}_{campo}_{datetime.now().strftime('%Y%m%d%H%M%S')}{ext}"
     ruta = os.path.join(UPLOAD_DIR, nombre_archivo)
     with open(ruta, "wb") as f:
-        f.write(await archivo.read())
+        shutil.copyfileobj(archivo.file, f)
 
     nombre_usuario = payload.get("sub") or payload.get("username", "desconocido")
     detalle = SeguimientoCeldaDetalle(
@@ -2564,11 +2981,41 @@ async def subir_archivo_celda(
         usuario=nombre_usuario,
         fecha_actualizacion=datetime.now()
     )
+    almacenamiento.registrar_archivo(detalle, UPLOAD_DIR)
     db.add(detalle)
     db.commit()
     return {"ok": True, "archivo": nombre_archivo, "ruta": f"/uploads/{nombre_archivo}"}
 
 
+@app.post("/api/seguimiento/{comisaria_id}/dossier/{etapa}")
+def solicitar_dossier_seguimiento(
+    comisaria_id: int,
+    etapa: str,
+    db: Session = Depends(get_db),
+    admin: dict = Depends(verificar_admin)
+):
+    """Pide el dossier PDF de los archivos adjuntos a una etapa de la comisaría (ver dossier de expediente)."""
+    try:
+        plan = dossier_service.preparar_seguimiento(db, comisaria_id, etapa, UPLOAD_DIR)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if plan is None:
+        raise HTTPException(status_code=404, detail="Comisaría no encontrada")
+    return dossier_service.solicitar(db, plan, UPLOAD_DIR, admin.get("sub"))
+
+
+@app.get("/api/seguimiento/{comisaria_id}/dossier/{etapa}")
+def descargar_dossier_seguimiento(comisaria_id: int, etapa: str, db: Session = Depends(get_db)):
+    """Descarga el dossier PDF de una etapa si está generado para los archivos actuales."""
+    try:
+        plan = dossier_service.preparar_seguimiento(db, comisaria_id, etapa, UPLOAD_DIR)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if plan is None:
+        raise HTTPException(status_code=404, detail="Comisaría no encontrada")
+    return _respuesta_dossier(plan)
+
+
 # ============================================
 # SERVIR FRONTEND
 # ============================================
@@ -2738,12 +3185,13 @@ Responde SOLO con JSON:
         ]
         if req.historial:
             messages.extend(req.historial)
-        resp = client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=messages,
-            temperature=0.3,
-            max_tokens=300,
-        )
+        with medir_etapa("openai"):
+            resp = client.chat.completions.create(
+                model="gpt-4o-mini",
+                messages=messages,
+                temperature=0.3,
+                max_tokens=300,
+            )
         raw = resp.choices[0].message.content.strip()
         if raw.startswith("```"):
             raw = re.sub(r'^```[a-z]*\n?', '', raw)
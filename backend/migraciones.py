@@ -0,0 +1,252 @@
+"""
+Migraciones versionadas del esquema.
+Cada migración tiene un número de versión, se ejecuta una sola vez y queda registrada
+en la tabla schema_version con su duración. En una base al día el chequeo es una
+sola consulta (MAX(version)), sin importar el tamaño de las tablas.
+
+Reglas para agregar migraciones:
+- Agregar al final de MIGRACIONES con la versión siguiente; nunca renumerar ni editar
+  una migración ya publicada.
+- Deben ser idempotentes (una base nueva creada con create_all ya tiene las columnas).
+- Deben funcionar en SQLite y en PostgreSQL: usar el inspector de SQLAlchemy en lugar
+  de PRAGMA y ramificar por conn.dialect.name cuando el SQL no sea portable.
+
+Uso manual (desde backend/):
+    python migraciones.py            # aplica las pendientes
+    python migraciones.py --dry-run  # solo lista las pendientes
+"""
+import argparse
+import time
+from datetime import datetime
+
+from sqlalchemy import inspect, text
+
+
+# Expresión de búsqueda de texto completo en documentos (PostgreSQL). listar_documentos
+# usa exactamente la misma expresión para que el planificador use el índice GIN.
+TSVECTOR_DOCUMENTOS = (
+    "to_tsvector('spanish', coalesce(titulo, '') || ' ' || coalesce(asunto, '') || ' ' || "
+    "coalesce(remitente, '') || ' ' || coalesce(destinatario, ''))"
+)
+
+
+def _columnas(conn, tabla: str) -> set:
+    return {columna["name"] for columna in inspect(conn).get_columns(tabla)}
+
+
+def _agregar_columna(conn, tabla: str, columna: str, definicion: str):
+    """ALTER TABLE ... ADD COLUMN solo si la columna no existe."""
+    if columna not in _columnas(conn, tabla):
+        conn.execute(text(f"ALTER TABLE {tabla} ADD COLUMN {columna} {definicion}"))
+        print(f"Migración: columna {tabla}.{columna} agregada")
+
+
+# ============================================
+# MIGRACIONES
+# ============================================
+
+def _contratos_columnas(conn):
+    """Columnas agregadas a contratos después de la primera versión."""
+    columnas = [
+        ("ruc_contratado", "VARCHAR(11)"),
+        ("tipo_contrato", "VARCHAR(20)"),
+        ("precio_unitario", "REAL"),
+        ("plazo_dias", "INTEGER"),
+        ("dias_adicionales", "INTEGER DEFAULT 0"),
+        ("estado_ejecucion", "VARCHAR(30) DEFAULT 'PENDIENTE'"),
+        ("tipo_contratado", "VARCHAR(20) DEFAULT 'empresa'"),
+        ("nombre_representante", "VARCHAR(255)"),
+        ("cargo_representante", "VARCHAR(255)"),
+        ("email_representante", "VARCHAR(255)"),
+        ("whatsapp_representante", "VARCHAR(20)"),
+    ]
+    for columna, definicion in columnas:
+        _agregar_columna(conn, "contratos", columna, definicion)
+
+
+def _contratos_tipo_por_defecto(conn):
+    """Los contratos anteriores al campo tipo_contrato son de mantenimiento."""
+    result = conn.execute(text("UPDATE contratos SET tipo_contrato = 'mantenimiento' WHERE tipo_contrato IS NULL"))
+    if result.rowcount > 0:
+        print(f"Migración: {result.rowcount} contratos actualizados a tipo 'mantenimiento'")
+
+
+def _contratos_monto_total_numerico(conn):
+    """Convierte monto_total guardado como texto ('S/ 1,234.50') a número."""
+    if conn.dialect.name != "sqlite":
+        return  # Solo SQLite admite texto en una columna REAL (tipado dinámico)
+    conn.execute(text("""
+        UPDATE contratos
+        SET monto_total = CAST(
+            REPLACE(REPLACE(REPLACE(monto_total, 'S/', ''), ',', ''), ' ', '')
+            AS REAL
+        )
+        WHERE monto_total IS NOT NULL
+        AND monto_total != ''
+        AND typeof(monto_total) = 'text'
+    """))
+
+
+def _documentos_estado_y_docx(conn):
+    """Columnas estado y archivo_docx; los documentos existentes quedan como 'enviado'."""
+    _agregar_columna(conn, "documentos", "estado", "VARCHAR(20) DEFAULT 'enviado'")
+    _agregar_columna(conn, "documentos", "archivo_docx", "VARCHAR(500)")
+    result = conn.execute(text("UPDATE documentos SET estado='enviado' WHERE estado IS NULL"))
+    if result.rowcount > 0:
+        print(f"Migración: {result.rowcount} documentos existentes marcados como 'enviado'")
+
+
+def _seguimiento_monto_merge(conn):
+    _agregar_columna(conn, "seguimiento_comisaria", "dossier_monto_merge", "INTEGER NOT NULL DEFAULT 0")
+
+
+INDICE_CARTAS_CORRELATIVO = "uq_cartas_generadas_correlativo_anio"
+
+
+def indice_cartas_correlativo(conn) -> bool:
+    """
+    Crea el índice único (numero_correlativo, anio) de cartas_generadas si falta.
+    Si ya hay duplicados (la numeración anterior era max + 1 sin lock) no se renumeran,
+    porque esos números ya salieron impresos en cartas enviadas: se listan y el índice
+    queda sin crear hasta que se corrijan a mano. Retorna True si el índice existe.
+    """
+    if INDICE_CARTAS_CORRELATIVO in {i["name"] for i in inspect(conn).get_indexes("cartas_generadas")}:
+        return True
+    duplicados = conn.execute(text("""
+        SELECT numero_correlativo, anio, COUNT(*) FROM cartas_generadas
+        GROUP BY numero_correlativo, anio HAVING COUNT(*) > 1
+    """)).fetchall()
+    if duplicados:
+        detalle = ", ".join(f"{correlativo}-{anio} (x{n})" for correlativo, anio, n in duplicados)
+        print(f"AVISO: cartas_generadas tiene correlativos duplicados: {detalle}. "
+              f"No se crea el índice único {INDICE_CARTAS_CORRELATIVO} (se reintenta en cada "
+              f"arranque); hasta corregirlos, dos cartas guardadas a la vez pueden repetir número.")
+        return False
+    conn.execute(text(
+        f"CREATE UNIQUE INDEX IF NOT EXISTS {INDICE_CARTAS_CORRELATIVO} "
+        "ON cartas_generadas (numero_correlativo, anio)"
+    ))
+    return True
+
+
+def _cartas_correlativo_unico(conn):
+    """Índice único (numero_correlativo, anio) en cartas_generadas (omitido si hay duplicados)."""
+    indice_cartas_correlativo(conn)
+
+
+def _documentos_busqueda_texto(conn):
+    """Índice GIN para la búsqueda de texto completo en documentos (solo PostgreSQL)."""
+    if conn.dialect.name != "postgresql":
+        return
+    conn.execute(text(
+        f"CREATE INDEX IF NOT EXISTS ix_documentos_busqueda ON documentos USING GIN ({TSVECTOR_DOCUMENTOS})"
+    ))
+
+
+def _archivos_metadatos(conn):
+    """
+    Tamaño, páginas, tipo MIME y usuario de los archivos subidos. Las filas existentes
+    quedan en NULL y la conciliación de uploads las completa de a lotes.
+    """
+    for tabla in ("documentos", "adjuntos", "contratos", "adjuntos_contrato", "expediente_contrato",
+                  "seguimiento_celda_detalle"):
+        _agregar_columna(conn, tabla, "tamano_bytes", "BIGINT")
+        _agregar_columna(conn, tabla, "paginas", "INTEGER")
+        _agregar_columna(conn, tabla, "mime_tipo", "VARCHAR(100)")
+        if tabla != "seguimiento_celda_detalle":
+            _agregar_columna(conn, tabla, "subido_por", "VARCHAR(100)")
+
+
+def _trabajos_latido(conn):
+    """Latido de los trabajos en curso: se reencolan por latido vencido, no por antigüedad."""
+    _agregar_columna(conn, "trabajos", "latido_en", "TIMESTAMP")
+
+
+# (versión, nombre, función). Solo agregar al final.
+MIGRACIONES = [
+    (1, "contratos_columnas", _contratos_columnas),
+    (2, "contratos_tipo_por_defecto", _contratos_tipo_por_defecto),
+    (3, "contratos_monto_total_numerico", _contratos_monto_total_numerico),
+    (4, "documentos_estado_y_docx", _documentos_estado_y_docx),
+    (5, "seguimiento_monto_merge", _seguimiento_monto_merge),
+    (6, "cartas_correlativo_unico", _cartas_correlativo_unico),
+    (7, "documentos_busqueda_texto", _documentos_busqueda_texto),
+    (8, "archivos_metadatos", _archivos_metadatos),
+    (9, "trabajos_latido", _trabajos_latido),
+]
+VERSION_ACTUAL = MIGRACIONES[-1][0]
+
+
+# ============================================
+# EJECUTOR
+# ============================================
+
+def _crear_tabla_versiones(conn):
+    conn.execute(text("""
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY,
+            nombre VARCHAR(100) NOT NULL,
+            aplicada_en TIMESTAMP NOT NULL,
+            duracion_ms REAL NOT NULL
+        )
+    """))
+
+
+def migraciones_pendientes(engine) -> list:
+    """Migraciones aún no aplicadas, en orden (no modifica la base)."""
+    with engine.connect() as conn:
+        if not inspect(conn).has_table("schema_version"):
+            return list(MIGRACIONES)
+        version = conn.execute(text("SELECT MAX(version) FROM schema_version")).scalar() or 0
+        if version >= VERSION_ACTUAL:
+            return []
+        aplicadas = {fila[0] for fila in conn.execute(text("SELECT version FROM schema_version"))}
+    return [m for m in MIGRACIONES if m[0] not in aplicadas]
+
+
+def aplicar_migraciones(engine, dry_run: bool = False) -> list:
+    """
+    Aplica las migraciones pendientes, cada una en su propia transacción junto con su
+    registro en schema_version. Retorna [(version, nombre, duracion_ms)].
+    Con dry_run=True solo retorna las pendientes (duración None) sin ejecutarlas.
+    """
+    pendientes = migraciones_pendientes(engine)
+    if dry_run:
+        return [(version, nombre, None) for version, nombre, _ in pendientes]
+
+    aplicadas = []
+    if pendientes:
+        with engine.begin() as conn:
+            _crear_tabla_versiones(conn)
+    for version, nombre, funcion in pendientes:
+        inicio = time.perf_counter()
+        with engine.begin() as conn:
+            funcion(conn)
+            duracion_ms = (time.perf_counter() - inicio) * 1000
+            conn.execute(
+                text("INSERT INTO schema_version (version, nombre, aplicada_en, duracion_ms) "
+                     "VALUES (:version, :nombre, :aplicada_en, :duracion_ms)"),
+                {"version": version, "nombre": nombre, "aplicada_en": datetime.now(), "duracion_ms": duracion_ms}
+            )
+        print(f"Migración {version:03d} {nombre}: {duracion_ms:.1f} ms")
+        aplicadas.append((version, nombre, duracion_ms))
+    return aplicadas
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Aplica las migraciones pendientes del esquema")
+    parser.add_argument("--dry-run", action="store_true", help="Solo listar las migraciones pendientes")
+    args = parser.parse_args()
+
+    from database import engine, Base
+    import models  # noqa: F401 - registra los modelos en Base.metadata
+
+    if not args.dry_run:
+        Base.metadata.create_all(bind=engine)
+    resultado = aplicar_migraciones(engine, dry_run=args.dry_run)
+    if not resultado:
+        print(f"Esquema al día (versión {VERSION_ACTUAL})")
+    elif args.dry_run:
+        print("Migraciones pendientes:")
+        for version, nombre, _ in resultado:
+            print(f"  {version:03d} {nombre}")
@@ -2,7 +2,7 @@
 Modelos SQLAlchemy para el sistema de gestión de correspondencia
 """
 from datetime import datetime
-from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey, Enum, Float, Boolean
+from sqlalchemy import Column, Integer, BigInteger, SmallInteger, String, Text, DateTime, ForeignKey, Enum, Float, Boolean, Index, UniqueConstraint
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 import enum
@@ -45,6 +45,13 @@ class Documento(Base):
     archivo_local = Column(String(500), nullable=True)  # Ruta archivo subido (PDF)
     archivo_docx = Column(String(500), nullable=True)   # Ruta archivo Word (solo cartas IA)
 
+    # Metadatos de los archivos (ver almacenamiento_service): tamano_bytes suma el PDF y
+    # el .docx; paginas y mime_tipo son del archivo principal
+    tamano_bytes = Column(BigInteger, nullable=True)
+    paginas = Column(Integer, nullable=True)
+    mime_tipo = Column(String(100), nullable=True)
+    subido_por = Column(String(100), nullable=True)
+
     # Relación padre-hijo para respuestas
     documento_padre_id = Column(Integer, ForeignKey("documentos.id"), nullable=True)
 
@@ -72,6 +79,11 @@ class Adjunto(Base):
     nombre = Column(String(255), nullable=False)
     enlace_drive = Column(String(500), nullable=True)
     archivo_local = Column(String(500), nullable=True)
+    # Metadatos del archivo, registrados al subirlo (ver almacenamiento_service)
+    tamano_bytes = Column(BigInteger, nullable=True)
+    paginas = Column(Integer, nullable=True)
+    mime_tipo = Column(String(100), nullable=True)
+    subido_por = Column(String(100), nullable=True)
     created_at = Column(DateTime, server_default=func.now())
 
     # Relación
@@ -119,6 +131,11 @@ class Contrato(Base):
     resumen = Column(Text, nullable=True)
     archivo_local = Column(String(500), nullable=True)
     enlace_drive = Column(String(500), nullable=True)
+    # Metadatos del archivo, registrados al subirlo (ver almacenamiento_service)
+    tamano_bytes = Column(BigInteger, nullable=True)
+    paginas = Column(Integer, nullable=True)
+    mime_tipo = Column(String(100), nullable=True)
+    subido_por = Column(String(100), nullable=True)
     estado_ejecucion = Column(String(30), default='PENDIENTE')  # PENDIENTE, EN PROCESO, EN VALIDACIÓN, CONFORME
 
     # Datos del representante (para cartas)
@@ -168,6 +185,11 @@ class ExpedienteContrato(Base):
     archivo_local = Column(String(500), nullable=True)
     enlace_drive = Column(String(500), nullable=True)
     notas = Column(Text, nullable=True)
+    # Metadatos del archivo, registrados al subirlo (ver almacenamiento_service)
+    tamano_bytes = Column(BigInteger, nullable=True)
+    paginas = Column(Integer, nullable=True)
+    mime_tipo = Column(String(100), nullable=True)
+    subido_por = Column(String(100), nullable=True)
     created_at = Column(DateTime, server_default=func.now())
     updated_at = Column(DateTime, onupdate=func.now())
 
@@ -209,6 +231,10 @@ class CartaGenerada(Base):
     Permite llevar el correlativo propio de cartas independiente de otros documentos.
     """
     __tablename__ = "cartas_generadas"
+    __table_args__ = (
+        # Un correlativo por año: dos workers guardando el mismo número no pueden duplicarlo
+        Index("uq_cartas_generadas_correlativo_anio", "numero_correlativo", "anio", unique=True),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     numero_correlativo = Column(Integer, nullable=False)  # 1, 2, 3 ...
@@ -230,6 +256,11 @@ class AdjuntoContrato(Base):
     nombre = Column(String(255), nullable=False)
     enlace_drive = Column(String(500), nullable=True)
     archivo_local = Column(String(500), nullable=True)
+    # Metadatos del archivo, registrados al subirlo (ver almacenamiento_service)
+    tamano_bytes = Column(BigInteger, nullable=True)
+    paginas = Column(Integer, nullable=True)
+    mime_tipo = Column(String(100), nullable=True)
+    subido_por = Column(String(100), nullable=True)
     created_at = Column(DateTime, server_default=func.now())
 
     contrato = relationship("Contrato", back_populates="adjuntos")
@@ -299,12 +330,65 @@ class SeguimientoCeldaDetalle(Base):
     enlace = Column(String(500), nullable=True)
     archivo_local = Column(String(500), nullable=True)
     archivo_nombre = Column(String(255), nullable=True)
+    # Metadatos del archivo (quién lo subió está en `usuario`)
+    tamano_bytes = Column(BigInteger, nullable=True)
+    paginas = Column(Integer, nullable=True)
+    mime_tipo = Column(String(100), nullable=True)
     usuario = Column(String(100), nullable=False)
     fecha_actualizacion = Column(DateTime, default=datetime.utcnow, nullable=False)
 
     comisaria = relationship("SeguimientoComisaria", back_populates="detalles")
 
 
+class SeguimientoCambio(Base):
+    """
+    Historial append-only de cada escritura en una celda de seguimiento.
+    El campo se guarda como código entero (ver services/seguimiento_service.py)
+    y los valores como texto normalizado, para poder reconstruir la grilla
+    a cualquier fecha pasada.
+    """
+    __tablename__ = "seguimiento_cambios"
+    __table_args__ = (
+        Index("ix_seguimiento_cambios_comisaria_campo_fecha", "comisaria_id", "campo_codigo", "fecha"),
+    )
+
+    id = Column(Integer, primary_key=True)
+    comisaria_id = Column(Integer, ForeignKey("seguimiento_comisaria.id"), nullable=False)
+    campo_codigo = Column(SmallInteger, nullable=False)   # Código estable del campo (no cambiar)
+    valor_anterior = Column(Text, nullable=True)
+    valor_nuevo = Column(Text, nullable=True)
+    usuario = Column(String(100), nullable=False)
+    fecha = Column(DateTime, default=datetime.now, nullable=False, index=True)
+
+
+class SeguimientoAgregado(Base):
+    """
+    Agregados materializados del seguimiento, mantenidos de forma incremental
+    en cada actualización de celda.
+    Una fila por (comisaría, etapa); comisaria_id = 0 guarda el total general.
+    etapa: acta | mod | amp | dossier | liq | total
+    """
+    __tablename__ = "seguimiento_agregados"
+    __table_args__ = (
+        UniqueConstraint("comisaria_id", "etapa", name="uq_seguimiento_agregados_comisaria_etapa"),
+    )
+
+    id = Column(Integer, primary_key=True)
+    comisaria_id = Column(Integer, nullable=False, default=0)  # 0 = todas las comisarías
+    etapa = Column(String(20), nullable=False)
+    si = Column(Integer, nullable=False, default=0)            # Celdas en SI
+    aplicables = Column(Integer, nullable=False, default=0)    # Celdas distintas de NA / -
+    completas = Column(Integer, nullable=False, default=0)     # Comisarías con la etapa completa
+
+    # Solo se usan en las filas etapa = 'total'
+    n_comisarias = Column(Integer, nullable=False, default=0)
+    suma_avance_programado = Column(Float, nullable=False, default=0)
+    n_avance_programado = Column(Integer, nullable=False, default=0)
+    suma_avance_fisico = Column(Float, nullable=False, default=0)
+    n_avance_fisico = Column(Integer, nullable=False, default=0)
+    suma_monto_pagado = Column(Float, nullable=False, default=0)
+
+
 class RegistroMejora(Base):
     """Registro de Mejora Kaizen — captura estructurada de problemas y aprendizajes"""
     __tablename__ = "registros_mejora"
@@ -338,3 +422,73 @@ class RegistroMejora(Base):
     estado = Column(String(20), default='draft')      # draft | enviado
     created_at = Column(DateTime, server_default=func.now())
     updated_at = Column(DateTime, onupdate=func.now())
+
+
+class TokenRevocado(Base):
+    """Tokens JWT revocados por logout (SHA-256 del token), vigentes hasta su expiración."""
+    __tablename__ = "tokens_revocados"
+    # AUTOINCREMENT: los ids no se reutilizan al borrar vencidos (los workers leen por id)
+    __table_args__ = {"sqlite_autoincrement": True}
+
+    id = Column(Integer, primary_key=True)
+    digest = Column(String(64), unique=True, nullable=False)
+    expira = Column(Float, nullable=False)  # epoch del 'exp' del token
+
+
+class CubetaLimite(Base):
+    """Cubetas de tokens del límite de login compartidas entre workers."""
+    __tablename__ = "cubetas_limite"
+    __table_args__ = (
+        UniqueConstraint("cubeta", "clave", name="uq_cubetas_limite_cubeta_clave"),
+    )
+
+    id = Column(Integer, primary_key=True)
+    cubeta = Column(String(20), nullable=False)    # ip | usuario
+    clave = Column(String(255), nullable=False)
+    tokens = Column(Float, nullable=False)
+    actualizado = Column(Float, nullable=False)    # epoch de la última reposición
+
+
+class Trabajo(Base):
+    """
+    Cola de trabajos en segundo plano. Los workers reclaman trabajos pendientes
+    (FOR UPDATE SKIP LOCKED en PostgreSQL) y registran el resultado.
+    """
+    __tablename__ = "trabajos"
+    __table_args__ = (
+        Index("ix_trabajos_estado_id", "estado", "id"),
+    )
+
+    id = Column(Integer, primary_key=True)
+    tipo = Column(String(50), nullable=False)
+    parametros = Column(Text, nullable=True)       # JSON
+    estado = Column(String(20), nullable=False, default='pendiente')  # pendiente|en_curso|completado|error
+    intentos = Column(Integer, nullable=False, default=0)
+    resultado = Column(Text, nullable=True)        # JSON
+    error = Column(Text, nullable=True)
+    worker = Column(String(100), nullable=True)
+    creado_por = Column(String(100), nullable=True)
+    created_at = Column(DateTime, server_default=func.now())
+    iniciado_en = Column(DateTime, nullable=True)
+    latido_en = Column(DateTime, nullable=True)    # último latido del worker que lo ejecuta
+    terminado_en = Column(DateTime, nullable=True)
+
+
+class OptimizacionPdf(Base):
+    """
+    Registro de auditoría del optimizador de PDFs: hash y tamaño del original y del
+    resultado. Un archivo se procesa una sola vez.
+    """
+    __tablename__ = "optimizaciones_pdf"
+
+    id = Column(Integer, primary_key=True)
+    archivo = Column(String(500), unique=True, nullable=False)
+    estado = Column(String(20), nullable=False)     # optimizado | sin_ahorro | error
+    sha256_original = Column(String(64), nullable=True)
+    tamano_original = Column(BigInteger, nullable=True)
+    sha256_resultado = Column(String(64), nullable=True)
+    tamano_resultado = Column(BigInteger, nullable=True)
+    imagenes = Column(Integer, nullable=False, default=0)  # imágenes reducidas
+    cpu_ms = Column(Float, nullable=True)
+    detalle = Column(Text, nullable=True)
+    created_at = Column(DateTime, server_default=func.now())
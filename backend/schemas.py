@@ -423,6 +423,38 @@ class SeguimientoComisariaResponse(BaseModel):
         from_attributes = True
 
 
+class SeguimientoCambioResponse(BaseModel):
+    id: int
+    comisaria_id: int
+    campo: str
+    valor_anterior: Optional[str] = None
+    valor_nuevo: Optional[str] = None
+    usuario: str
+    fecha: datetime
+
+
+class SeguimientoEtapaResumen(BaseModel):
+    etapa: str
+    nombre: str
+    si: int
+    aplicables: int
+    porcentaje: Optional[float] = None
+    completas: int
+
+
+class SeguimientoResumenResponse(BaseModel):
+    comisaria_id: Optional[int] = None
+    n_comisarias: int
+    avance_programado_promedio: Optional[float] = None
+    avance_fisico_promedio: Optional[float] = None
+    monto_pagado_total: float
+    celdas_si: int
+    celdas_aplicables: int
+    porcentaje_avance: Optional[float] = None
+    comisarias_completas: int
+    etapas: List[SeguimientoEtapaResumen] = []
+
+
 class ActualizarCeldaRequest(BaseModel):
     campo: str
     valor: Optional[str] = None        # SI / NO / NA / - / None
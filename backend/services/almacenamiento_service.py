@@ -0,0 +1,182 @@
+"""
+Metadatos de los archivos subidos y uso de almacenamiento.
+- Al subir un archivo se guardan en su fila tamano_bytes, paginas (solo PDF), mime_tipo
+  y subido_por (registrar_archivo). Las filas anteriores a la migración 008 las completa
+  la conciliación de uploads, de a lotes (completar_metadatos).
+- Los agregados por entidad, mes y usuario son consultas sobre esas columnas: no
+  recorren UPLOAD_DIR, así que responden al instante aunque haya miles de archivos.
+"""
+import mimetypes
+import os
+import time
+from typing import Optional
+
+from sqlalchemy import func, or_
+from sqlalchemy.orm import Session
+
+from database import ES_POSTGRES
+from models import Documento, Adjunto, Contrato, AdjuntoContrato, ExpedienteContrato, SeguimientoCeldaDetalle
+
+# entidad -> (modelo, columna de fecha, columna de usuario)
+ENTIDADES = {
+    "documentos": (Documento, Documento.created_at, Documento.subido_por),
+    "adjuntos": (Adjunto, Adjunto.created_at, Adjunto.subido_por),
+    "contratos": (Contrato, Contrato.created_at, Contrato.subido_por),
+    "adjuntos_contrato": (AdjuntoContrato, AdjuntoContrato.created_at, AdjuntoContrato.subido_por),
+    "expediente": (ExpedienteContrato, ExpedienteContrato.created_at, ExpedienteContrato.subido_por),
+    "seguimiento": (SeguimientoCeldaDetalle, SeguimientoCeldaDetalle.fecha_actualizacion,
+                    SeguimientoCeldaDetalle.usuario),
+}
+
+MIME_PDF = "application/pdf"
+# Firmas de los formatos que se suben; el resto se deduce por la extensión
+_FIRMAS = [
+    (b"%PDF", MIME_PDF),
+    (b"\x89PNG", "image/png"),
+    (b"\xff\xd8\xff", "image/jpeg"),
+]
+SIN_USUARIO = "(sin registrar)"
+
+
+def tipo_mime(ruta: str) -> str:
+    with open(ruta, "rb") as f:
+        cabecera = f.read(8)
+    for firma, mime in _FIRMAS:
+        if cabecera.startswith(firma):
+            return mime
+    return mimetypes.guess_type(ruta)[0] or "application/octet-stream"
+
+
+def contar_paginas(ruta: str) -> Optional[int]:
+    """Páginas de un PDF (None si no se puede leer)."""
+    try:
+        from pypdf import PdfReader
+        return len(PdfReader(ruta, strict=False).pages)
+    except Exception:
+        return None
+
+
+def _archivos(fila) -> list:
+    return [n for n in (fila.archivo_local, getattr(fila, "archivo_docx", None)) if n]
+
+
+def registrar_archivo(fila, upload_dir: str, usuario: Optional[str] = None) -> bool:
+    """
+    Completa tamano_bytes, paginas y mime_tipo de la fila a partir de sus archivos
+    (archivo_local y, en documentos, archivo_docx), y subido_por si se indica.
+    Retorna False si la fila no tiene archivos en disco (no modifica nada).
+    """
+    tamano, principal = 0, None
+    for nombre in _archivos(fila):
+        ruta = os.path.join(upload_dir, nombre)
+        try:
+            tamano += os.path.getsize(ruta)
+        except OSError:
+            continue
+        principal = principal or ruta
+    if principal is None:
+        return False
+    fila.tamano_bytes = tamano
+    fila.mime_tipo = tipo_mime(principal)
+    fila.paginas = contar_paginas(principal) if fila.mime_tipo == MIME_PDF else None
+    if usuario and hasattr(fila, "subido_por"):
+        fila.subido_por = usuario
+    return True
+
+
+def _sin_metadatos(modelo):
+    condicion = modelo.archivo_local.isnot(None)
+    if hasattr(modelo, "archivo_docx"):
+        condicion = or_(condicion, modelo.archivo_docx.isnot(None))
+    return [modelo.tamano_bytes.is_(None), condicion]
+
+
+def completar_metadatos(db: Session, upload_dir: str, lote: int = 200, pausa_ms: float = 0) -> int:
+    """
+    Registra los metadatos de las filas con archivo y sin tamano_bytes, de a `lote` filas
+    (un commit y una pausa por lote). Las filas cuyo archivo no existe quedan en NULL.
+    Retorna cuántas se completaron.
+    """
+    completadas = 0
+    for modelo, _, _ in ENTIDADES.values():
+        ultimo_id = 0
+        while True:
+            filas = (
+                db.query(modelo)
+                .filter(*_sin_metadatos(modelo), modelo.id > ultimo_id)
+                .order_by(modelo.id.asc())
+                .limit(lote)
+                .all()
+            )
+            if not filas:
+                break
+            completadas += sum(1 for fila in filas if registrar_archivo(fila, upload_dir))
+            ultimo_id = filas[-1].id
+            db.commit()
+            if pausa_ms > 0:
+                time.sleep(pausa_ms / 1000)
+    return completadas
+
+
+def _mes(columna):
+    return func.to_char(columna, "YYYY-MM") if ES_POSTGRES else func.strftime("%Y-%m", columna)
+
+
+def _totales(archivos, tamano, paginas) -> dict:
+    return {"archivos": archivos or 0, "bytes": int(tamano or 0), "paginas": int(paginas or 0)}
+
+
+def uso_por_entidad(db: Session) -> dict:
+    """Archivos, bytes y páginas por entidad; `sin_metadatos` son las filas aún no completadas."""
+    entidades = []
+    for entidad, (modelo, _, _) in ENTIDADES.items():
+        archivos, tamano, paginas = db.query(
+            func.count(modelo.tamano_bytes), func.sum(modelo.tamano_bytes), func.sum(modelo.paginas)
+        ).one()
+        pendientes = db.query(func.count(modelo.id)).filter(*_sin_metadatos(modelo)).scalar()
+        entidades.append({"entidad": entidad, **_totales(archivos, tamano, paginas), "sin_metadatos": pendientes})
+    total = {k: sum(e[k] for e in entidades) for k in ("archivos", "bytes", "paginas", "sin_metadatos")}
+    return {"total": total, "entidades": entidades}
+
+
+def uso_por_mes(db: Session, entidad: Optional[str] = None) -> list:
+    """Uso por mes de subida (YYYY-MM), con el detalle en bytes por entidad."""
+    if entidad is not None and entidad not in ENTIDADES:
+        raise ValueError(f"Entidad no válida: {entidad} (usar {', '.join(ENTIDADES)})")
+    meses = {}
+    for nombre, (modelo, fecha, _) in ENTIDADES.items():
+        if entidad is not None and nombre != entidad:
+            continue
+        mes = _mes(fecha)
+        filas = (
+            db.query(mes, func.count(modelo.tamano_bytes), func.sum(modelo.tamano_bytes), func.sum(modelo.paginas))
+            .filter(modelo.tamano_bytes.isnot(None))
+            .group_by(mes)
+            .all()
+        )
+        for clave, archivos, tamano, paginas in filas:
+            fila = meses.setdefault(clave or "sin-fecha", {"mes": clave or "sin-fecha", "archivos": 0, "bytes": 0,
+                                                             "paginas": 0, "por_entidad": {}})
+            totales = _totales(archivos, tamano, paginas)
+            for k in ("archivos", "bytes", "paginas"):
+                fila[k] += totales[k]
+            fila["por_entidad"][nombre] = totales["bytes"]
+    return [meses[k] for k in sorted(meses)]
+
+
+def uso_por_usuario(db: Session) -> list:
+    """Uso por usuario que subió los archivos, de mayor a menor."""
+    usuarios = {}
+    for modelo, _, usuario in ENTIDADES.values():
+        filas = (
+            db.query(usuario, func.count(modelo.tamano_bytes), func.sum(modelo.tamano_bytes), func.sum(modelo.paginas))
+            .filter(modelo.tamano_bytes.isnot(None))
+            .group_by(usuario)
+            .all()
+        )
+        for nombre, archivos, tamano, paginas in filas:
+            fila = usuarios.setdefault(nombre or SIN_USUARIO, {"usuario": nombre or SIN_USUARIO,
+                                                              "archivos": 0, "bytes": 0, "paginas": 0})
+            for k, v in _totales(archivos, tamano, paginas).items():
+                fila[k] += v
+    return sorted(usuarios.values(), key=lambda u: u["bytes"], reverse=True)
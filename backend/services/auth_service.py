@@ -1,28 +1,43 @@
 """
 Servicio de autenticación con JWT y bcrypt
 """
+import hashlib
 import os
+import threading
+import time
+import uuid
 import bcrypt
 import jwt
+from collections import OrderedDict
 from datetime import datetime, timedelta
 from typing import Optional
-from dotenv import load_dotenv
 
-# Cargar .env
-env_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), '.env')
-load_dotenv(env_path)
+from sqlalchemy import text
+from sqlalchemy.exc import IntegrityError, SQLAlchemyError
+
+from database import engine
+
+# El .env lo carga main.py una sola vez al arrancar.
 
 # Clave secreta para JWT (usar variable de entorno o generar una por defecto)
 JWT_SECRET = os.getenv("JWT_SECRET", "nemaec-gestor-documentario-secret-key-2026")
 JWT_ALGORITHM = "HS256"
 JWT_EXPIRATION_HOURS = 24  # Token válido por 24 horas
 
+# Factor de trabajo de bcrypt para hashes nuevos (los existentes se rehashean al hacer login)
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+
+# Cantidad de tokens validados que se mantienen en caché (0 = sin caché)
+TOKEN_CACHE_SIZE = int(os.getenv("TOKEN_CACHE_SIZE", "1024"))
+# Cada cuántos segundos se leen las revocaciones hechas por otros workers
+TOKEN_REVOCACIONES_SEGUNDOS = float(os.getenv("TOKEN_REVOCACIONES_SEGUNDOS", "1"))
+
 
 def hash_password(password: str) -> str:
     """
     Hashea una contraseña usando bcrypt.
     """
-    salt = bcrypt.gensalt()
+    salt = bcrypt.gensalt(rounds=BCRYPT_ROUNDS)
     hashed = bcrypt.hashpw(password.encode('utf-8'), salt)
     return hashed.decode('utf-8')
 
@@ -37,6 +52,14 @@ def verify_password(password: str, hashed: str) -> bool:
         return False
 
 
+def necesita_rehash(hashed: str) -> bool:
+    """True si el hash fue generado con un factor de trabajo distinto de BCRYPT_ROUNDS."""
+    try:
+        return int(hashed.split("$")[2]) != BCRYPT_ROUNDS
+    except (IndexError, ValueError):
+        return True
+
+
 def create_token(username: str, nombre: str) -> str:
     """
     Crea un token JWT para el usuario.
@@ -46,15 +69,16 @@ def create_token(username: str, nombre: str) -> str:
         "sub": username,
         "nombre": nombre,
         "exp": expiration,
-        "iat": datetime.utcnow()
+        "iat": datetime.utcnow(),
+        "jti": uuid.uuid4().hex  # identifica cada sesión (la revocación no afecta a logins posteriores)
     }
     token = jwt.encode(payload, JWT_SECRET, algorithm=JWT_ALGORITHM)
     return token
 
 
-def verify_token(token: str) -> Optional[dict]:
+def decodificar_token(token: str) -> Optional[dict]:
     """
-    Verifica y decodifica un token JWT.
+    Decodifica un token JWT verificando firma y expiración (sin caché).
     Retorna el payload si es válido, None si no.
     """
     try:
@@ -66,6 +90,138 @@ def verify_token(token: str) -> Optional[dict]:
         return None  # Token inválido
 
 
+class CacheTokens:
+    """
+    LRU acotado de tokens ya validados, indexado por el SHA-256 del token
+    (el token en sí no se guarda). Respeta el 'exp' del payload y una lista de revocados.
+    Las revocaciones se guardan en la tabla tokens_revocados: sobreviven a un reinicio
+    y cada proceso lee las nuevas como máximo cada TOKEN_REVOCACIONES_SEGUNDOS.
+    """
+
+    def __init__(self, maximo: int = TOKEN_CACHE_SIZE):
+        self.maximo = maximo
+        self._tokens = OrderedDict()   # digest -> (payload, exp)
+        self._revocados = {}           # digest -> exp (se descartan al expirar)
+        self._lock = threading.Lock()
+        self._ultimo_id = 0            # última fila de tokens_revocados leída
+        self._ultima_sincronizacion = 0.0
+
+    @staticmethod
+    def digest(token: str) -> bytes:
+        return hashlib.sha256(token.encode("utf-8")).digest()
+
+    def obtener(self, digest: bytes) -> Optional[dict]:
+        with self._lock:
+            entrada = self._tokens.get(digest)
+            if entrada is None:
+                return None
+            payload, exp = entrada
+            if exp <= time.time():
+                del self._tokens[digest]
+                return None
+            self._tokens.move_to_end(digest)
+            return payload
+
+    def guardar(self, digest: bytes, payload: dict):
+        if self.maximo <= 0:
+            return
+        exp = payload.get("exp")
+        if not isinstance(exp, (int, float)):
+            return
+        with self._lock:
+            self._tokens[digest] = (payload, exp)
+            self._tokens.move_to_end(digest)
+            while len(self._tokens) > self.maximo:
+                self._tokens.popitem(last=False)
+
+    def _marcar_revocado(self, digest: bytes, exp: float):
+        ahora = time.time()
+        with self._lock:
+            self._tokens.pop(digest, None)
+            self._revocados[digest] = exp
+            for d in [d for d, e in self._revocados.items() if e <= ahora]:
+                del self._revocados[d]
+
+    def revocar(self, digest: bytes, exp: float):
+        self._marcar_revocado(digest, exp)
+        try:
+            with engine.begin() as conn:
+                conn.execute(text("DELETE FROM tokens_revocados WHERE expira <= :ahora"), {"ahora": time.time()})
+                conn.execute(text("INSERT INTO tokens_revocados (digest, expira) VALUES (:digest, :expira)"),
+                             {"digest": digest.hex(), "expira": exp})
+        except IntegrityError:
+            pass  # ya estaba revocado
+        except SQLAlchemyError as e:
+            print(f"Advertencia: revocación no persistida (solo vale en este proceso): {e}")
+
+    def sincronizar(self):
+        """Incorpora las revocaciones hechas por otros procesos (a lo sumo una consulta por intervalo)."""
+        ahora = time.monotonic()
+        if ahora - self._ultima_sincronizacion < TOKEN_REVOCACIONES_SEGUNDOS:
+            return
+        self._ultima_sincronizacion = ahora
+        try:
+            with engine.connect() as conn:
+                filas = conn.execute(
+                    text("SELECT id, digest, expira FROM tokens_revocados WHERE id > :id ORDER BY id"),
+                    {"id": self._ultimo_id}
+                ).fetchall()
+        except SQLAlchemyError:
+            return  # base sin inicializar: solo cuentan las revocaciones locales
+        for fila_id, digest, expira in filas:
+            self._marcar_revocado(bytes.fromhex(digest), expira)
+            self._ultimo_id = fila_id
+
+    def revocado(self, digest: bytes) -> bool:
+        self.sincronizar()
+        return digest in self._revocados
+
+
+# Instancia global de la caché
+cache_tokens = CacheTokens()
+
+
+def verify_token(token: str) -> Optional[dict]:
+    """
+    Verifica y decodifica un token JWT.
+    Retorna el payload si es válido, None si no (inválido, expirado o revocado).
+    Los tokens ya validados se sirven desde la caché hasta su 'exp'.
+    """
+    digest = CacheTokens.digest(token)
+    if cache_tokens.revocado(digest):
+        return None
+    payload = cache_tokens.obtener(digest)
+    if payload is None:
+        payload = decodificar_token(token)
+        if payload is None:
+            return None
+        cache_tokens.guardar(digest, payload)
+    return dict(payload)
+
+
+def revocar_token(token: str) -> bool:
+    """
+    Revoca un token (logout). Retorna False si el token ya no era válido.
+    La revocación se mantiene hasta que el token expira.
+    """
+    payload = verify_token(token)
+    if payload is None:
+        return False
+    cache_tokens.revocar(CacheTokens.digest(token), payload.get("exp", time.time()))
+    return True
+
+
+def extraer_token_bearer(authorization: Optional[str]) -> Optional[str]:
+    """Token de un header 'Bearer <token>', o None si el header no tiene ese formato."""
+    if not authorization:
+        return None
+    esquema, _, token = authorization.partition(" ")
+    token = token.strip()
+    if esquema.lower() != "bearer" or not token or " " in token:
+        return None
+    return token
+
+
 def get_username_from_token(token: str) -> Optional[str]:
     """
     Extrae el username de un token válido.
@@ -0,0 +1,267 @@
+"""
+Respaldos en caliente de la base SQLite.
+- Copia con la API de backup en línea de SQLite, de a BACKUP_PAGINAS_POR_PASO páginas con
+  una pausa entre pasos: cada paso toma el lock de lectura solo un instante, así los
+  escritores no quedan bloqueados durante toda la copia. Si otra conexión escribe durante
+  la copia, SQLite la reinicia; los reinicios se reportan. Con escrituras frecuentes la
+  copia por pasos puede no terminar nunca: pasados BACKUP_MAX_REINICIOS reinicios o
+  BACKUP_PLAZO_SEGUNDOS se copia en un solo paso (en WAL no bloquea a los escritores).
+- La copia se verifica (PRAGMA quick_check), se comprime con gzip y se guarda en BACKUP_DIR
+  junto con un .json de metadatos (tiempos, tamaños, sha256). Se conservan los
+  BACKUP_RETENER más recientes.
+- Un hilo programador respalda cada BACKUP_INTERVALO_HORAS. Con varios workers todos lo
+  corren, pero el respaldo se hace bajo un lock de archivo y se omite si el último es reciente.
+"""
+import gzip
+import hashlib
+import json
+import os
+import shutil
+import sqlite3
+import threading
+import time
+from datetime import datetime
+from typing import Optional
+
+from database import DATABASE_PATH, ES_SQLITE, bloqueo_exclusivo
+from .metrics_service import metricas, Contador, Histograma
+from .trabajos_service import tarea
+
+BACKUP_DIR = os.getenv("BACKUP_DIR", os.path.join(os.path.dirname(DATABASE_PATH), "respaldos"))
+# Respaldos comprimidos que se conservan (los más antiguos se borran)
+BACKUP_RETENER = int(os.getenv("BACKUP_RETENER", "7"))
+# Horas entre respaldos automáticos (0 = desactivado)
+BACKUP_INTERVALO_HORAS = float(os.getenv("BACKUP_INTERVALO_HORAS", "24"))
+# Páginas copiadas por paso y pausa entre pasos (ms)
+BACKUP_PAGINAS_POR_PASO = int(os.getenv("BACKUP_PAGINAS_POR_PASO", "256"))
+BACKUP_PAUSA_MS = float(os.getenv("BACKUP_PAUSA_MS", "5"))
+# Límite de la copia por pasos antes de pasar a copiar en un solo paso
+BACKUP_MAX_REINICIOS = int(os.getenv("BACKUP_MAX_REINICIOS", "10"))
+BACKUP_PLAZO_SEGUNDOS = float(os.getenv("BACKUP_PLAZO_SEGUNDOS", "60"))
+
+PREFIJO = "respaldo_"
+EXTENSION = ".db.gz"
+
+respaldo_duracion = metricas.registrar(Histograma(
+    "respaldo_duration_seconds", "Duración de los respaldos por fase (copia, verificacion, compresion)",
+    ("fase",), (0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)))
+respaldo_total = metricas.registrar(Contador(
+    "respaldo_total", "Respaldos por resultado", ("resultado",)))
+
+
+class ErrorRespaldo(Exception):
+    pass
+
+
+def _ruta_metadatos(ruta_gz: str) -> str:
+    return ruta_gz[:-len(EXTENSION)] + ".json"
+
+
+class _CopiaSinAvanzar(Exception):
+    pass
+
+
+def _copiar_en_linea(destino: str) -> dict:
+    """
+    Copia la base con la API de backup, de a pasos; si no termina dentro de los límites,
+    en un solo paso. Retorna pasos, reinicios, modo ("pasos" o "un_paso") y duración.
+    """
+    estado = {"pasos": 0, "reinicios": 0, "restantes": None, "paginas": 0, "modo": "pasos"}
+    inicio = time.perf_counter()
+
+    def progreso(status, restantes, total):
+        estado["pasos"] += 1
+        # Si quedan más páginas que en el paso anterior, otra conexión escribió y SQLite reinició la copia
+        if estado["restantes"] is not None and restantes > estado["restantes"]:
+            estado["reinicios"] += 1
+        estado["restantes"] = restantes
+        estado["paginas"] = total
+        if restantes and (estado["reinicios"] > BACKUP_MAX_REINICIOS
+                          or time.perf_counter() - inicio > BACKUP_PLAZO_SEGUNDOS):
+            # Una excepción en el callback aborta la copia
+            raise _CopiaSinAvanzar()
+        if BACKUP_PAUSA_MS > 0 and restantes:
+            time.sleep(BACKUP_PAUSA_MS / 1000)
+
+    origen = sqlite3.connect(DATABASE_PATH, timeout=30)
+    copia = sqlite3.connect(destino)
+    try:
+        try:
+            origen.backup(copia, pages=BACKUP_PAGINAS_POR_PASO, progress=progreso)
+        except _CopiaSinAvanzar:
+            print(f"Respaldo: la copia por pasos no terminó ({estado['reinicios']} reinicios en "
+                  f"{time.perf_counter() - inicio:.1f} s); se copia en un solo paso")
+            estado["modo"] = "un_paso"
+            try:
+                origen.backup(copia, pages=-1)
+            except sqlite3.Error as e:
+                raise ErrorRespaldo(f"No se pudo copiar la base ni por pasos ni en un solo paso: {e}") from e
+    finally:
+        copia.close()
+        origen.close()
+    estado["duracion_s"] = time.perf_counter() - inicio
+    del estado["restantes"]
+    return estado
+
+
+def _verificar(ruta: str) -> float:
+    inicio = time.perf_counter()
+    conn = sqlite3.connect(ruta)
+    try:
+        resultado = conn.execute("PRAGMA quick_check").fetchone()[0]
+    finally:
+        conn.close()
+    if resultado != "ok":
+        raise ErrorRespaldo(f"La copia no pasó quick_check: {resultado}")
+    return time.perf_counter() - inicio
+
+
+def _comprimir(origen: str, destino: str) -> tuple:
+    """gzip de origen a destino. Retorna (segundos, sha256 del .gz)."""
+    inicio = time.perf_counter()
+    with open(origen, "rb") as entrada, gzip.open(destino, "wb", compresslevel=6) as salida:
+        shutil.copyfileobj(entrada, salida, 1024 * 1024)
+    sha = hashlib.sha256()
+    with open(destino, "rb") as f:
+        for bloque in iter(lambda: f.read(1024 * 1024), b""):
+            sha.update(bloque)
+    return time.perf_counter() - inicio, sha.hexdigest()
+
+
+def listar_respaldos() -> list:
+    """Metadatos de los respaldos guardados, del más reciente al más antiguo."""
+    if not os.path.isdir(BACKUP_DIR):
+        return []
+    respaldos = []
+    for nombre in sorted(os.listdir(BACKUP_DIR), reverse=True):
+        if not (nombre.startswith(PREFIJO) and nombre.endswith(EXTENSION)):
+            continue
+        ruta = os.path.join(BACKUP_DIR, nombre)
+        try:
+            with open(_ruta_metadatos(ruta), encoding="utf-8") as f:
+                datos = json.load(f)
+        except (OSError, ValueError):
+            datos = {"archivo": nombre, "tamano_gz": os.path.getsize(ruta)}
+        respaldos.append(datos)
+    return respaldos
+
+
+def ruta_respaldo(nombre: str) -> Optional[str]:
+    """Ruta de un respaldo por nombre de archivo (None si no existe o el nombre no es válido)."""
+    if os.path.basename(nombre) != nombre or not (nombre.startswith(PREFIJO) and nombre.endswith(EXTENSION)):
+        return None
+    ruta = os.path.join(BACKUP_DIR, nombre)
+    return ruta if os.path.isfile(ruta) else None
+
+
+def _aplicar_retencion():
+    for datos in listar_respaldos()[BACKUP_RETENER:]:
+        ruta = os.path.join(BACKUP_DIR, datos["archivo"])
+        for archivo in (ruta, _ruta_metadatos(ruta)):
+            try:
+                os.remove(archivo)
+            except OSError:
+                pass
+        print(f"Respaldo {datos['archivo']} eliminado por retención")
+
+
+def crear_respaldo(motivo: str = "manual", usuario: str = None) -> dict:
+    """Crea un respaldo comprimido y verificado. Retorna sus metadatos."""
+    if not ES_SQLITE:
+        raise ErrorRespaldo("Los respaldos en caliente solo aplican a SQLite (en PostgreSQL usar pg_dump)")
+    os.makedirs(BACKUP_DIR, exist_ok=True)
+    with bloqueo_exclusivo("respaldo"):
+        marca = datetime.now().strftime("%Y%m%d_%H%M%S")
+        if os.path.exists(os.path.join(BACKUP_DIR, f"{PREFIJO}{marca}{EXTENSION}")):
+            marca += datetime.now().strftime("_%f")  # dos respaldos en el mismo segundo
+        nombre = f"{PREFIJO}{marca}{EXTENSION}"
+        ruta_gz = os.path.join(BACKUP_DIR, nombre)
+        temporal = os.path.join(BACKUP_DIR, f".{PREFIJO}{marca}.db.tmp")
+        try:
+            copia = _copiar_en_linea(temporal)
+            respaldo_duracion.observar(copia["duracion_s"], "copia")
+            t_verificacion = _verificar(temporal)
+            respaldo_duracion.observar(t_verificacion, "verificacion")
+            tamano_db = os.path.getsize(temporal)
+            t_compresion, sha256 = _comprimir(temporal, ruta_gz + ".tmp")
+            respaldo_duracion.observar(t_compresion, "compresion")
+            os.replace(ruta_gz + ".tmp", ruta_gz)
+        except Exception:
+            respaldo_total.inc("error")
+            for archivo in (temporal, ruta_gz + ".tmp"):
+                if os.path.exists(archivo):
+                    os.remove(archivo)
+            raise
+        os.remove(temporal)
+
+        datos = {
+            "archivo": nombre,
+            "creado_en": datetime.now().isoformat(timespec="seconds"),
+            "motivo": motivo,
+            "usuario": usuario,
+            "tamano_db": tamano_db,
+            "tamano_gz": os.path.getsize(ruta_gz),
+            "sha256": sha256,
+            "paginas": copia["paginas"],
+            "pasos": copia["pasos"],
+            "reinicios": copia["reinicios"],
+            "modo_copia": copia["modo"],
+            "copia_ms": round(copia["duracion_s"] * 1000, 1),
+            "verificacion_ms": round(t_verificacion * 1000, 1),
+            "compresion_ms": round(t_compresion * 1000, 1),
+        }
+        with open(_ruta_metadatos(ruta_gz), "w", encoding="utf-8") as f:
+            json.dump(datos, f, indent=2, ensure_ascii=False)
+        respaldo_total.inc("ok")
+        print(f"Respaldo {nombre}: copia {datos['copia_ms']:.0f} ms ({copia['pasos']} pasos, "
+              f"{copia['reinicios']} reinicios), compresión {datos['compresion_ms']:.0f} ms, "
+              f"{datos['tamano_gz'] / 1024 / 1024:.1f} MB")
+        _aplicar_retencion()
+        return datos
+
+
+@tarea("respaldo")
+def _tarea_respaldo(parametros: dict, trabajo_id: int) -> dict:
+    return crear_respaldo(parametros.get("motivo", "manual"), parametros.get("usuario"))
+
+
+class ProgramadorRespaldos:
+    """Hilo que crea un respaldo cuando el último tiene más de BACKUP_INTERVALO_HORAS."""
+
+    # Cada cuánto se revisa si toca respaldar (segundos)
+    REVISAR_CADA = 300
+
+    def __init__(self):
+        self._detener = threading.Event()
+        self._hilo = None
+
+    def _toca_respaldar(self) -> bool:
+        respaldos = listar_respaldos()
+        if not respaldos:
+            return True
+        ruta = os.path.join(BACKUP_DIR, respaldos[0]["archivo"])
+        return time.time() - os.path.getmtime(ruta) >= BACKUP_INTERVALO_HORAS * 3600
+
+    def _bucle(self):
+        while not self._detener.wait(self.REVISAR_CADA):
+            try:
+                if self._toca_respaldar():
+                    with bloqueo_exclusivo("respaldo-programador"):
+                        # Otro worker pudo respaldar mientras este esperaba el lock
+                        if self._toca_respaldar():
+                            crear_respaldo("programado")
+            except Exception as e:
+                print(f"Error en respaldo programado: {e}")
+
+    def iniciar(self):
+        if BACKUP_INTERVALO_HORAS <= 0 or not ES_SQLITE or self._hilo is not None:
+            return
+        self._hilo = threading.Thread(target=self._bucle, name="respaldos", daemon=True)
+        self._hilo.start()
+
+    def detener(self):
+        self._detener.set()
+
+
+# Instancia global del programador
+programador_respaldos = ProgramadorRespaldos()
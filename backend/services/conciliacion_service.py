@@ -0,0 +1,311 @@
+"""
+Conciliación de UPLOAD_DIR con la base: archivos huérfanos, temporales abandonados y
+referencias rotas.
+- Se lee de una vez cada columna que apunta a un archivo (REFERENCIAS y las claves de
+  configuración) y se recorre UPLOAD_DIR de a CONCILIAR_LOTE archivos con una pausa de
+  CONCILIAR_PAUSA_MS entre lotes, en un hilo propio con prioridad baja (os.nice: en Linux
+  la prioridad de E/S se deriva del nice del hilo), así no compite con los requests.
+- Temporales abandonados (temp_* de /api/subir-temporal, tmp* de extraer-referencia-pdf,
+  *.restaurando.* de la restauración, *.optimizando.* del optimizador de PDFs) con más de
+  CONCILIAR_TEMP_HORAS se borran.
+- Los huérfanos (archivos sin referencia) se reportan; se borran solo si
+  CONCILIAR_HUERFANOS_DIAS > 0 y son más antiguos, y tras volver a verificar en la base.
+  Nunca se borra un archivo referenciado.
+- Las referencias rotas (filas que apuntan a un archivo inexistente) se reportan.
+- También completa, de a lotes, los metadatos (tamaño, páginas, tipo) de las filas
+  subidas antes de que se registraran (almacenamiento_service).
+- El último reporte queda en STATE_DIR/conciliacion.json. Un hilo programador concilia
+  cada CONCILIAR_INTERVALO_HORAS; también se puede encolar el trabajo "conciliar_uploads".
+"""
+import json
+import os
+import threading
+import time
+from datetime import datetime
+from typing import Optional
+
+from sqlalchemy.orm import Session
+
+from database import SessionLocal, STATE_DIR, bloqueo_exclusivo
+from models import (
+    Documento, Adjunto, Contrato, AdjuntoContrato, ExpedienteContrato, PlantillaCarta,
+    SeguimientoCeldaDetalle,
+)
+from .almacenamiento_service import completar_metadatos
+from .config_service import configuracion
+from .metrics_service import metricas, Contador
+from .trabajos_service import tarea, registrar_progreso
+
+# Antigüedad a partir de la cual un temporal se considera abandonado (horas)
+CONCILIAR_TEMP_HORAS = float(os.getenv("CONCILIAR_TEMP_HORAS", "24"))
+# Días tras los cuales se borran los huérfanos (0 = solo reportarlos)
+CONCILIAR_HUERFANOS_DIAS = float(os.getenv("CONCILIAR_HUERFANOS_DIAS", "0"))
+# Archivos por lote y pausa entre lotes (ms)
+CONCILIAR_LOTE = int(os.getenv("CONCILIAR_LOTE", "200"))
+CONCILIAR_PAUSA_MS = float(os.getenv("CONCILIAR_PAUSA_MS", "20"))
+# Incremento de nice del hilo que concilia
+CONCILIAR_NICE = int(os.getenv("CONCILIAR_NICE", "10"))
+# Horas entre conciliaciones automáticas (0 = desactivado)
+CONCILIAR_INTERVALO_HORAS = float(os.getenv("CONCILIAR_INTERVALO_HORAS", "24"))
+
+RUTA_REPORTE = os.path.join(STATE_DIR, "conciliacion.json")
+
+# (modelo, columna) de cada columna que guarda un nombre de archivo relativo a UPLOAD_DIR
+REFERENCIAS = [
+    (Documento, "archivo_local"),
+    (Documento, "archivo_docx"),
+    (Adjunto, "archivo_local"),
+    (Contrato, "archivo_local"),
+    (AdjuntoContrato, "archivo_local"),
+    (ExpedienteContrato, "archivo_local"),
+    (SeguimientoCeldaDetalle, "archivo_local"),
+    (PlantillaCarta, "archivo_local"),
+]
+CLAVES_CONFIGURACION = ("membrete_archivo", "firma_imagen")
+
+# Máximo de elementos por lista en el reporte
+MAX_LISTA = 200
+
+conciliacion_archivos = metricas.registrar(Contador(
+    "conciliacion_archivos_total", "Archivos tratados por la conciliación de uploads",
+    ("accion",)))
+conciliacion_bytes = metricas.registrar(Contador(
+    "conciliacion_bytes_liberados_total", "Bytes liberados por la conciliación de uploads",
+    ("accion",)))
+
+
+def es_temporal(nombre: str) -> bool:
+    """Archivos que el sistema crea de paso y nunca quedan referenciados."""
+    base = os.path.basename(nombre)
+    return (base.startswith("temp_") or base.startswith("tmp")
+            or ".restaurando." in base or ".optimizando." in base)
+
+
+def referencias(db: Session) -> dict:
+    """archivo -> lista de (tabla, id, columna) que lo referencian."""
+    resultado = {}
+    for modelo, columna in REFERENCIAS:
+        campo = getattr(modelo, columna)
+        for id_, archivo in db.query(modelo.id, campo).filter(campo.isnot(None), campo != "").all():
+            resultado.setdefault(archivo, []).append((modelo.__tablename__, id_, columna))
+    config = configuracion.obtener(db)
+    for clave in CLAVES_CONFIGURACION:
+        archivo = getattr(config, clave)
+        if archivo:
+            resultado.setdefault(archivo, []).append(("configuracion_sistema", None, clave))
+    return resultado
+
+
+def _referenciado(db: Session, archivo: str) -> bool:
+    """Verificación puntual antes de borrar: el archivo pudo asociarse durante la conciliación."""
+    for modelo, columna in REFERENCIAS:
+        if db.query(modelo.id).filter(getattr(modelo, columna) == archivo).first():
+            return True
+    config = configuracion.obtener(db)
+    return any(getattr(config, clave) == archivo for clave in CLAVES_CONFIGURACION)
+
+
+def _recorrer(upload_dir: str):
+    """(nombre relativo con '/', stat) de cada archivo no oculto, incluidas subcarpetas."""
+    pendientes = [""]
+    while pendientes:
+        relativa = pendientes.pop()
+        with os.scandir(os.path.join(upload_dir, relativa)) as it:
+            for item in it:
+                if item.name.startswith("."):
+                    continue
+                nombre = f"{relativa}/{item.name}" if relativa else item.name
+                if item.is_dir(follow_symlinks=False):
+                    pendientes.append(nombre)
+                elif item.is_file(follow_symlinks=False):
+                    yield nombre, item.stat(follow_symlinks=False)
+
+
+def _borrar(ruta: str, accion: str, tamano: int) -> bool:
+    try:
+        os.remove(ruta)
+    except FileNotFoundError:
+        return False
+    conciliacion_archivos.inc(accion)
+    conciliacion_bytes.inc(accion, cantidad=tamano)
+    return True
+
+
+def conciliar(upload_dir: str, simular: bool = False, progreso=None) -> dict:
+    """
+    Concilia upload_dir con la base. Con `simular` no borra nada (solo reporta).
+    `progreso(dict)` recibe avances. Retorna el reporte.
+    """
+    inicio = time.perf_counter()
+    ahora = time.time()
+    limite_temp = ahora - CONCILIAR_TEMP_HORAS * 3600
+    limite_huerfano = ahora - CONCILIAR_HUERFANOS_DIAS * 86400 if CONCILIAR_HUERFANOS_DIAS > 0 else None
+
+    db = SessionLocal()
+    try:
+        referenciados = referencias(db)
+        reporte = {
+            "fecha": datetime.now().isoformat(timespec="seconds"),
+            "simulacion": simular,
+            "archivos": 0, "bytes_total": 0, "referencias": len(referenciados),
+            "temporales_eliminados": 0, "temporales_recientes": 0,
+            "huerfanos": 0, "bytes_huerfanos": 0, "huerfanos_eliminados": 0,
+            "bytes_liberados": 0, "errores": [],
+        }
+        huerfanos = []
+        en_disco = set()
+        for nombre, st in _recorrer(upload_dir):
+            en_disco.add(nombre)
+            reporte["archivos"] += 1
+            reporte["bytes_total"] += st.st_size
+            if nombre not in referenciados:
+                ruta = os.path.join(upload_dir, nombre)
+                try:
+                    if es_temporal(nombre):
+                        if st.st_mtime >= limite_temp:
+                            reporte["temporales_recientes"] += 1
+                        elif simular or _borrar(ruta, "temporal", st.st_size):
+                            reporte["temporales_eliminados"] += 1
+                            reporte["bytes_liberados"] += st.st_size
+                    else:
+                        reporte["huerfanos"] += 1
+                        reporte["bytes_huerfanos"] += st.st_size
+                        if limite_huerfano is not None and st.st_mtime < limite_huerfano and not _referenciado(db, nombre):
+                            if simular or _borrar(ruta, "huerfano", st.st_size):
+                                reporte["huerfanos_eliminados"] += 1
+                                reporte["bytes_liberados"] += st.st_size
+                                continue
+                        if len(huerfanos) < MAX_LISTA:
+                            huerfanos.append({"archivo": nombre, "tamano": st.st_size,
+                                              "modificado": datetime.fromtimestamp(st.st_mtime).isoformat(timespec="seconds")})
+                except OSError as e:
+                    if len(reporte["errores"]) < MAX_LISTA:
+                        reporte["errores"].append(f"{nombre}: {e}")
+            if reporte["archivos"] % CONCILIAR_LOTE == 0:
+                if progreso:
+                    progreso({k: reporte[k] for k in ("archivos", "temporales_eliminados", "huerfanos", "bytes_liberados")})
+                if CONCILIAR_PAUSA_MS > 0:
+                    time.sleep(CONCILIAR_PAUSA_MS / 1000)
+        if not simular:
+            reporte["metadatos_completados"] = completar_metadatos(db, upload_dir, CONCILIAR_LOTE, CONCILIAR_PAUSA_MS)
+    finally:
+        db.close()
+
+    rotas = [
+        {"tabla": tabla, "id": id_, "columna": columna, "archivo": archivo}
+        for archivo, filas in referenciados.items() if archivo not in en_disco
+        # Nombres con ruta absoluta o '..' no están bajo upload_dir: se verifican tal cual
+        and not os.path.isfile(os.path.join(upload_dir, archivo))
+        for tabla, id_, columna in filas
+    ]
+    reporte.update({
+        "referencias_rotas": len(rotas),
+        "lista_referencias_rotas": rotas[:MAX_LISTA],
+        "lista_huerfanos": huerfanos,
+        "duracion_ms": round((time.perf_counter() - inicio) * 1000, 1),
+    })
+    print(f"Conciliación de uploads{' (simulación)' if simular else ''}: {reporte['archivos']} archivos, "
+          f"{reporte['temporales_eliminados']} temporales y {reporte['huerfanos_eliminados']} huérfanos eliminados "
+          f"({reporte['bytes_liberados'] / 1024 / 1024:.1f} MB), {reporte['huerfanos']} huérfanos, "
+          f"{len(rotas)} referencias rotas en {reporte['duracion_ms']:.0f} ms")
+    return reporte
+
+
+def _guardar_reporte(reporte: dict):
+    os.makedirs(STATE_DIR, exist_ok=True)
+    temporal = f"{RUTA_REPORTE}.{os.getpid()}.tmp"
+    with open(temporal, "w", encoding="utf-8") as f:
+        json.dump(reporte, f, indent=1, ensure_ascii=False)
+    os.replace(temporal, RUTA_REPORTE)
+
+
+def ultimo_reporte() -> Optional[dict]:
+    try:
+        with open(RUTA_REPORTE, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def en_hilo_de_baja_prioridad(funcion, *args, **kwargs):
+    """
+    Ejecuta funcion en un hilo nuevo con nice CONCILIAR_NICE y espera el resultado. En Linux
+    nice afecta solo al hilo que lo llama, así los hilos de trabajos no quedan penalizados.
+    """
+    resultado = {}
+
+    def correr():
+        try:
+            if CONCILIAR_NICE > 0 and hasattr(os, "nice"):
+                os.nice(CONCILIAR_NICE)
+        except OSError:
+            pass
+        try:
+            resultado["valor"] = funcion(*args, **kwargs)
+        except BaseException as e:
+            resultado["error"] = e
+
+    hilo = threading.Thread(target=correr, name="conciliacion", daemon=True)
+    hilo.start()
+    hilo.join()
+    if "error" in resultado:
+        raise resultado["error"]
+    return resultado["valor"]
+
+
+def ejecutar(upload_dir: str, simular: bool = False, progreso=None) -> dict:
+    """Concilia con baja prioridad bajo un lock entre procesos y guarda el reporte."""
+    with bloqueo_exclusivo("conciliacion"):
+        reporte = en_hilo_de_baja_prioridad(conciliar, upload_dir, simular, progreso)
+        if not simular:
+            _guardar_reporte(reporte)
+        return reporte
+
+
+@tarea("conciliar_uploads")
+def _tarea_conciliar(parametros: dict, trabajo_id: int) -> dict:
+    return ejecutar(parametros["upload_dir"], bool(parametros.get("simular")),
+                    progreso=lambda avance: registrar_progreso(trabajo_id, avance))
+
+
+class ProgramadorConciliacion:
+    """Hilo que concilia cuando el último reporte tiene más de CONCILIAR_INTERVALO_HORAS."""
+
+    # Cada cuánto se revisa si toca conciliar (segundos)
+    REVISAR_CADA = 600
+
+    def __init__(self):
+        self._detener = threading.Event()
+        self._hilo = None
+        self._upload_dir = None
+
+    def _toca_conciliar(self) -> bool:
+        try:
+            return time.time() - os.path.getmtime(RUTA_REPORTE) >= CONCILIAR_INTERVALO_HORAS * 3600
+        except OSError:
+            return True
+
+    def _bucle(self):
+        while not self._detener.wait(self.REVISAR_CADA):
+            try:
+                if self._toca_conciliar():
+                    with bloqueo_exclusivo("conciliacion-programador"):
+                        # Otro worker pudo conciliar mientras este esperaba el lock
+                        if self._toca_conciliar():
+                            ejecutar(self._upload_dir)
+            except Exception as e:
+                print(f"Error en conciliación programada: {e}")
+
+    def iniciar(self, upload_dir: str):
+        if CONCILIAR_INTERVALO_HORAS <= 0 or self._hilo is not None:
+            return
+        self._upload_dir = upload_dir
+        self._hilo = threading.Thread(target=self._bucle, name="conciliacion-programador", daemon=True)
+        self._hilo.start()
+
+    def detener(self):
+        self._detener.set()
+
+
+# Instancia global del programador
+programador_conciliacion = ProgramadorConciliacion()
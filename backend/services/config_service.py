@@ -0,0 +1,125 @@
+"""
+Configuración del sistema (tabla configuracion_sistema) cacheada en memoria.
+- Todas las claves se cargan con una sola consulta y se exponen tipadas en `Configuracion`.
+- Las escrituras pasan por `guardar()`, que incrementa la fila `config_version` en la
+  misma transacción. Cada proceso compara esa versión (una consulta por clave primaria)
+  como máximo cada CONFIG_VERIFICAR_SEGUNDOS y recarga si cambió, así un cambio hecho
+  en un worker de uvicorn llega a los demás.
+"""
+import os
+import threading
+import time
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from models import ConfiguracionSistema
+
+# Intervalo mínimo entre chequeos de versión contra la base (segundos)
+CONFIG_VERIFICAR_SEGUNDOS = float(os.getenv("CONFIG_VERIFICAR_SEGUNDOS", "1"))
+
+CLAVE_VERSION = "config_version"
+
+
+class Configuracion:
+    """Vista inmutable y tipada de la configuración en un momento dado."""
+
+    def __init__(self, valores: dict, version: int):
+        self._valores = dict(valores)
+        self.version = version
+        self.membrete_archivo = self._texto("membrete_archivo") or None
+        self.firma_imagen = self._texto("firma_imagen") or None
+        self.firma_nombre = self._texto("firma_nombre")
+        self.firma_cargo = self._texto("firma_cargo")
+        self.carta_sufijo = self._texto("carta_sufijo").strip()
+        try:
+            self.carta_digitos = int(self._texto("carta_digitos", "6"))
+        except ValueError:
+            self.carta_digitos = 6
+
+    def _texto(self, clave: str, default: str = "") -> str:
+        valor = self._valores.get(clave)
+        return valor if valor else default
+
+    def valor(self, clave: str, default: str = "") -> str:
+        """Valor crudo de cualquier clave (vacío o inexistente -> default)."""
+        return self._texto(clave, default)
+
+    def numero_carta(self, correlativo: int, anio: int) -> str:
+        """Número completo de carta según el sufijo y los dígitos configurados."""
+        correlativo_str = str(correlativo).zfill(self.carta_digitos)
+        if self.carta_sufijo:
+            return f"Carta N° {correlativo_str}-{anio}-{self.carta_sufijo}"
+        return f"Carta N° {correlativo_str}-{anio}"
+
+
+class ServicioConfiguracion:
+    """Caché por proceso de configuracion_sistema con invalidación por versión."""
+
+    def __init__(self):
+        self._actual = None
+        self._ultimo_chequeo = 0.0
+        self._lock = threading.Lock()
+
+    def _leer_version(self, db: Session) -> int:
+        valor = db.execute(
+            text("SELECT valor FROM configuracion_sistema WHERE clave = :clave"), {"clave": CLAVE_VERSION}
+        ).scalar()
+        try:
+            return int(valor or 0)
+        except ValueError:
+            return 0
+
+    def _cargar(self, db: Session) -> Configuracion:
+        filas = db.execute(text("SELECT clave, valor FROM configuracion_sistema")).fetchall()
+        valores = {clave: valor for clave, valor in filas}
+        try:
+            version = int(valores.pop(CLAVE_VERSION, None) or 0)
+        except ValueError:
+            version = 0
+        return Configuracion(valores, version)
+
+    def obtener(self, db: Session) -> Configuracion:
+        """Configuración vigente; consulta la base solo si pasó el intervalo de chequeo."""
+        ahora = time.monotonic()
+        actual = self._actual
+        if actual is not None and ahora - self._ultimo_chequeo < CONFIG_VERIFICAR_SEGUNDOS:
+            return actual
+        with self._lock:
+            if self._actual is None or self._leer_version(db) != self._actual.version:
+                self._actual = self._cargar(db)
+            self._ultimo_chequeo = time.monotonic()
+            return self._actual
+
+    def guardar(self, db: Session, **valores):
+        """
+        Escribe las claves dadas (None deja la clave vacía), incrementa la versión y
+        hace commit. El proceso actual ve el cambio de inmediato; los demás en su
+        próximo chequeo.
+        """
+        for clave, valor in valores.items():
+            fila = db.query(ConfiguracionSistema).filter(ConfiguracionSistema.clave == clave).first()
+            valor = None if valor is None else str(valor)
+            if fila:
+                fila.valor = valor
+            else:
+                db.add(ConfiguracionSistema(clave=clave, valor=valor))
+        db.flush()
+        # Incremento atómico: dos workers guardando a la vez no pueden dejar la misma versión
+        resultado = db.execute(
+            text("UPDATE configuracion_sistema SET valor = CAST(valor AS INTEGER) + 1 WHERE clave = :clave"),
+            {"clave": CLAVE_VERSION}
+        )
+        if resultado.rowcount == 0:
+            db.add(ConfiguracionSistema(clave=CLAVE_VERSION, valor="1"))
+        db.commit()
+        self.invalidar()
+
+    def invalidar(self):
+        """Fuerza la recarga en la próxima lectura de este proceso."""
+        with self._lock:
+            self._actual = None
+
+
+# Instancia global
+configuracion = ServicioConfiguracion()
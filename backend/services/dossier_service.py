@@ -0,0 +1,374 @@
+"""
+Dossier PDF: une en un solo PDF los documentos del expediente de un contrato o de una
+etapa del seguimiento de una comisaría (para presentar a UGPE).
+- Portada con índice (documento, fecha y página inicial), un marcador por documento y
+  numeración "Página X de N" al pie de cada página.
+- Se genera como trabajo en segundo plano (tipo "dossier_pdf") y queda en DOSSIER_DIR.
+  El nombre del archivo lleva un hash de las fuentes (nombre, tamaño y fecha de
+  modificación de cada PDF y los datos del índice): si un documento cambia, se agrega o
+  se quita, el hash cambia, el dossier anterior deja de servirse y se borra al generar
+  el nuevo.
+- Las fuentes se abren de a una; pypdf arma el documento de salida en memoria y lo
+  escribe al final en un archivo temporal que se renombra.
+- Un PDF que no se puede leer (dañado, con contraseña) o que falta en disco se reemplaza
+  por una página de aviso y figura así en el índice.
+"""
+import glob
+import hashlib
+import json
+import os
+import time
+from datetime import datetime
+from typing import Optional
+
+from sqlalchemy.orm import Session
+
+from database import DATABASE_PATH, SessionLocal
+from models import Contrato, SeguimientoComisaria, SeguimientoCeldaDetalle, Trabajo
+from .expediente_service import documentos_expediente
+from .metrics_service import metricas, Histograma
+from .seguimiento_service import ETAPAS
+from .trabajos_service import tarea, encolar, registrar_progreso
+
+DOSSIER_DIR = os.getenv("DOSSIER_DIR", os.path.join(os.path.dirname(DATABASE_PATH), "dossiers"))
+
+# Cambiar al modificar el formato de salida: invalida los dossiers ya generados
+VERSION_FORMATO = "1"
+
+ANCHO_A4, ALTO_A4 = 595, 842
+LINEAS_PRIMERA_PAGINA = 38
+LINEAS_POR_PAGINA = 52
+
+# Nombre legible de cada paso de una etapa (sufijo del campo, como en el Excel de seguimiento)
+PASOS_SEGUIMIENTO = {
+    "revisada": "Revisada",
+    "remitida_ugpe": "Remitida a UGPE",
+    "presentado_ne": "Presentado al NE",
+    "revisado_aprobado": "Revisado y aprobado",
+    "remitido_ugpe": "Remitido a UGPE",
+    "adenda_firmada": "Adenda firmada",
+    "remitido_pago": "Remitido para pago",
+}
+
+dossier_duracion = metricas.registrar(Histograma(
+    "dossier_duration_seconds", "Duración de la generación de dossiers PDF", ("tipo",),
+    (0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)))
+
+
+# ============================================
+# FUENTES
+# ============================================
+
+def preparar_expediente(db: Session, contrato_id: int, upload_dir: str) -> Optional[dict]:
+    """Plan del dossier del expediente de un contrato (None si el contrato no existe)."""
+    contrato = db.query(Contrato).filter(Contrato.id == contrato_id).first()
+    if not contrato:
+        return None
+    fuentes = [
+        {
+            "titulo": item["asunto"] or item["numero"] or item["archivo"],
+            "tipo": item["tipo"],
+            "fecha": item["fecha"],
+            "ruta": os.path.join(upload_dir, item["archivo"]),
+        }
+        for item in documentos_expediente(db, contrato)
+        if item["archivo"] and item["archivo"].lower().endswith(".pdf")
+    ]
+    subtitulo = " — ".join(p for p in (contrato.contratado, contrato.item_contratado) if p)
+    return _plan(f"expediente_{contrato.id}", "expediente", {"id": contrato.id},
+                 f"Expediente del contrato {contrato.numero or contrato.id}", subtitulo, fuentes)
+
+
+def preparar_seguimiento(db: Session, comisaria_id: int, etapa: str, upload_dir: str) -> Optional[dict]:
+    """
+    Plan del dossier de una etapa del seguimiento de una comisaría: los PDF adjuntos a las
+    celdas de la etapa, en orden de carga. None si la comisaría no existe; ValueError si
+    la etapa no existe.
+    """
+    etapas = {clave: (nombre, campos) for clave, nombre, campos in ETAPAS}
+    if etapa not in etapas:
+        raise ValueError(f"Etapa desconocida: {etapa} (válidas: {', '.join(etapas)})")
+    comisaria = db.query(SeguimientoComisaria).filter(SeguimientoComisaria.id == comisaria_id).first()
+    if not comisaria:
+        return None
+    nombre_etapa, campos = etapas[etapa]
+    detalles = (
+        db.query(SeguimientoCeldaDetalle)
+        .filter(SeguimientoCeldaDetalle.comisaria_id == comisaria_id,
+                SeguimientoCeldaDetalle.campo.in_(campos),
+                SeguimientoCeldaDetalle.archivo_local.isnot(None))
+        .order_by(SeguimientoCeldaDetalle.fecha_actualizacion.asc(), SeguimientoCeldaDetalle.id.asc())
+        .all()
+    )
+    fuentes = [
+        {
+            "titulo": d.archivo_nombre or d.observacion or d.archivo_local,
+            "tipo": PASOS_SEGUIMIENTO.get(d.campo.split("_", 1)[-1], d.campo),
+            "fecha": d.fecha_actualizacion,
+            "ruta": os.path.join(upload_dir, d.archivo_local),
+        }
+        for d in detalles
+        if d.archivo_local.lower().endswith(".pdf")
+    ]
+    return _plan(f"seguimiento_{comisaria.id}_{etapa}", "seguimiento", {"id": comisaria.id, "etapa": etapa},
+                 nombre_etapa, f"Comisaría {comisaria.comisaria}", fuentes)
+
+
+def _plan(sujeto: str, tipo: str, parametros: dict, titulo: str, subtitulo: str, fuentes: list) -> dict:
+    h = hashlib.sha256(f"{VERSION_FORMATO}\0{titulo}\0{subtitulo}".encode())
+    for fuente in fuentes:
+        try:
+            estado = os.stat(fuente["ruta"])
+            firma = f"{estado.st_size}:{estado.st_mtime_ns}"
+        except OSError:
+            firma = "faltante"
+        h.update(f"\0{fuente['titulo']}\0{fuente['tipo']}\0{fuente['fecha']}\0"
+                 f"{os.path.basename(fuente['ruta'])}\0{firma}".encode())
+    return {
+        "sujeto": sujeto,
+        "tipo": tipo,
+        "parametros": parametros,
+        "titulo": titulo,
+        "subtitulo": subtitulo,
+        "fuentes": fuentes,
+        "clave": h.hexdigest()[:16],
+    }
+
+
+def ruta_dossier(plan: dict) -> str:
+    return os.path.join(DOSSIER_DIR, f"{plan['sujeto']}_{plan['clave']}.pdf")
+
+
+def dossier_disponible(plan: dict) -> Optional[str]:
+    """Ruta del dossier si ya está generado para las fuentes actuales."""
+    ruta = ruta_dossier(plan)
+    return ruta if os.path.isfile(ruta) else None
+
+
+def solicitar(db: Session, plan: dict, upload_dir: str, usuario: str = None) -> dict:
+    """
+    Si el dossier está al día lo informa; si no, encola su generación (o retorna el
+    trabajo ya encolado para las mismas fuentes).
+    """
+    if dossier_disponible(plan):
+        return {"estado": "listo", "trabajo_id": None}
+    parametros = json.dumps({**plan["parametros"], "tipo": plan["tipo"], "clave": plan["clave"],
+                             "upload_dir": upload_dir}, ensure_ascii=False)
+    existente = (
+        db.query(Trabajo.id)
+        .filter(Trabajo.tipo == "dossier_pdf", Trabajo.parametros == parametros,
+                Trabajo.estado.in_(("pendiente", "en_curso")))
+        .first()
+    )
+    if existente:
+        return {"estado": "en_curso", "trabajo_id": existente[0]}
+    trabajo_id = encolar(db, "dossier_pdf", json.loads(parametros), usuario)
+    return {"estado": "pendiente", "trabajo_id": trabajo_id}
+
+
+# ============================================
+# GENERACIÓN DEL PDF
+# ============================================
+
+def _texto(texto: str) -> bytes:
+    """Cadena PDF en WinAnsi (las fuentes estándar); lo que no entra se reemplaza por '?'."""
+    datos = str(texto).encode("cp1252", "replace")
+    return b"(" + datos.replace(b"\\", b"\\\\").replace(b"(", b"\\(").replace(b")", b"\\)") + b")"
+
+
+def _recortar(texto: str, largo: int) -> str:
+    texto = " ".join(str(texto or "").split())
+    return texto if len(texto) <= largo else texto[:largo - 1] + "…"
+
+
+def _pagina_texto(lineas: list, ancho: float = ANCHO_A4, alto: float = ALTO_A4):
+    """Página con líneas de texto: lista de (x, y, tamaño, negrita, texto)."""
+    from pypdf import PageObject
+    from pypdf.generic import DecodedStreamObject, DictionaryObject, NameObject
+
+    def fuente(nombre):
+        return DictionaryObject({
+            NameObject("/Type"): NameObject("/Font"),
+            NameObject("/Subtype"): NameObject("/Type1"),
+            NameObject("/BaseFont"): NameObject(nombre),
+            NameObject("/Encoding"): NameObject("/WinAnsiEncoding"),
+        })
+
+    pagina = PageObject.create_blank_page(width=ancho, height=alto)
+    pagina[NameObject("/Resources")] = DictionaryObject({
+        NameObject("/Font"): DictionaryObject({
+            NameObject("/FDos"): fuente("/Helvetica"),
+            NameObject("/FDosB"): fuente("/Helvetica-Bold"),
+        })
+    })
+    partes = [b"BT"]
+    for x, y, tamano, negrita, texto in lineas:
+        partes.append(b"/FDosB " if negrita else b"/FDos ")
+        partes.append(f"{tamano} Tf 1 0 0 1 {x:.1f} {y:.1f} Tm ".encode() + _texto(texto) + b" Tj")
+    partes.append(b"ET")
+    contenido = DecodedStreamObject()
+    contenido.set_data(b"\n".join(partes))
+    pagina[NameObject("/Contents")] = contenido
+    return pagina
+
+
+def _paginas_indice(plan: dict, filas: list, total_paginas: int) -> list:
+    """Portada e índice: filas (n, fecha, tipo, título, página inicial, nota)."""
+    paginas = []
+    lineas = [
+        (50, 780, 16, True, _recortar(plan["titulo"], 60)),
+        (50, 760, 10, False, _recortar(plan["subtitulo"], 95)),
+        (50, 742, 9, False, f"Generado el {datetime.now().strftime('%d/%m/%Y %H:%M')} — "
+                            f"{len(filas)} documento(s), {total_paginas} página(s)"),
+    ]
+    y = 710
+    capacidad = LINEAS_PRIMERA_PAGINA
+    pendientes = list(filas)
+    while True:
+        lineas.extend([
+            (50, y, 9, True, "N°"), (75, y, 9, True, "Fecha"), (130, y, 9, True, "Tipo"),
+            (250, y, 9, True, "Documento"), (520, y, 9, True, "Página"),
+        ])
+        y -= 16
+        for n, fecha, tipo, titulo, pagina, nota in pendientes[:capacidad]:
+            documento = f"{titulo} ({nota})" if nota else titulo
+            lineas.extend([
+                (50, y, 9, False, str(n)), (75, y, 9, False, fecha), (130, y, 9, False, _recortar(tipo, 22)),
+                (250, y, 9, False, _recortar(documento, 52)), (520, y, 9, False, str(pagina)),
+            ])
+            y -= 14
+        paginas.append(_pagina_texto(lineas))
+        pendientes = pendientes[capacidad:]
+        if not pendientes:
+            return paginas
+        lineas, y, capacidad = [], 800, LINEAS_POR_PAGINA
+
+
+def _cantidad_paginas_indice(documentos: int) -> int:
+    if documentos <= LINEAS_PRIMERA_PAGINA:
+        return 1
+    restantes = documentos - LINEAS_PRIMERA_PAGINA
+    return 1 + (restantes + LINEAS_POR_PAGINA - 1) // LINEAS_POR_PAGINA
+
+
+def _numerar(pagina, numero: int, total: int):
+    if pagina.get("/Rotate"):
+        pagina.transfer_rotation_to_content()
+    caja = pagina.mediabox
+    sello = _pagina_texto([(float(caja.right) - 110, float(caja.bottom) + 18, 8, False,
+                            f"Página {numero} de {total}")], float(caja.width), float(caja.height))
+    pagina.merge_page(sello)
+
+
+def generar(plan: dict, trabajo_id: int = None) -> dict:
+    """Genera el dossier del plan en DOSSIER_DIR. Retorna páginas, documentos y errores."""
+    from pypdf import PdfReader, PdfWriter
+
+    inicio = time.perf_counter()
+    os.makedirs(DOSSIER_DIR, exist_ok=True)
+
+    # 1. Contar páginas de cada fuente para armar el índice antes de copiar
+    conteos = []
+    for fuente in plan["fuentes"]:
+        if not os.path.isfile(fuente["ruta"]):
+            conteos.append((None, "archivo no encontrado"))
+            continue
+        try:
+            lector = PdfReader(fuente["ruta"])
+            if lector.is_encrypted:
+                conteos.append((None, "protegido con contraseña"))
+            else:
+                conteos.append((len(lector.pages), None))
+        except Exception as e:
+            conteos.append((None, f"no se pudo leer: {type(e).__name__}"))
+
+    paginas_indice = _cantidad_paginas_indice(len(plan["fuentes"]))
+    filas = []
+    siguiente = paginas_indice + 1
+    for n, (fuente, (paginas, nota)) in enumerate(zip(plan["fuentes"], conteos), 1):
+        fecha = fuente["fecha"].strftime("%d/%m/%Y") if fuente["fecha"] else ""
+        filas.append((n, fecha, fuente["tipo"], fuente["titulo"], siguiente, nota))
+        siguiente += paginas or 1
+    total_paginas = siguiente - 1
+
+    # 2. Portada/índice, documentos con marcador y numeración
+    escritor = PdfWriter()
+    for pagina in _paginas_indice(plan, filas, total_paginas):
+        escritor.add_page(pagina)
+    errores = []
+    for indice, (fuente, fila, (paginas, nota)) in enumerate(zip(plan["fuentes"], filas, conteos)):
+        pagina_inicial = len(escritor.pages)
+        if paginas:
+            try:
+                escritor.append(fuente["ruta"], import_outline=False)
+            except Exception as e:
+                nota = f"no se pudo copiar: {type(e).__name__}"
+                # Descartar páginas copiadas a medias y mantener el índice correcto
+                while len(escritor.pages) > pagina_inicial:
+                    escritor.remove_page(len(escritor.pages) - 1)
+        copiadas = len(escritor.pages) - pagina_inicial
+        if copiadas != (paginas or 1):
+            # Aviso en lugar del documento; si la cantidad no coincide con el índice se completa
+            if copiadas == 0:
+                escritor.add_page(_pagina_texto([
+                    (50, 780, 14, True, _recortar(fuente["titulo"], 70)),
+                    (50, 756, 10, False, f"Documento no incluido: {nota or 'sin páginas'}"),
+                    (50, 740, 9, False, os.path.basename(fuente["ruta"])),
+                ]))
+                copiadas = 1
+            while copiadas < (paginas or 1):
+                escritor.add_page(_pagina_texto([]))
+                copiadas += 1
+        if nota:
+            errores.append({"documento": fuente["titulo"], "error": nota})
+        escritor.add_outline_item(f"{fila[0]}. {_recortar(fuente['tipo'] + ' — ' + fuente['titulo'], 90)}",
+                                  pagina_inicial)
+        if trabajo_id:
+            registrar_progreso(trabajo_id, {"documentos": indice + 1, "total": len(plan["fuentes"])})
+
+    total = len(escritor.pages)
+    for numero, pagina in enumerate(escritor.pages, 1):
+        _numerar(pagina, numero, total)
+
+    destino = ruta_dossier(plan)
+    temporal = destino + ".tmp"
+    with open(temporal, "wb") as f:
+        escritor.write(f)
+    os.replace(temporal, destino)
+
+    # Los dossiers anteriores del mismo sujeto ya no corresponden a las fuentes
+    for anterior in glob.glob(os.path.join(DOSSIER_DIR, f"{glob.escape(plan['sujeto'])}_*.pdf")):
+        if anterior != destino:
+            try:
+                os.remove(anterior)
+            except OSError:
+                pass
+
+    duracion = time.perf_counter() - inicio
+    dossier_duracion.observar(duracion, plan["tipo"])
+    print(f"Dossier {os.path.basename(destino)}: {len(plan['fuentes'])} documentos, "
+          f"{total} páginas en {duracion * 1000:.0f} ms")
+    return {
+        "archivo": os.path.basename(destino),
+        "documentos": len(plan["fuentes"]),
+        "paginas": total,
+        "tamano": os.path.getsize(destino),
+        "errores": errores,
+        "duracion_ms": round(duracion * 1000, 1),
+    }
+
+
+@tarea("dossier_pdf")
+def _tarea_dossier(parametros: dict, trabajo_id: int) -> dict:
+    db = SessionLocal()
+    try:
+        if parametros["tipo"] == "expediente":
+            plan = preparar_expediente(db, parametros["id"], parametros["upload_dir"])
+        else:
+            plan = preparar_seguimiento(db, parametros["id"], parametros["etapa"], parametros["upload_dir"])
+    finally:
+        db.close()
+    if plan is None:
+        raise ValueError("El contrato o la comisaría ya no existe")
+    # Si las fuentes cambiaron desde que se encoló, se genera con las actuales
+    return generar(plan, trabajo_id)
@@ -0,0 +1,124 @@
+"""
+Documentos que forman el expediente completo de un contrato: el archivo del contrato,
+sus adjuntos, los documentos del expediente y las cartas generadas para el contrato.
+Se listan en orden cronológico (mismo criterio que GET /api/contratos/{id}/expediente:
+fecha ascendente, sin fecha al final).
+"""
+import csv
+import io
+import os
+from datetime import datetime
+
+from sqlalchemy.orm import Session
+
+from models import Contrato, AdjuntoContrato, ExpedienteContrato, CartaGenerada, Documento
+from .zip_service import EntradaZip, ZipEnStreaming
+
+COLUMNAS_INDICE = ["N°", "Fecha", "Tipo", "Número", "Asunto", "Archivo en el ZIP", "Tamaño (bytes)",
+                   "Estado", "Enlace Drive"]
+
+
+def _item(fecha, tipo, numero, asunto, archivo, enlace_drive=None, creado=None) -> dict:
+    return {
+        "fecha": fecha,
+        "tipo": tipo,
+        "numero": numero,
+        "asunto": asunto,
+        "archivo": archivo,
+        "enlace_drive": enlace_drive,
+        "_creado": creado or datetime.min,
+    }
+
+
+def documentos_expediente(db: Session, contrato: Contrato) -> list:
+    """
+    Lista de dicts (fecha, tipo, numero, asunto, archivo, enlace_drive) en orden cronológico.
+    `archivo` es el nombre dentro de UPLOAD_DIR o None si el documento solo tiene enlace.
+    """
+    items = []
+    if contrato.archivo_local or contrato.enlace_drive:
+        items.append(_item(contrato.fecha, "Contrato", contrato.numero, contrato.asunto,
+                           contrato.archivo_local, contrato.enlace_drive))
+
+    adjuntos = (
+        db.query(AdjuntoContrato)
+        .filter(AdjuntoContrato.contrato_id == contrato.id)
+        .order_by(AdjuntoContrato.created_at.asc(), AdjuntoContrato.id.asc())
+        .all()
+    )
+    for adjunto in adjuntos:
+        items.append(_item(adjunto.created_at, "Adjunto", None, adjunto.nombre,
+                           adjunto.archivo_local, adjunto.enlace_drive, adjunto.created_at))
+
+    expediente = (
+        db.query(ExpedienteContrato)
+        .filter(ExpedienteContrato.contrato_id == contrato.id)
+        .order_by(ExpedienteContrato.fecha.asc().nullslast(), ExpedienteContrato.created_at.asc())
+        .all()
+    )
+    for doc in expediente:
+        items.append(_item(doc.fecha, doc.tipo_doc, doc.numero, doc.asunto,
+                           doc.archivo_local, doc.enlace_drive, doc.created_at))
+
+    # Cartas generadas: el PDF ya suele estar en el expediente ('Carta Enviada'); se agrega
+    # el .docx y el PDF si el expediente no lo tiene
+    incluidos = {i["archivo"] for i in items if i["archivo"]}
+    numeros = [
+        numero for (numero,) in db.query(CartaGenerada.numero_completo)
+        .filter(CartaGenerada.contrato_id == contrato.id).all()
+    ]
+    if numeros:
+        cartas = (
+            db.query(Documento)
+            .filter(Documento.tipo_documento == 'carta', Documento.numero.in_(numeros))
+            .order_by(Documento.id.asc())
+            .all()
+        )
+        for carta in cartas:
+            if carta.archivo_local and carta.archivo_local not in incluidos:
+                items.append(_item(carta.fecha, "Carta Enviada", carta.numero, carta.asunto,
+                                   carta.archivo_local, creado=carta.created_at))
+            if carta.archivo_docx and carta.archivo_docx not in incluidos:
+                items.append(_item(carta.fecha, "Carta Enviada (Word)", carta.numero, carta.asunto,
+                                   carta.archivo_docx, creado=carta.created_at))
+
+    # Orden estable: fecha (sin fecha al final) y luego fecha de registro
+    items.sort(key=lambda i: (i["fecha"] is None, i["fecha"] or datetime.min, i["_creado"]))
+    for item in items:
+        del item["_creado"]
+    return items
+
+
+def zip_expediente(db: Session, contrato: Contrato, upload_dir: str) -> ZipEnStreaming:
+    """
+    ZIP del expediente: 000_indice.csv y cada archivo como NNN_fecha_nombre, en orden
+    cronológico. Los documentos sin archivo (solo enlace o archivo faltante) figuran en el
+    índice con su estado.
+    """
+    entradas = []
+    filas = []
+    for n, item in enumerate(documentos_expediente(db, contrato), 1):
+        fecha = item["fecha"].strftime("%Y-%m-%d") if item["fecha"] else ""
+        nombre_zip, tamano = "", ""
+        ruta = os.path.join(upload_dir, item["archivo"]) if item["archivo"] else None
+        if ruta and os.path.isfile(ruta):
+            nombre_zip = f"{n:03d}_{fecha or 'sin-fecha'}_{item['archivo']}"
+            entrada = EntradaZip(nombre_zip, ruta=ruta)
+            entradas.append(entrada)
+            tamano, estado = entrada.tamano, "incluido"
+        elif ruta:
+            estado = "archivo no encontrado"
+        else:
+            estado = "solo enlace" if item["enlace_drive"] else "sin archivo"
+        filas.append([n, fecha, item["tipo"], item["numero"] or "", item["asunto"] or "",
+                      nombre_zip, tamano, estado, item["enlace_drive"] or ""])
+
+    salida = io.StringIO()
+    escritor = csv.writer(salida)
+    escritor.writerow(COLUMNAS_INDICE)
+    escritor.writerows(filas)
+    # Con BOM para que Excel lea bien las tildes; la fecha es la del archivo más reciente
+    # para que el ZIP no cambie si no cambió el expediente
+    modificado = max((e.modificado for e in entradas), default=0)
+    indice = EntradaZip("000_indice.csv", contenido=salida.getvalue().encode("utf-8-sig"), modificado=modificado)
+    return ZipEnStreaming([indice] + entradas)
@@ -0,0 +1,206 @@
+"""
+Exportación de uploads como ZIP o tar generado al vuelo (contraparte de la restauración).
+- Incluye los archivos de UPLOAD_DIR y sus subcarpetas (plantillas/, con nombre relativo
+  'plantillas/x.docx'), sin ocultos, temporales ni restauraciones a medio terminar, y un
+  manifiesto.json con el sha256, tamaño y fecha de cada uno, en el formato que acepta
+  /api/restaurar-uploads.
+- Modo incremental: con el manifiesto de la exportación anterior solo se incluyen los
+  archivos nuevos o modificados (por sha256; si el manifiesto no lo trae, por tamaño y
+  fecha); con `desde` se incluyen los modificados desde esa fecha. El manifiesto de una
+  exportación incremental trae además el "inventario" completo, para encadenar la siguiente.
+- Los sha256 se guardan en HASHES_UPLOADS por (tamaño, mtime): solo se recalculan los
+  archivos nuevos o modificados, en EXPORTAR_HILOS hilos.
+- La salida es determinista (sin la hora actual en el manifiesto), así que se puede
+  reanudar con Range mientras los uploads no cambien.
+"""
+import hashlib
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Optional
+
+from database import STATE_DIR
+from .zip_service import EntradaZip, ZipEnStreaming, TarEnStreaming, BLOQUE
+
+HASHES_UPLOADS = os.getenv("HASHES_UPLOADS", os.path.join(STATE_DIR, "hashes_uploads.json"))
+EXPORTAR_HILOS = int(os.getenv("EXPORTAR_HILOS", "4"))
+
+NOMBRE_MANIFIESTO = "manifiesto.json"
+FORMATOS = {
+    "zip": (ZipEnStreaming, "application/zip"),
+    "tar": (TarEnStreaming, "application/x-tar"),
+}
+
+_lock_hashes = threading.Lock()
+
+
+def _exportable(nombre: str) -> bool:
+    return not (
+        nombre.startswith(".")
+        or nombre.startswith("temp_")
+        or ".restaurando." in nombre
+        or ".optimizando." in nombre
+    )
+
+
+def _sha256(ruta: str) -> str:
+    sha = hashlib.sha256()
+    with open(ruta, "rb") as f:
+        for bloque in iter(lambda: f.read(BLOQUE), b""):
+            sha.update(bloque)
+    return sha.hexdigest()
+
+
+def _leer_hashes() -> dict:
+    try:
+        with open(HASHES_UPLOADS, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _guardar_hashes(hashes: dict):
+    os.makedirs(os.path.dirname(HASHES_UPLOADS) or ".", exist_ok=True)
+    temporal = f"{HASHES_UPLOADS}.{os.getpid()}.tmp"
+    with open(temporal, "w", encoding="utf-8") as f:
+        json.dump(hashes, f, separators=(",", ":"))
+    os.replace(temporal, HASHES_UPLOADS)
+
+
+def _recorrer(upload_dir: str):
+    """(nombre relativo con '/', DirEntry) de cada archivo exportable, incluidas subcarpetas."""
+    pendientes = [""]
+    while pendientes:
+        relativa = pendientes.pop()
+        with os.scandir(os.path.join(upload_dir, relativa)) as it:
+            for item in it:
+                if not _exportable(item.name):
+                    continue
+                nombre = f"{relativa}/{item.name}" if relativa else item.name
+                if item.is_dir(follow_symlinks=False):
+                    pendientes.append(nombre)
+                elif item.is_file(follow_symlinks=False):
+                    yield nombre, item
+
+
+def inventario(upload_dir: str, hilos: int = EXPORTAR_HILOS) -> list:
+    """
+    Archivos exportables de upload_dir y sus subcarpetas ordenados por nombre relativo:
+    dicts (nombre, ruta, tamano, mtime_ns, sha256).
+    """
+    archivos = []
+    for nombre, item in _recorrer(upload_dir):
+        st = item.stat(follow_symlinks=False)
+        archivos.append({"nombre": nombre, "ruta": item.path,
+                         "tamano": st.st_size, "mtime_ns": st.st_mtime_ns, "sha256": None})
+    archivos.sort(key=lambda a: a["nombre"])
+
+    with _lock_hashes:
+        hashes = _leer_hashes()
+        pendientes = []
+        for archivo in archivos:
+            previo = hashes.get(archivo["nombre"])
+            if previo and previo[0] == archivo["tamano"] and previo[1] == archivo["mtime_ns"]:
+                archivo["sha256"] = previo[2]
+            else:
+                pendientes.append(archivo)
+        if pendientes:
+            with ThreadPoolExecutor(max_workers=max(1, hilos), thread_name_prefix="exportar") as ejecutor:
+                for archivo, sha in zip(pendientes, ejecutor.map(lambda a: _sha256(a["ruta"]), pendientes)):
+                    archivo["sha256"] = sha
+        vigentes = {a["nombre"]: [a["tamano"], a["mtime_ns"], a["sha256"]] for a in archivos}
+        if pendientes or len(vigentes) != len(hashes):
+            _guardar_hashes(vigentes)
+    return archivos
+
+
+def leer_manifiesto_previo(datos: bytes) -> dict:
+    """
+    nombre -> {"sha256", "tamano", "mtime"} (las claves que traiga) de una exportación
+    anterior. Acepta el manifiesto.json exportado o {nombre: sha256}. ValueError si no es válido.
+    """
+    try:
+        contenido = json.loads(datos.decode("utf-8-sig"))
+    except (UnicodeDecodeError, ValueError):
+        raise ValueError("El manifiesto no es un JSON válido")
+    if isinstance(contenido, dict):
+        if isinstance(contenido.get("inventario"), dict):
+            contenido = contenido["inventario"]
+        elif isinstance(contenido.get("archivos"), dict):
+            contenido = contenido["archivos"]
+    if not isinstance(contenido, dict):
+        raise ValueError("El manifiesto debe ser un objeto {nombre: sha256}")
+    previo = {}
+    for nombre, valor in contenido.items():
+        if isinstance(valor, str):
+            valor = {"sha256": valor}
+        if not isinstance(valor, dict):
+            raise ValueError(f"Entrada inválida para {nombre}")
+        previo[nombre] = valor
+    return previo
+
+
+def _sin_cambios(archivo: dict, previo: Optional[dict]) -> bool:
+    if previo is None:
+        return False
+    if isinstance(previo.get("sha256"), str):
+        return previo["sha256"].lower() == archivo["sha256"]
+    return (previo.get("tamano") == archivo["tamano"]
+            and previo.get("mtime") == _iso(archivo["mtime_ns"]))
+
+
+def _iso(mtime_ns: int) -> str:
+    return datetime.fromtimestamp(mtime_ns / 1e9).isoformat(timespec="seconds")
+
+
+def _datos(archivo: dict) -> dict:
+    return {"sha256": archivo["sha256"], "tamano": archivo["tamano"], "mtime": _iso(archivo["mtime_ns"])}
+
+
+def exportar(upload_dir: str, formato: str = "zip", previo: Optional[dict] = None,
+             desde: Optional[datetime] = None) -> tuple:
+    """
+    Plan de la exportación. Retorna (archivo en streaming, media type, resumen).
+    `previo` es el resultado de leer_manifiesto_previo; `desde` filtra por fecha de modificación.
+    """
+    if formato not in FORMATOS:
+        raise ValueError(f"Formato no soportado: {formato} (usar {' o '.join(FORMATOS)})")
+    archivos = inventario(upload_dir)
+    incluidos = archivos
+    if previo is not None:
+        incluidos = [a for a in incluidos if not _sin_cambios(a, previo.get(a["nombre"]))]
+    if desde is not None:
+        limite = desde.timestamp() * 1e9
+        incluidos = [a for a in incluidos if a["mtime_ns"] >= limite]
+
+    incremental = previo is not None or desde is not None
+    manifiesto = {
+        "formato": 1,
+        "incremental": incremental,
+        "hasta": _iso(max((a["mtime_ns"] for a in archivos), default=0)),
+        "archivos": {a["nombre"]: _datos(a) for a in incluidos},
+    }
+    if incremental:
+        manifiesto["desde"] = desde.isoformat(timespec="seconds") if desde else None
+        manifiesto["inventario"] = {a["nombre"]: _datos(a) for a in archivos}
+    if previo is not None:
+        actuales = {a["nombre"] for a in archivos}
+        manifiesto["eliminados"] = sorted(n for n in previo if n not in actuales)
+
+    entradas = [EntradaZip(a["nombre"], ruta=a["ruta"]) for a in incluidos]
+    # La fecha del manifiesto es la del archivo más reciente: mismo contenido, mismos bytes
+    contenido = json.dumps(manifiesto, indent=1, ensure_ascii=False, sort_keys=True).encode("utf-8")
+    modificado = max((e.modificado for e in entradas), default=0)
+    clase, media_type = FORMATOS[formato]
+    archivo = clase([EntradaZip(NOMBRE_MANIFIESTO, contenido=contenido, modificado=modificado)] + entradas)
+    resumen = {
+        "total": len(archivos),
+        "incluidos": len(incluidos),
+        "bytes": sum(a["tamano"] for a in incluidos),
+        "eliminados": len(manifiesto.get("eliminados", [])),
+    }
+    print(f"Exportación de uploads ({formato}{', incremental' if incremental else ''}): "
+          f"{resumen['incluidos']} de {resumen['total']} archivos, {resumen['bytes'] / 1024 / 1024:.1f} MB")
+    return archivo, media_type, resumen
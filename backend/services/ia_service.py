@@ -5,39 +5,197 @@ Con soporte OCR para PDFs con texto no extraíble
 import os
 import json
 import re
+import threading
+from collections import deque
+from functools import lru_cache
 from typing import Optional
-from openai import OpenAI
-from dotenv import load_dotenv
 
-# Cargar .env desde el directorio del backend
-env_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), '.env')
-load_dotenv(env_path)
+from .metrics_service import medir_etapa, metricas, Contador
 
-# Configuración de OCR
-try:
-    import pytesseract
-    from pdf2image import convert_from_path
-    from PIL import Image
+# El .env lo carga main.py una sola vez al arrancar.
+# openai, pytesseract, pdf2image y Pillow se importan en el primer uso (arranque más rápido).
 
-    # Configurar rutas de Tesseract y Poppler en Windows
-    TESSERACT_PATH = r"C:\Program Files\Tesseract-OCR\tesseract.exe"
-    POPPLER_PATH = r"C:\Users\NEERIVADENEIRA\poppler\poppler-24.08.0\Library\bin"
+# Rutas de Tesseract y Poppler en Windows
+TESSERACT_PATH = r"C:\Program Files\Tesseract-OCR\tesseract.exe"
+POPPLER_PATH = r"C:\Users\NEERIVADENEIRA\poppler\poppler-24.08.0\Library\bin"
+
+# OCR del número de oficio: primero solo la franja superior de la página (la fracción
+# OCR_ENCABEZADO_FRACCION) a OCR_NUMERO_DPI; si no aparece el número, la franja a
+# OCR_NUMERO_DPI_MAXIMO y por último la página completa.
+OCR_NUMERO_DPI = int(os.getenv("OCR_NUMERO_DPI", "150"))
+OCR_NUMERO_DPI_MAXIMO = int(os.getenv("OCR_NUMERO_DPI_MAXIMO", "300"))
+OCR_ENCABEZADO_FRACCION = float(os.getenv("OCR_ENCABEZADO_FRACCION", "0.4"))
+
+# OCR de documentos de varias páginas: procesos de Tesseract en paralelo y tiempo máximo
+# por página (rasterizar y OCR, cada uno)
+OCR_PROCESOS = int(os.getenv("OCR_PROCESOS", str(min(4, os.cpu_count() or 1))))
+OCR_TIMEOUT_PAGINA = float(os.getenv("OCR_TIMEOUT_PAGINA", "60"))
+
+_pool_procesos_ocr = None
+_lock_pool_ocr = threading.Lock()
+
+ocr_numero_resultados = metricas.registrar(Contador(
+    "ocr_numero_total", "Búsquedas del número con OCR por etapa en que se encontró", ("etapa",)))
+
+
+def opciones_poppler() -> dict:
+    """poppler_path solo si existe (en Windows); en Linux poppler está en el PATH."""
+    return {"poppler_path": POPPLER_PATH} if os.path.isdir(POPPLER_PATH) else {}
+
+
+@lru_cache(maxsize=None)
+def _cargar_ocr():
+    """
+    Importa las librerías de OCR la primera vez que se necesitan.
+    Retorna (pytesseract, convert_from_path) o None si no están instaladas.
+    """
+    try:
+        import pytesseract
+        from pdf2image import convert_from_path
+        from PIL import Image  # noqa: F401 - requerido por pytesseract/pdf2image
+    except ImportError as e:
+        print(f"OCR no disponible: {e}")
+        return None
 
     if os.path.exists(TESSERACT_PATH):
         pytesseract.pytesseract.tesseract_cmd = TESSERACT_PATH
-
-    OCR_DISPONIBLE = True
     print("OCR habilitado correctamente")
-except ImportError as e:
-    OCR_DISPONIBLE = False
-    POPPLER_PATH = None
-    print(f"OCR no disponible: {e}")
+    return pytesseract, convert_from_path
+
+
+def ocr_disponible() -> bool:
+    """True si pytesseract y pdf2image están instalados (las importa en la primera llamada)."""
+    return _cargar_ocr() is not None
+
+
+@lru_cache(maxsize=None)
+def idioma_ocr() -> str:
+    """'spa' si Tesseract tiene los datos en español (el Dockerfile los instala); si no 'eng'."""
+    try:
+        pytesseract, _ = _cargar_ocr()
+        return "spa" if "spa" in pytesseract.get_languages(config="") else "eng"
+    except Exception:
+        return "eng"
+
+
+def _ocr_de_pagina(ruta_pdf: str, pagina: int, dpi: int, idioma: str, timeout: float) -> str:
+    """
+    Rasteriza una sola página y le pasa Tesseract. Corre en los procesos del pool de OCR
+    (o en el mismo proceso para una sola página): solo hay una imagen en memoria por proceso.
+    """
+    pytesseract, convert_from_path = _cargar_ocr()
+    imagenes = convert_from_path(ruta_pdf, first_page=pagina, last_page=pagina, dpi=dpi,
+                                 timeout=timeout, **opciones_poppler())
+    if not imagenes:
+        return ""
+    return pytesseract.image_to_string(imagenes[0], lang=idioma, timeout=timeout)
+
+
+def _pool_ocr():
+    """Pool de procesos de OCR, creado en el primer documento de varias páginas."""
+    global _pool_procesos_ocr
+    with _lock_pool_ocr:
+        if _pool_procesos_ocr is None:
+            import multiprocessing
+            from concurrent.futures import ProcessPoolExecutor
+            # spawn: hacer fork de un servidor con hilos puede heredar locks tomados
+            _pool_procesos_ocr = ProcessPoolExecutor(max_workers=OCR_PROCESOS,
+                                                     mp_context=multiprocessing.get_context("spawn"))
+        return _pool_procesos_ocr
+
+
+def detener_pool_ocr():
+    """Cierra los procesos de OCR (al apagar la app)."""
+    global _pool_procesos_ocr
+    with _lock_pool_ocr:
+        if _pool_procesos_ocr is not None:
+            _pool_procesos_ocr.shutdown(wait=False, cancel_futures=True)
+            _pool_procesos_ocr = None
+
+
+def _descartar_pool_ocr(pool):
+    """
+    Cierra el pool y termina sus procesos: cancel() no detiene una tarea en curso, así que
+    un proceso colgado no suelta su lugar de otra forma. El siguiente envío crea uno nuevo.
+    """
+    global _pool_procesos_ocr
+    with _lock_pool_ocr:
+        if _pool_procesos_ocr is pool:
+            _pool_procesos_ocr = None
+    # ProcessPoolExecutor no expone sus procesos; se toman antes de que shutdown los suelte
+    procesos = list((getattr(pool, "_processes", None) or {}).values())
+    pool.shutdown(wait=False, cancel_futures=True)
+    for proceso in procesos:
+        if proceso.is_alive():
+            proceso.terminate()
+
+
+def _paginas_ocr(ruta_pdf: str, total: int, dpi: int, idioma: str):
+    """
+    Texto de cada página en orden. Con más de una página y OCR_PROCESOS > 1 las páginas
+    se reparten en el pool con una ventana de OCR_PROCESOS * 2 páginas en vuelo (la
+    memoria no crece con el largo del PDF). Una página que falla o pasa de
+    OCR_TIMEOUT_PAGINA queda vacía y se sigue con las demás; si no responde, el pool se
+    descarta con sus procesos y las páginas pendientes se reenvían a uno nuevo.
+    """
+    if total <= 1 or OCR_PROCESOS <= 1:
+        for pagina in range(1, total + 1):
+            try:
+                yield _ocr_de_pagina(ruta_pdf, pagina, dpi, idioma, OCR_TIMEOUT_PAGINA)
+            except Exception as e:
+                print(f"Error en OCR de la página {pagina}: {e}")
+                yield ""
+        return
+
+    from concurrent.futures import CancelledError, TimeoutError as TiempoAgotado
+    from concurrent.futures.process import BrokenProcessPool
+
+    def enviar(pagina: int) -> tuple:
+        pool = _pool_ocr()
+        return pool, pool.submit(_ocr_de_pagina, ruta_pdf, pagina, dpi, idioma, OCR_TIMEOUT_PAGINA)
+
+    def terminada(futuro) -> bool:
+        return futuro.done() and not futuro.cancelled() and futuro.exception() is None
+
+    # (página, pool, futuro, reenviada)
+    en_vuelo = deque()
+    siguiente = 1
+    while en_vuelo or siguiente <= total:
+        while siguiente <= total and len(en_vuelo) < OCR_PROCESOS * 2:
+            en_vuelo.append((siguiente, *enviar(siguiente), False))
+            siguiente += 1
+        pagina, pool, futuro, reenviada = en_vuelo.popleft()
+        try:
+            # Rasterizar y Tesseract tienen su propio timeout; este es el respaldo
+            yield futuro.result(timeout=OCR_TIMEOUT_PAGINA * 2 + 5)
+        except TiempoAgotado:
+            print(f"OCR de la página {pagina} sin respuesta en {OCR_TIMEOUT_PAGINA * 2 + 5:.0f}s: "
+                  f"se reinician los procesos de OCR")
+            _descartar_pool_ocr(pool)
+            en_vuelo = deque(
+                (p, f_pool, f, r) if terminada(f) else (p, *enviar(p), r)
+                for p, f_pool, f, r in en_vuelo
+            )
+            yield ""
+        except (BrokenProcessPool, CancelledError) as e:
+            # Otro documento descartó el pool (o murió un proceso): se reintenta una vez
+            _descartar_pool_ocr(pool)
+            if reenviada:
+                print(f"Error en OCR de la página {pagina}: {e or 'pool de OCR cerrado'}")
+                yield ""
+            else:
+                en_vuelo.appendleft((pagina, *enviar(pagina), True))
+        except Exception as e:
+            print(f"Error en OCR de la página {pagina}: {e}")
+            yield ""
 
 
 def extraer_texto_ocr(ruta_pdf: str, solo_primera_pagina: bool = True) -> str:
     """
     Extrae texto de un PDF usando OCR (Tesseract).
     Útil cuando pdfplumber no puede extraer texto correctamente.
+    Las páginas se rasterizan de a una (first_page/last_page) y, con varias, se procesan
+    en paralelo en el pool de procesos de OCR; el texto se arma en el orden de las páginas.
 
     Args:
         ruta_pdf: Ruta al archivo PDF
@@ -46,44 +204,84 @@ def extraer_texto_ocr(ruta_pdf: str, solo_primera_pagina: bool = True) -> str:
     Returns:
         Texto extraído con OCR
     """
-    if not OCR_DISPONIBLE:
+    if _cargar_ocr() is None:
         print("OCR no disponible - pytesseract o pdf2image no instalados")
         return ""
 
     try:
-        print(f"Iniciando OCR para: {ruta_pdf}")
-
-        # Convertir PDF a imágenes
-        if solo_primera_pagina:
-            images = convert_from_path(
-                ruta_pdf,
-                first_page=1,
-                last_page=1,
-                poppler_path=POPPLER_PATH,
-                dpi=300  # Mayor DPI = mejor calidad de OCR
-            )
-        else:
-            images = convert_from_path(
-                ruta_pdf,
-                poppler_path=POPPLER_PATH,
-                dpi=300
-            )
+        with medir_etapa("ocr"):
+            print(f"Iniciando OCR para: {ruta_pdf}")
+            if solo_primera_pagina:
+                total = 1
+            else:
+                from pdf2image import pdfinfo_from_path
+                total = int(pdfinfo_from_path(ruta_pdf, **opciones_poppler())["Pages"])
 
-        texto_ocr = ""
-        for i, imagen in enumerate(images):
-            print(f"Procesando página {i + 1} con OCR...")
-            # Extraer texto con Tesseract (inglés funciona bien para números y texto formal)
-            texto_pagina = pytesseract.image_to_string(imagen, lang='eng')
-            texto_ocr += texto_pagina + "\n"
+            # 300 DPI = mejor calidad de OCR; mismo idioma que el OCR del número
+            textos = list(_paginas_ocr(ruta_pdf, total, 300, idioma_ocr()))
+            texto_ocr = "".join(texto + "\n" for texto in textos)
 
-        print(f"OCR completado. Caracteres extraídos: {len(texto_ocr)}")
-        return texto_ocr
+            print(f"OCR completado: {total} página(s), {len(texto_ocr)} caracteres")
+            return texto_ocr
 
     except Exception as e:
         print(f"Error en OCR: {e}")
         return ""
 
 
+def _etapas_ocr_numero() -> list:
+    """(dpi, solo encabezado) en el orden en que se prueban."""
+    etapas = [(OCR_NUMERO_DPI, True)]
+    if OCR_NUMERO_DPI_MAXIMO > OCR_NUMERO_DPI:
+        etapas.append((OCR_NUMERO_DPI_MAXIMO, True))
+    etapas.append((max(OCR_NUMERO_DPI, OCR_NUMERO_DPI_MAXIMO), False))
+    return etapas
+
+
+def numero_con_ocr_escalonado(ruta_pdf: str) -> tuple:
+    """
+    Busca el número con OCR de la primera página empezando por lo más barato (la franja
+    del encabezado a baja resolución) y escalando solo si los patrones no coinciden.
+    Cada resolución se rasteriza una sola vez (la página completa reutiliza la imagen).
+
+    Returns:
+        (número o "", etapa en que se encontró: "encabezado@150", "pagina@300", ... o "")
+    """
+    modulos_ocr = _cargar_ocr()
+    if modulos_ocr is None:
+        print("OCR no disponible - pytesseract o pdf2image no instalados")
+        return "", ""
+    pytesseract, convert_from_path = modulos_ocr
+    idioma = idioma_ocr()
+
+    paginas = {}
+    try:
+        with medir_etapa("ocr"):
+            for dpi, solo_encabezado in _etapas_ocr_numero():
+                if dpi not in paginas:
+                    imagenes = convert_from_path(ruta_pdf, first_page=1, last_page=1, dpi=dpi,
+                                                 grayscale=True, **opciones_poppler())
+                    if not imagenes:
+                        return "", ""
+                    paginas[dpi] = imagenes[0]
+                imagen = paginas[dpi]
+                if solo_encabezado:
+                    imagen = imagen.crop((0, 0, imagen.width, int(imagen.height * OCR_ENCABEZADO_FRACCION)))
+                etapa = f"{'encabezado' if solo_encabezado else 'pagina'}@{dpi}"
+                numero = numero_en_encabezado(pytesseract.image_to_string(imagen, lang=idioma))
+                if numero:
+                    print(f"Número encontrado con OCR ({etapa}, {idioma}): {numero}")
+                    ocr_numero_resultados.inc(etapa)
+                    return numero, etapa
+    except Exception as e:
+        print(f"Error en OCR: {e}")
+        return "", ""
+
+    print("No se encontró número de oficio/carta con OCR en el encabezado")
+    ocr_numero_resultados.inc("sin_numero")
+    return "", ""
+
+
 def extraer_numero_con_ocr(ruta_pdf: str) -> str:
     """
     Extrae específicamente el número de oficio/carta usando OCR.
@@ -96,16 +294,18 @@ def extraer_numero_con_ocr(ruta_pdf: str) -> str:
     Returns:
         Número de oficio encontrado o cadena vacía
     """
-    texto_ocr = extraer_texto_ocr(ruta_pdf, solo_primera_pagina=True)
+    numero, _ = numero_con_ocr_escalonado(ruta_pdf)
+    return numero
+
 
+def numero_en_encabezado(texto_ocr: str) -> str:
+    """
+    Número de oficio/carta del texto OCR de la primera página (o de su encabezado).
+    Solo mira lo que está antes de "Referencia", "Señor", etc.
+    """
     if not texto_ocr:
         return ""
 
-    print("=" * 50)
-    print("TEXTO OCR (primeros 500 caracteres):")
-    print(texto_ocr[:500])
-    print("=" * 50)
-
     # Extraer solo el texto del ENCABEZADO (antes de "Referencia", "Señor", "De mi consideración")
     # Esto evita capturar números de oficios mencionados en la sección de referencias
     texto_encabezado = texto_ocr
@@ -114,11 +314,6 @@ def extraer_numero_con_ocr(ruta_pdf: str) -> str:
         if pos > 0 and pos < len(texto_encabezado):
             texto_encabezado = texto_ocr[:pos]
 
-    print("=" * 50)
-    print("TEXTO ENCABEZADO (para extraer número):")
-    print(texto_encabezado[:300])
-    print("=" * 50)
-
     # Buscar patrones de número de oficio/carta en el ENCABEZADO
     patrones = [
         # Carta N° 000100-2026-NEMAEC/PRESIDENCIA (formato NEMAEC - prioridad alta, 1-6 dígitos)
@@ -149,10 +344,8 @@ def extraer_numero_con_ocr(ruta_pdf: str) -> str:
                 tipo = "OFICIO" if "OFICIO" in patron else "CARTA"
                 resultado = f"{tipo} N°{numero}-{anio}-{sufijo}"
 
-            print(f"Número encontrado con OCR (del encabezado): {resultado}")
             return resultado
 
-    print("No se encontró número de oficio/carta con OCR en el encabezado")
     return ""
 
 
@@ -281,10 +474,15 @@ class IAService:
 
     def __init__(self):
         self.api_key = os.getenv("OPENAI_API_KEY")
-        if self.api_key:
-            self.client = OpenAI(api_key=self.api_key)
-        else:
-            self.client = None
+        self._client = None
+
+    @property
+    def client(self):
+        """Cliente de OpenAI; se importa y crea en el primer uso. None si no hay API key."""
+        if self._client is None and self.api_key:
+            from openai import OpenAI
+            self._client = OpenAI(api_key=self.api_key)
+        return self._client
 
     def analizar_documento(self, texto: str) -> dict:
         """
@@ -396,16 +594,17 @@ Responde ÚNICAMENTE con un JSON válido:
 }}"""
 
         try:
-            response = self.client.chat.completions.create(
-                model="gpt-4o-mini",
-                max_tokens=1024,
-                messages=[
-                    {
-                        "role": "user",
-                        "content": prompt
-                    }
-                ]
-            )
+            with medir_etapa("openai"):
+                response = self.client.chat.completions.create(
+                    model="gpt-4o-mini",
+                    max_tokens=1024,
+                    messages=[
+                        {
+                            "role": "user",
+                            "content": prompt
+                        }
+                    ]
+                )
 
             # Extraer el texto de la respuesta
             content = response.choices[0].message.content.strip()
@@ -0,0 +1,211 @@
+"""
+Limitación de intentos de login.
+- Cubetas de tokens por IP y por usuario, que se reponen a ritmo constante; sin tokens
+  se rechaza con 429 antes de calcular bcrypt. Por IP cuenta cada intento; por usuario
+  solo los fallidos, para que un tercero no agote el cupo de una cuenta con logins
+  cualquiera mientras su dueño entra bien. Aun así, quien conozca un usuario puede
+  bloquearlo unos minutos fallando a propósito: es el costo de frenar la adivinación
+  de contraseñas de una cuenta desde muchas IPs.
+- La IP es la del cliente según uvicorn: detrás del proxy (Easypanel/Traefik) start.sh
+  confía en X-Forwarded-For de FORWARDED_ALLOW_IPS; sin eso todos los clientes tendrían
+  la IP del proxy y compartirían una sola cubeta.
+- Semáforo de verificaciones bcrypt simultáneas: si ya hay LOGIN_MAX_CONCURRENTES
+  verificaciones en curso, el intento se rechaza de inmediato en lugar de ocupar
+  un hilo más del threadpool (que comparten todos los endpoints síncronos).
+Con varios workers las cubetas se guardan en la base (tabla cubetas_limite) para que
+el límite sea el mismo sin importar a qué proceso llegue cada intento; el semáforo
+sigue siendo por proceso porque protege el threadpool de cada uno.
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from sqlalchemy import text
+
+from database import engine, ES_SQLITE, WEB_CONCURRENCY
+
+# Intentos permitidos en ráfaga y reposición (intentos por minuto) por IP y por usuario
+LOGIN_RAFAGA_IP = int(os.getenv("LOGIN_RAFAGA_IP", "10"))
+LOGIN_POR_MINUTO_IP = float(os.getenv("LOGIN_POR_MINUTO_IP", "10"))
+LOGIN_RAFAGA_USUARIO = int(os.getenv("LOGIN_RAFAGA_USUARIO", "5"))
+LOGIN_POR_MINUTO_USUARIO = float(os.getenv("LOGIN_POR_MINUTO_USUARIO", "5"))
+# Verificaciones bcrypt simultáneas como máximo
+LOGIN_MAX_CONCURRENTES = int(os.getenv("LOGIN_MAX_CONCURRENTES", "2"))
+# Espera máxima por un cupo de verificación antes de rechazar (segundos)
+LOGIN_ESPERA_CUPO = float(os.getenv("LOGIN_ESPERA_CUPO", "0.25"))
+# Claves distintas recordadas por cubeta (las menos usadas se descartan)
+MAX_CLAVES = 10_000
+
+
+class LimiteExcedido(Exception):
+    """Se superó un límite; `reintentar_en` son los segundos sugeridos para Retry-After."""
+
+    def __init__(self, motivo: str, reintentar_en: float):
+        super().__init__(motivo)
+        self.motivo = motivo
+        self.reintentar_en = reintentar_en
+
+
+class CubetasTokens:
+    """Una cubeta de tokens por clave (IP o usuario), con cantidad de claves acotada."""
+
+    def __init__(self, capacidad: int, por_minuto: float, max_claves: int = MAX_CLAVES):
+        self.capacidad = capacidad
+        self.por_segundo = por_minuto / 60
+        self.max_claves = max_claves
+        self._cubetas = OrderedDict()  # clave -> [tokens, último instante]
+        self._lock = threading.Lock()
+
+    def consumir(self, clave: str) -> float:
+        """Consume un token. Retorna 0 si había, o los segundos hasta el próximo token."""
+        ahora = time.monotonic()
+        with self._lock:
+            cubeta = self._cubetas.get(clave)
+            if cubeta is None:
+                cubeta = self._cubetas[clave] = [float(self.capacidad), ahora]
+                while len(self._cubetas) > self.max_claves:
+                    self._cubetas.popitem(last=False)
+            else:
+                self._cubetas.move_to_end(clave)
+                cubeta[0] = min(self.capacidad, cubeta[0] + (ahora - cubeta[1]) * self.por_segundo)
+                cubeta[1] = ahora
+            if cubeta[0] >= 1:
+                cubeta[0] -= 1
+                return 0.0
+            return (1 - cubeta[0]) / self.por_segundo if self.por_segundo > 0 else 60.0
+
+    def espera(self, clave: str) -> float:
+        """Como consumir, pero sin consumir: 0 si queda al menos un token."""
+        ahora = time.monotonic()
+        with self._lock:
+            cubeta = self._cubetas.get(clave)
+            if cubeta is None:
+                return 0.0
+            tokens = min(self.capacidad, cubeta[0] + (ahora - cubeta[1]) * self.por_segundo)
+        if tokens >= 1:
+            return 0.0
+        return (1 - tokens) / self.por_segundo if self.por_segundo > 0 else 60.0
+
+    def reiniciar(self, clave: str):
+        with self._lock:
+            self._cubetas.pop(clave, None)
+
+
+class CubetasTokensCompartidas:
+    """
+    Misma interfaz que CubetasTokens, con las cubetas en la tabla cubetas_limite.
+    Cada consumo es un UPDATE condicional (atómico en SQLite), sin lecturas previas.
+    """
+
+    # Cada cuántos consumos se borran las cubetas ya llenas (equivalen a no tener fila)
+    LIMPIAR_CADA = 500
+
+    def __init__(self, nombre: str, capacidad: int, por_minuto: float):
+        self.nombre = nombre
+        self.capacidad = capacidad
+        self.por_segundo = por_minuto / 60
+        self._consumos = 0
+
+    def consumir(self, clave: str) -> float:
+        """Consume un token. Retorna 0 si había, o los segundos hasta el próximo token."""
+        ahora = time.time()
+        parametros = {"cubeta": self.nombre, "clave": clave, "ahora": ahora,
+                      "capacidad": self.capacidad, "por_segundo": self.por_segundo}
+        minimo = "MIN" if ES_SQLITE else "LEAST"  # MIN escalar de dos argumentos es propio de SQLite
+        repuestos = f"{minimo}(:capacidad, tokens + (:ahora - actualizado) * :por_segundo)"
+        with engine.begin() as conn:
+            self._consumos += 1
+            if self._consumos % self.LIMPIAR_CADA == 0 and self.por_segundo > 0:
+                conn.execute(text(
+                    "DELETE FROM cubetas_limite WHERE cubeta = :cubeta AND actualizado < :limite"
+                ), {"cubeta": self.nombre, "limite": ahora - self.capacidad / self.por_segundo})
+
+            # Dos vueltas: si otro worker crea la fila entre el SELECT y el INSERT, se reintenta el UPDATE
+            for _ in range(2):
+                consumido = conn.execute(text(
+                    f"UPDATE cubetas_limite SET tokens = {repuestos} - 1, actualizado = :ahora "
+                    f"WHERE cubeta = :cubeta AND clave = :clave AND {repuestos} >= 1"
+                ), parametros).rowcount
+                if consumido:
+                    return 0.0
+                tokens = conn.execute(text(
+                    f"SELECT {repuestos} FROM cubetas_limite WHERE cubeta = :cubeta AND clave = :clave"
+                ), parametros).scalar()
+                if tokens is not None:
+                    break
+                creada = conn.execute(text(
+                    "INSERT INTO cubetas_limite (cubeta, clave, tokens, actualizado) "
+                    "VALUES (:cubeta, :clave, :capacidad - 1, :ahora) ON CONFLICT (cubeta, clave) DO NOTHING"
+                ), parametros).rowcount
+                if creada:
+                    return 0.0
+            else:
+                return 0.0
+        return (1 - tokens) / self.por_segundo if self.por_segundo > 0 else 60.0
+
+    def espera(self, clave: str) -> float:
+        """Como consumir, pero sin consumir: 0 si queda al menos un token."""
+        minimo = "MIN" if ES_SQLITE else "LEAST"
+        with engine.connect() as conn:
+            tokens = conn.execute(text(
+                f"SELECT {minimo}(:capacidad, tokens + (:ahora - actualizado) * :por_segundo) "
+                "FROM cubetas_limite WHERE cubeta = :cubeta AND clave = :clave"
+            ), {"cubeta": self.nombre, "clave": clave, "ahora": time.time(),
+                "capacidad": self.capacidad, "por_segundo": self.por_segundo}).scalar()
+        if tokens is None or tokens >= 1:
+            return 0.0
+        return (1 - tokens) / self.por_segundo if self.por_segundo > 0 else 60.0
+
+    def reiniciar(self, clave: str):
+        with engine.begin() as conn:
+            conn.execute(text("DELETE FROM cubetas_limite WHERE cubeta = :cubeta AND clave = :clave"),
+                         {"cubeta": self.nombre, "clave": clave})
+
+
+class LimitadorLogin:
+    """Límites del endpoint de login."""
+
+    def __init__(self, compartido: bool = WEB_CONCURRENCY > 1):
+        if compartido:
+            self.por_ip = CubetasTokensCompartidas("ip", LOGIN_RAFAGA_IP, LOGIN_POR_MINUTO_IP)
+            self.por_usuario = CubetasTokensCompartidas("usuario", LOGIN_RAFAGA_USUARIO, LOGIN_POR_MINUTO_USUARIO)
+        else:
+            self.por_ip = CubetasTokens(LOGIN_RAFAGA_IP, LOGIN_POR_MINUTO_IP)
+            self.por_usuario = CubetasTokens(LOGIN_RAFAGA_USUARIO, LOGIN_POR_MINUTO_USUARIO)
+        self._cupos = threading.BoundedSemaphore(LOGIN_MAX_CONCURRENTES)
+
+    def registrar_intento(self, ip: str, username: str):
+        """
+        Consume un intento de la IP y verifica (sin consumir) que al usuario le queden
+        intentos fallidos; lanza LimiteExcedido si no.
+        """
+        espera = self.por_ip.consumir(ip)
+        if espera:
+            raise LimiteExcedido("Demasiados intentos desde esta dirección", espera)
+        espera = self.por_usuario.espera(username.strip().lower())
+        if espera:
+            raise LimiteExcedido("Demasiados intentos fallidos para este usuario", espera)
+
+    def login_fallido(self, username: str):
+        """Un usuario o contraseña incorrectos consumen un intento del usuario."""
+        self.por_usuario.consumir(username.strip().lower())
+
+    def login_exitoso(self, username: str):
+        """Un login correcto devuelve al usuario su cupo completo."""
+        self.por_usuario.reiniciar(username.strip().lower())
+
+    @contextmanager
+    def cupo_verificacion(self):
+        """Reserva un cupo para verificar la contraseña o lanza LimiteExcedido."""
+        if not self._cupos.acquire(timeout=LOGIN_ESPERA_CUPO):
+            raise LimiteExcedido("Servidor ocupado verificando credenciales", 1)
+        try:
+            yield
+        finally:
+            self._cupos.release()
+
+
+# Instancia global
+limitador_login = LimitadorLogin()
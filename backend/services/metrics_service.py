@@ -0,0 +1,306 @@
+"""
+Métricas en memoria con exposición en formato texto de Prometheus.
+- Middleware ASGI: latencia, tamaño de respuesta, código de estado y consultas SQL por ruta
+- medir_etapa(): temporizador para las etapas pesadas (pdfplumber, OCR, OpenAI, DOCX, ...)
+Con varios workers cada proceso escribe periódicamente una instantánea de sus métricas
+en STATE_DIR/metricas/<pid>.json y /metrics suma las de todos los procesos vivos.
+"""
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from database import iniciar_conteo_consultas, terminar_conteo_consultas, STATE_DIR, WEB_CONCURRENCY
+
+# Buckets en segundos para latencias de requests y etapas (OCR y LLM pueden tardar decenas de segundos)
+BUCKETS_LATENCIA = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+# Buckets en bytes para tamaños de respuesta
+BUCKETS_BYTES = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216, 67108864)
+# Buckets para cantidad de consultas SQL por request
+BUCKETS_CONSULTAS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+# Cada cuántos segundos un worker publica su instantánea (multi-worker)
+METRICS_SNAPSHOT_SECONDS = float(os.getenv("METRICS_SNAPSHOT_SECONDS", "5"))
+DIRECTORIO_INSTANTANEAS = os.path.join(STATE_DIR, "metricas")
+
+
+def _escapar(valor: str) -> str:
+    return str(valor).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _formatear_labels(nombres: tuple, valores: tuple, extra: str = "") -> str:
+    partes = [f'{n}="{_escapar(v)}"' for n, v in zip(nombres, valores)]
+    if extra:
+        partes.append(extra)
+    return "{" + ",".join(partes) + "}" if partes else ""
+
+
+def _formatear_numero(valor: float) -> str:
+    if valor == float("inf"):
+        return "+Inf"
+    if float(valor).is_integer():
+        return str(int(valor))
+    return repr(float(valor))
+
+
+class Contador:
+    """Contador monótono con labels."""
+    tipo = "counter"
+
+    def __init__(self, nombre: str, ayuda: str, labels: tuple = ()):
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self.labels = labels
+        self._valores = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *valores_labels, cantidad: float = 1):
+        with self._lock:
+            self._valores[valores_labels] = self._valores.get(valores_labels, 0) + cantidad
+
+    def instantanea(self) -> list:
+        """Valores serializables a JSON: [[labels], valor]."""
+        with self._lock:
+            return [[list(k), v] for k, v in self._valores.items()]
+
+    def exponer(self, otras: list = ()) -> list:
+        """Líneas de exposición, sumando las instantáneas de otros procesos."""
+        with self._lock:
+            valores = dict(self._valores)
+        for instantanea in otras:
+            for labels, valor in instantanea:
+                k = tuple(labels)
+                valores[k] = valores.get(k, 0) + valor
+        items = sorted(valores.items())
+        return [f"{self.nombre}{_formatear_labels(self.labels, k)} {_formatear_numero(v)}" for k, v in items]
+
+
+class Medidor(Contador):
+    """Valor que sube y baja (p. ej. requests en curso)."""
+    tipo = "gauge"
+
+    def dec(self, *valores_labels, cantidad: float = 1):
+        self.inc(*valores_labels, cantidad=-cantidad)
+
+
+class Histograma:
+    """Histograma acumulado con buckets fijos."""
+    tipo = "histogram"
+
+    def __init__(self, nombre: str, ayuda: str, labels: tuple = (), buckets: tuple = BUCKETS_LATENCIA):
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self.labels = labels
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}   # labels -> [conteos por bucket..., suma, total]
+        self._lock = threading.Lock()
+
+    def observar(self, valor: float, *valores_labels):
+        with self._lock:
+            serie = self._series.get(valores_labels)
+            if serie is None:
+                serie = self._series[valores_labels] = [0] * (len(self.buckets) + 2)
+            for i, limite in enumerate(self.buckets):
+                if valor <= limite:
+                    serie[i] += 1
+            serie[-2] += valor
+            serie[-1] += 1
+
+    def instantanea(self) -> list:
+        """Series serializables a JSON: [[labels], [conteos..., suma, total]]."""
+        with self._lock:
+            return [[list(k), list(v)] for k, v in self._series.items()]
+
+    def exponer(self, otras: list = ()) -> list:
+        """Líneas de exposición, sumando las instantáneas de otros procesos."""
+        with self._lock:
+            series = {k: list(v) for k, v in self._series.items()}
+        for instantanea in otras:
+            for labels, serie in instantanea:
+                k = tuple(labels)
+                if k not in series:
+                    series[k] = list(serie)
+                elif len(serie) == len(series[k]):
+                    series[k] = [a + b for a, b in zip(series[k], serie)]
+        items = sorted(series.items())
+        lineas = []
+        for valores_labels, serie in items:
+            for limite, conteo in zip(self.buckets, serie):
+                le = f'le="{_formatear_numero(limite)}"'
+                lineas.append(f"{self.nombre}_bucket{_formatear_labels(self.labels, valores_labels, le)} {conteo}")
+            le_inf = _formatear_labels(self.labels, valores_labels, 'le="+Inf"')
+            lineas.append(f"{self.nombre}_bucket{le_inf} {serie[-1]}")
+            lineas.append(f"{self.nombre}_sum{_formatear_labels(self.labels, valores_labels)} {_formatear_numero(serie[-2])}")
+            lineas.append(f"{self.nombre}_count{_formatear_labels(self.labels, valores_labels)} {serie[-1]}")
+        return lineas
+
+
+class RegistroMetricas:
+    """Conjunto de métricas del proceso."""
+
+    def __init__(self):
+        self._metricas = []
+        self.inicio = time.time()
+
+        self.requests_total = self._registrar(Contador(
+            "http_requests_total", "Requests HTTP atendidos", ("method", "route", "status")))
+        self.request_duracion = self._registrar(Histograma(
+            "http_request_duration_seconds", "Latencia de requests HTTP", ("method", "route")))
+        self.respuesta_bytes = self._registrar(Histograma(
+            "http_response_size_bytes", "Tamaño del cuerpo de respuesta", ("method", "route"), BUCKETS_BYTES))
+        self.en_curso = self._registrar(Medidor(
+            "http_requests_in_flight", "Requests HTTP en curso"))
+        self.etapa_duracion = self._registrar(Histograma(
+            "etapa_duration_seconds", "Duración de etapas pesadas (pdfplumber, ocr, openai, docx, soffice, openpyxl)",
+            ("etapa",)))
+        self.etapa_errores = self._registrar(Contador(
+            "etapa_errors_total", "Etapas que terminaron con excepción", ("etapa",)))
+        self.db_consultas = self._registrar(Histograma(
+            "http_request_db_queries", "Consultas SQL emitidas por request", ("method", "route"), BUCKETS_CONSULTAS))
+        self.db_segundos = self._registrar(Contador(
+            "http_request_db_seconds_total", "Tiempo total en consultas SQL", ("method", "route")))
+
+    def _registrar(self, metrica):
+        self._metricas.append(metrica)
+        return metrica
+
+    def registrar(self, metrica):
+        """Agrega una métrica adicional al registro (otros módulos)."""
+        return self._registrar(metrica)
+
+    def exponer(self) -> str:
+        """Texto en formato de exposición de Prometheus (version 0.0.4)."""
+        otras = self._leer_instantaneas() if WEB_CONCURRENCY > 1 else []
+        lineas = [
+            "# HELP process_start_time_seconds Inicio del proceso (epoch)",
+            "# TYPE process_start_time_seconds gauge",
+            f"process_start_time_seconds {_formatear_numero(self.inicio)}",
+        ]
+        if WEB_CONCURRENCY > 1:
+            lineas += [
+                "# HELP gestor_workers_reportando Workers cuyas métricas se incluyen",
+                "# TYPE gestor_workers_reportando gauge",
+                f"gestor_workers_reportando {len(otras) + 1}",
+            ]
+        for m in self._metricas:
+            lineas.append(f"# HELP {m.nombre} {m.ayuda}")
+            lineas.append(f"# TYPE {m.nombre} {m.tipo}")
+            lineas.extend(m.exponer([o[m.nombre] for o in otras if m.nombre in o]))
+        return "\n".join(lineas) + "\n"
+
+    # ── Multi-worker ──
+
+    def escribir_instantanea(self):
+        """Publica las métricas de este proceso (escritura atómica con rename)."""
+        os.makedirs(DIRECTORIO_INSTANTANEAS, exist_ok=True)
+        ruta = os.path.join(DIRECTORIO_INSTANTANEAS, f"{os.getpid()}.json")
+        temporal = f"{ruta}.tmp"
+        with open(temporal, "w", encoding="utf-8") as f:
+            json.dump({m.nombre: m.instantanea() for m in self._metricas}, f)
+        os.replace(temporal, ruta)
+
+    def _leer_instantaneas(self) -> list:
+        """Instantáneas de los otros workers; se ignoran las de procesos que dejaron de publicar."""
+        if not os.path.isdir(DIRECTORIO_INSTANTANEAS):
+            return []
+        propia = f"{os.getpid()}.json"
+        limite = time.time() - 3 * METRICS_SNAPSHOT_SECONDS
+        instantaneas = []
+        for nombre in os.listdir(DIRECTORIO_INSTANTANEAS):
+            ruta = os.path.join(DIRECTORIO_INSTANTANEAS, nombre)
+            if nombre == propia or not nombre.endswith(".json"):
+                continue
+            try:
+                if os.path.getmtime(ruta) < limite:
+                    continue
+                with open(ruta, encoding="utf-8") as f:
+                    instantaneas.append(json.load(f))
+            except (OSError, ValueError):
+                continue  # el archivo se está reemplazando o el worker terminó
+        return instantaneas
+
+    def iniciar_publicacion(self):
+        """Hilo que publica la instantánea cada METRICS_SNAPSHOT_SECONDS (solo con varios workers)."""
+        if WEB_CONCURRENCY <= 1:
+            return
+
+        def publicar():
+            while True:
+                try:
+                    self.escribir_instantanea()
+                except OSError as e:
+                    print(f"Advertencia: no se pudo publicar la instantánea de métricas: {e}")
+                time.sleep(METRICS_SNAPSHOT_SECONDS)
+
+        threading.Thread(target=publicar, name="metricas-instantanea", daemon=True).start()
+
+
+# Instancia global del registro
+metricas = RegistroMetricas()
+
+
+@contextmanager
+def medir_etapa(etapa: str):
+    """
+    Mide la duración de una etapa pesada. Se usa como `with medir_etapa("ocr"):`
+    o como decorador `@medir_etapa("docx")`.
+    """
+    inicio = time.perf_counter()
+    try:
+        yield
+    except BaseException:
+        metricas.etapa_errores.inc(etapa)
+        raise
+    finally:
+        metricas.etapa_duracion.observar(time.perf_counter() - inicio, etapa)
+
+
+class MetricsMiddleware:
+    """
+    Middleware ASGI que registra latencia, tamaño de respuesta, código de estado,
+    requests en curso y consultas SQL. La ruta se etiqueta con la plantilla
+    (/api/documentos/{documento_id}) para no generar una serie por cada id.
+    Agrega el header Server-Timing con la cantidad y el tiempo de las consultas SQL.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        inicio = time.perf_counter()
+        estado = {"status": 500, "bytes": 0}
+        consultas, token = iniciar_conteo_consultas(scope)
+
+        async def send_con_metricas(message):
+            if message["type"] == "http.response.start":
+                estado["status"] = message["status"]
+                server_timing = (
+                    f'db;dur={consultas.segundos * 1000:.1f};desc="{consultas.consultas} consultas", '
+                    f'app;dur={(time.perf_counter() - inicio) * 1000:.1f}'
+                )
+                message["headers"] = list(message.get("headers", [])) + [
+                    (b"server-timing", server_timing.encode("latin-1"))
+                ]
+            elif message["type"] == "http.response.body":
+                estado["bytes"] += len(message.get("body", b""))
+            await send(message)
+
+        metricas.en_curso.inc()
+        try:
+            await self.app(scope, receive, send_con_metricas)
+        finally:
+            terminar_conteo_consultas(token)
+            metricas.en_curso.dec()
+            duracion = time.perf_counter() - inicio
+            ruta = getattr(scope.get("route"), "path", None) or "sin_ruta"
+            metodo = scope.get("method", "")
+            metricas.requests_total.inc(metodo, ruta, str(estado["status"]))
+            metricas.request_duracion.observar(duracion, metodo, ruta)
+            metricas.respuesta_bytes.observar(estado["bytes"], metodo, ruta)
+            metricas.db_consultas.observar(consultas.consultas, metodo, ruta)
+            metricas.db_segundos.inc(metodo, ruta, cantidad=consultas.segundos)
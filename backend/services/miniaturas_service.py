@@ -0,0 +1,265 @@
+"""
+Miniaturas de la primera página de los documentos y del expediente (vista previa en la
+bandeja y en el detalle sin descargar el PDF).
+- Se generan en un hilo aparte (precalentar): al subir el archivo o, para los archivos
+  anteriores, en la primera consulta, que responde "pendiente" sin leer ni renderizar
+  nada en el hilo del request. MINIATURA_ANCHO px de ancho, en WebP (PNG si Pillow no
+  tiene WebP).
+- Quedan en MINIATURAS_DIR con el sha256 del contenido en el nombre: el mismo archivo da
+  siempre la misma URL, así que se sirven como inmutables, y un archivo reemplazado tiene
+  otra clave. Los sha256 se recuerdan en memoria por (ruta, tamaño, mtime).
+- Con poppler (pdf2image) se rasteriza la página; sin poppler se usa la imagen más grande
+  de la página (los escaneos son una imagen por página). Los PDF sin imágenes quedan sin
+  miniatura hasta que haya poppler.
+- Un lock por clave (entre procesos) evita que dos requests rendericen la misma miniatura
+  y MINIATURAS_CONCURRENCIA limita cuántas se renderizan a la vez en cada proceso.
+- Si MINIATURAS_DIR pasa de MINIATURAS_MAX_MB se borran las menos usadas (por mtime; al
+  servir una miniatura se actualiza su mtime, como mucho una vez por hora).
+"""
+import hashlib
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from typing import Optional
+
+from database import DATABASE_PATH, bloqueo_exclusivo
+from .almacenamiento_service import tipo_mime, MIME_PDF
+from .ia_service import opciones_poppler
+from .metrics_service import metricas, Contador
+
+MINIATURAS_DIR = os.getenv("MINIATURAS_DIR", os.path.join(os.path.dirname(DATABASE_PATH), "miniaturas"))
+MINIATURA_ANCHO = int(os.getenv("MINIATURA_ANCHO", "240"))
+MINIATURAS_MAX_MB = float(os.getenv("MINIATURAS_MAX_MB", "200"))
+MINIATURAS_CONCURRENCIA = int(os.getenv("MINIATURAS_CONCURRENCIA", "2"))
+
+# Cambiar al modificar el renderizado: invalida las miniaturas ya generadas
+VERSION_FORMATO = "1"
+MIME_IMAGEN = {"webp": "image/webp", "png": "image/png"}
+_CLAVE_VALIDA = re.compile(r"^[0-9a-f]{32}_\d+v\d+\.(webp|png)$")
+_TOCAR_CADA_SEGUNDOS = 3600
+_HASHES_EN_MEMORIA = 4096
+# Los locks por clave se reparten en franjas para no crear un archivo de lock por miniatura
+_FRANJAS_LOCK = 16
+
+miniaturas_generadas = metricas.registrar(Contador(
+    "miniaturas_total", "Miniaturas pedidas por resultado", ("resultado",)))
+
+_renderizando = threading.BoundedSemaphore(max(1, MINIATURAS_CONCURRENCIA))
+_lock_hashes = threading.Lock()
+_hashes = OrderedDict()
+# Claves que no se pudieron generar (no se reintentan en cada request hasta reiniciar)
+_sin_miniatura = set()
+_lock_poda = threading.Lock()
+_bytes_estimados = None
+_precalentador = ThreadPoolExecutor(max_workers=1, thread_name_prefix="miniaturas")
+# Rutas ya encoladas en el precalentador (una bandeja pide muchas a la vez)
+_en_cola = set()
+_lock_cola = threading.Lock()
+
+
+@lru_cache(maxsize=None)
+def _formato() -> str:
+    from PIL import features
+    return "webp" if features.check("webp") else "png"
+
+
+def _sha256(ruta: str) -> str:
+    """sha256 del archivo, recordado por (ruta, tamaño, mtime)."""
+    st = os.stat(ruta)
+    llave = (ruta, st.st_size, st.st_mtime_ns)
+    with _lock_hashes:
+        if llave in _hashes:
+            _hashes.move_to_end(llave)
+            return _hashes[llave]
+    sha = hashlib.sha256()
+    with open(ruta, "rb") as f:
+        for bloque in iter(lambda: f.read(1024 * 1024), b""):
+            sha.update(bloque)
+    with _lock_hashes:
+        _hashes[llave] = sha.hexdigest()
+        while len(_hashes) > _HASHES_EN_MEMORIA:
+            _hashes.popitem(last=False)
+    return sha.hexdigest()
+
+
+def _sha256_en_memoria(ruta: str) -> Optional[str]:
+    """sha256 ya calculado para el archivo tal como está ahora, sin leerlo (None si no se conoce)."""
+    st = os.stat(ruta)
+    with _lock_hashes:
+        return _hashes.get((ruta, st.st_size, st.st_mtime_ns))
+
+
+def clave_miniatura(ruta: str, ancho: int = MINIATURA_ANCHO) -> str:
+    return f"{_sha256(ruta)[:32]}_{ancho}v{VERSION_FORMATO}.{_formato()}"
+
+
+def ruta_miniatura(clave: str) -> Optional[str]:
+    """Ruta de la miniatura ya generada con esa clave (None si no existe o la clave no es válida)."""
+    if not _CLAVE_VALIDA.match(clave):
+        return None
+    ruta = os.path.join(MINIATURAS_DIR, clave)
+    try:
+        modificado = os.path.getmtime(ruta)
+    except OSError:
+        return None
+    if time.time() - modificado > _TOCAR_CADA_SEGUNDOS:
+        try:
+            os.utime(ruta)
+        except OSError:
+            pass
+    return ruta
+
+
+def _primera_pagina(ruta: str, ancho: int):
+    """Imagen de la primera página (PIL) o None si no se puede obtener."""
+    from PIL import Image
+
+    if tipo_mime(ruta) != MIME_PDF:
+        try:
+            with Image.open(ruta) as imagen:
+                imagen.load()
+                return imagen.copy()
+        except Exception:
+            return None
+
+    try:
+        from pdf2image import convert_from_path
+        paginas = convert_from_path(ruta, first_page=1, last_page=1, size=(ancho, None), **opciones_poppler())
+        if paginas:
+            return paginas[0]
+    except Exception as e:
+        # Sin poppler (o PDF que poppler no abre): se intenta con las imágenes de la página
+        print(f"Miniatura sin poppler para {os.path.basename(ruta)}: {e}")
+
+    try:
+        from pypdf import PdfReader
+        lector = PdfReader(ruta, strict=False)
+        if not lector.pages:
+            return None
+        imagenes = [i.image for i in lector.pages[0].images if i.image is not None]
+    except Exception:
+        return None
+    return max(imagenes, key=lambda i: i.width * i.height, default=None)
+
+
+def _guardar(imagen, destino: str, ancho: int, formato: str):
+    if imagen.mode not in ("L", "RGB"):
+        imagen = imagen.convert("RGB")
+    imagen.thumbnail((ancho, ancho * 2))
+    temporal = f"{destino}.{os.getpid()}.{threading.get_ident()}.tmp"
+    if formato == "webp":
+        imagen.save(temporal, "WEBP", quality=70, method=4)
+    else:
+        imagen.save(temporal, "PNG", optimize=True)
+    os.replace(temporal, destino)
+
+
+def obtener_miniatura(ruta: str, ancho: int = MINIATURA_ANCHO) -> Optional[str]:
+    """
+    Clave de la miniatura del archivo, generándola si hace falta.
+    None si no se puede generar (archivo ilegible, o PDF sin imágenes y sin poppler).
+    """
+    clave = clave_miniatura(ruta, ancho)
+    destino = os.path.join(MINIATURAS_DIR, clave)
+    if os.path.exists(destino):
+        miniaturas_generadas.inc("cache")
+        return clave
+    if clave in _sin_miniatura:
+        return None
+
+    os.makedirs(MINIATURAS_DIR, exist_ok=True)
+    with bloqueo_exclusivo(f"miniaturas-{int(clave[:2], 16) % _FRANJAS_LOCK}"):
+        # Otro request pudo generarla mientras esperábamos el lock
+        if os.path.exists(destino):
+            miniaturas_generadas.inc("cache")
+            return clave
+        with _renderizando:
+            imagen = _primera_pagina(ruta, ancho)
+            if imagen is None:
+                miniaturas_generadas.inc("sin_imagen")
+                if len(_sin_miniatura) >= _HASHES_EN_MEMORIA:
+                    _sin_miniatura.clear()
+                _sin_miniatura.add(clave)
+                return None
+            _guardar(imagen, destino, ancho, _formato())
+    miniaturas_generadas.inc("generada")
+    _registrar_bytes(os.path.getsize(destino))
+    return clave
+
+
+def consultar_miniatura(ruta: str, ancho: int = MINIATURA_ANCHO) -> tuple:
+    """
+    (estado, clave) para un request, sin leer ni renderizar el archivo en su hilo:
+    "lista" si la miniatura existe, "sin_miniatura" si ya se sabe que no se puede generar
+    y "pendiente" si se encoló en el precalentador (clave None en los dos últimos).
+    """
+    sha = _sha256_en_memoria(ruta)
+    if sha is not None:
+        clave = f"{sha[:32]}_{ancho}v{VERSION_FORMATO}.{_formato()}"
+        if os.path.exists(os.path.join(MINIATURAS_DIR, clave)):
+            miniaturas_generadas.inc("cache")
+            return "lista", clave
+        if clave in _sin_miniatura:
+            return "sin_miniatura", None
+    miniaturas_generadas.inc("pendiente")
+    precalentar(ruta)
+    return "pendiente", None
+
+
+def precalentar(ruta: str):
+    """Genera la miniatura en segundo plano (una vez por ruta en cola); los errores solo se registran."""
+    with _lock_cola:
+        if ruta in _en_cola:
+            return
+        _en_cola.add(ruta)
+
+    def generar():
+        try:
+            obtener_miniatura(ruta)
+        except Exception as e:
+            print(f"Error al generar miniatura de {os.path.basename(ruta)}: {e}")
+        finally:
+            with _lock_cola:
+                _en_cola.discard(ruta)
+
+    _precalentador.submit(generar)
+
+
+def _registrar_bytes(tamano: int):
+    global _bytes_estimados
+    with _lock_poda:
+        if _bytes_estimados is None:
+            _bytes_estimados = sum(e.stat().st_size for e in os.scandir(MINIATURAS_DIR) if e.is_file())
+        else:
+            _bytes_estimados += tamano
+        if _bytes_estimados > MINIATURAS_MAX_MB * 1024 * 1024:
+            _bytes_estimados = podar()
+
+
+def podar(max_mb: float = MINIATURAS_MAX_MB) -> int:
+    """Borra las miniaturas menos usadas hasta quedar en el 90% de max_mb. Retorna los bytes que quedan."""
+    entradas = []
+    with os.scandir(MINIATURAS_DIR) as it:
+        for e in it:
+            if e.is_file() and _CLAVE_VALIDA.match(e.name):
+                st = e.stat()
+                entradas.append((st.st_mtime, st.st_size, e.path))
+    total = sum(tamano for _, tamano, _ in entradas)
+    limite = max_mb * 1024 * 1024 * 0.9
+    borradas = 0
+    for _, tamano, ruta in sorted(entradas):
+        if total <= limite:
+            break
+        try:
+            os.remove(ruta)
+        except OSError:
+            continue
+        total -= tamano
+        borradas += 1
+    if borradas:
+        print(f"Miniaturas: {borradas} borradas por espacio ({total / 1024 / 1024:.1f} MB en uso)")
+    return total
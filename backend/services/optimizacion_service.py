@@ -0,0 +1,260 @@
+"""
+Optimizador de PDFs antiguos (opcional, desactivado por defecto).
+- Reescribe los PDF referenciados con más de OPTIMIZAR_PDF_DIAS días: reduce las imágenes
+  a OPTIMIZAR_PDF_DPI (JPEG calidad OPTIMIZAR_PDF_CALIDAD), comprime los content streams y
+  elimina objetos duplicados o huérfanos (pypdf).
+- El resultado se verifica (se abre y tiene las mismas páginas) y reemplaza al original
+  con os.replace solo si ahorra al menos OPTIMIZAR_PDF_AHORRO_MINIMO y el original no
+  cambió mientras tanto. El nombre no cambia, así que las referencias siguen válidas.
+- Cada archivo se procesa una vez y queda en optimizaciones_pdf con el sha256 y tamaño
+  del original y del resultado (auditoría), y el tiempo de CPU.
+- Corre en un hilo con prioridad baja (trabajo "optimizar_pdfs" o el programador), nunca
+  en el camino de un request.
+- Solo se reducen imágenes en escala de grises o RGB; las bitonales (CCITT/JBIG2) ya son
+  compactas y pasarlas a JPEG las agrandaría.
+"""
+import hashlib
+import os
+import threading
+import time
+
+from sqlalchemy import func
+
+from database import SessionLocal, bloqueo_exclusivo
+from models import OptimizacionPdf
+from .almacenamiento_service import registrar_archivo
+from .conciliacion_service import REFERENCIAS, en_hilo_de_baja_prioridad
+from .metrics_service import metricas, Contador
+from .trabajos_service import tarea, registrar_progreso
+
+# Antigüedad mínima de los PDF a optimizar (días; 0 = optimizador desactivado)
+OPTIMIZAR_PDF_DIAS = float(os.getenv("OPTIMIZAR_PDF_DIAS", "0"))
+OPTIMIZAR_PDF_DPI = int(os.getenv("OPTIMIZAR_PDF_DPI", "150"))
+OPTIMIZAR_PDF_CALIDAD = int(os.getenv("OPTIMIZAR_PDF_CALIDAD", "75"))
+# Fracción mínima de ahorro para reemplazar el original
+OPTIMIZAR_PDF_AHORRO_MINIMO = float(os.getenv("OPTIMIZAR_PDF_AHORRO_MINIMO", "0.1"))
+# Archivos por ejecución del programador y horas entre ejecuciones
+OPTIMIZAR_PDF_LOTE = int(os.getenv("OPTIMIZAR_PDF_LOTE", "200"))
+OPTIMIZAR_PDF_INTERVALO_HORAS = float(os.getenv("OPTIMIZAR_PDF_INTERVALO_HORAS", "24"))
+
+# Por debajo de esto una imagen reducida no ahorra lo suficiente como para recomprimirla
+_ESCALA_MAXIMA = 0.9
+
+optimizacion_bytes = metricas.registrar(Contador(
+    "optimizacion_pdf_bytes_ahorrados_total", "Bytes ahorrados por el optimizador de PDFs", ()))
+optimizacion_archivos = metricas.registrar(Contador(
+    "optimizacion_pdf_archivos_total", "PDFs procesados por el optimizador", ("estado",)))
+
+
+def _sha256(ruta: str) -> str:
+    sha = hashlib.sha256()
+    with open(ruta, "rb") as f:
+        for bloque in iter(lambda: f.read(1024 * 1024), b""):
+            sha.update(bloque)
+    return sha.hexdigest()
+
+
+def optimizar_pdf(origen: str, destino: str, dpi: int = OPTIMIZAR_PDF_DPI,
+                  calidad: int = OPTIMIZAR_PDF_CALIDAD) -> dict:
+    """
+    Escribe en destino la versión optimizada de origen. Retorna páginas, imágenes
+    reducidas y tamaños. Lanza excepción si el PDF no se puede procesar.
+    """
+    from PIL import Image
+    from pypdf import PdfReader, PdfWriter
+
+    writer = PdfWriter(clone_from=origen)
+    reducidas = set()
+    for pagina in writer.pages:
+        # DPI efectivo suponiendo que la imagen ocupa la página (escaneos): subestima el de
+        # logos y sellos pequeños, que así no se tocan. Se emparejan los lados largos y los
+        # cortos: un escaneo guardado apaisado y girado con 'cm' o /Rotate no pierde resolución
+        corto_pulgadas, largo_pulgadas = sorted((float(pagina.mediabox.width) / 72,
+                                                 float(pagina.mediabox.height) / 72))
+        for imagen in pagina.images:
+            ref = imagen.indirect_reference
+            if ref is None or ref.idnum in reducidas:
+                continue
+            pil = imagen.image
+            if pil is None or pil.mode not in ("L", "RGB"):
+                continue
+            corto, largo = sorted((pil.width, pil.height))
+            escala = min(dpi * corto_pulgadas / corto, dpi * largo_pulgadas / largo)
+            if escala >= _ESCALA_MAXIMA:
+                continue
+            nueva = pil.resize((max(1, round(pil.width * escala)), max(1, round(pil.height * escala))),
+                               Image.LANCZOS)
+            imagen.replace(nueva, quality=calidad)
+            reducidas.add(ref.idnum)
+        pagina.compress_content_streams()
+    writer.compress_identical_objects(remove_identicals=True, remove_orphans=True)
+    with open(destino, "wb") as f:
+        writer.write(f)
+
+    paginas = len(writer.pages)
+    if len(PdfReader(destino).pages) != paginas:
+        raise ValueError("El PDF optimizado no tiene las mismas páginas que el original")
+    return {"paginas": paginas, "imagenes": len(reducidas),
+            "tamano_original": os.path.getsize(origen), "tamano_resultado": os.path.getsize(destino)}
+
+
+def _candidatos(db, upload_dir: str, dias: float, limite: int) -> list:
+    """PDF referenciados, más antiguos que `dias` y sin registro en optimizaciones_pdf."""
+    procesados = {a for (a,) in db.query(OptimizacionPdf.archivo).all()}
+    limite_mtime = time.time() - dias * 86400
+    candidatos = set()
+    for modelo, columna in REFERENCIAS:
+        campo = getattr(modelo, columna)
+        for (archivo,) in db.query(campo).filter(func.lower(campo).like("%.pdf")).all():
+            if archivo in procesados or archivo in candidatos:
+                continue
+            try:
+                if os.path.getmtime(os.path.join(upload_dir, archivo)) < limite_mtime:
+                    candidatos.add(archivo)
+            except OSError:
+                continue
+    return sorted(candidatos)[:limite]
+
+
+def _actualizar_metadatos(db, upload_dir: str, archivo: str):
+    """El tamaño guardado en las filas que referencian el archivo (almacenamiento_service)."""
+    for modelo, columna in REFERENCIAS:
+        if not hasattr(modelo, "tamano_bytes"):
+            continue
+        for fila in db.query(modelo).filter(getattr(modelo, columna) == archivo).all():
+            registrar_archivo(fila, upload_dir)
+
+
+def _procesar(db, upload_dir: str, archivo: str) -> OptimizacionPdf:
+    ruta = os.path.join(upload_dir, archivo)
+    temporal = f"{ruta}.optimizando.{os.getpid()}"
+    registro = OptimizacionPdf(archivo=archivo, estado="error")
+    cambiado = False
+    try:
+        st = os.stat(ruta)
+        registro.sha256_original = _sha256(ruta)
+        registro.tamano_original = st.st_size
+        cpu = time.process_time()
+        resultado = optimizar_pdf(ruta, temporal)
+        registro.cpu_ms = round((time.process_time() - cpu) * 1000, 1)
+        registro.imagenes = resultado["imagenes"]
+        ahorro = 1 - resultado["tamano_resultado"] / max(1, st.st_size)
+        actual = os.stat(ruta)
+        if (actual.st_size, actual.st_mtime_ns) != (st.st_size, st.st_mtime_ns):
+            # Se reintenta en la próxima ejecución
+            cambiado = True
+        elif ahorro < OPTIMIZAR_PDF_AHORRO_MINIMO:
+            registro.estado = "sin_ahorro"
+            registro.detalle = f"Ahorro de {ahorro:.1%}"
+        else:
+            registro.sha256_resultado = _sha256(temporal)
+            registro.tamano_resultado = resultado["tamano_resultado"]
+            os.replace(temporal, ruta)
+            registro.estado = "optimizado"
+            optimizacion_bytes.inc(cantidad=st.st_size - resultado["tamano_resultado"])
+            _actualizar_metadatos(db, upload_dir, archivo)
+    except Exception as e:
+        registro.detalle = f"{type(e).__name__}: {e}"[:1000]
+    finally:
+        if os.path.exists(temporal):
+            os.remove(temporal)
+    optimizacion_archivos.inc(registro.estado)
+    if not cambiado:
+        db.add(registro)
+        db.commit()
+    return registro
+
+
+def optimizar(upload_dir: str, dias: float = None, limite: int = OPTIMIZAR_PDF_LOTE, progreso=None) -> dict:
+    """Optimiza hasta `limite` PDF candidatos. `progreso(dict)` recibe avances. Retorna el resumen."""
+    dias = OPTIMIZAR_PDF_DIAS if dias is None else dias
+    inicio = time.perf_counter()
+    db = SessionLocal()
+    try:
+        candidatos = _candidatos(db, upload_dir, dias, limite)
+        resumen = {"candidatos": len(candidatos), "procesados": 0, "optimizados": 0, "sin_ahorro": 0,
+                   "errores": 0, "bytes_ahorrados": 0, "cpu_ms": 0.0}
+        for archivo in candidatos:
+            registro = _procesar(db, upload_dir, archivo)
+            resumen["procesados"] += 1
+            resumen["cpu_ms"] += registro.cpu_ms or 0
+            if registro.estado == "optimizado":
+                resumen["optimizados"] += 1
+                resumen["bytes_ahorrados"] += registro.tamano_original - registro.tamano_resultado
+            elif registro.estado == "sin_ahorro":
+                resumen["sin_ahorro"] += 1
+            else:
+                resumen["errores"] += 1
+            if progreso:
+                progreso(dict(resumen))
+    finally:
+        db.close()
+    resumen["cpu_ms"] = round(resumen["cpu_ms"], 1)
+    resumen["duracion_ms"] = round((time.perf_counter() - inicio) * 1000, 1)
+    print(f"Optimización de PDFs: {resumen['optimizados']} de {resumen['procesados']} optimizados, "
+          f"{resumen['bytes_ahorrados'] / 1024 / 1024:.1f} MB ahorrados en {resumen['duracion_ms']:.0f} ms")
+    return resumen
+
+
+def ejecutar(upload_dir: str, dias: float = None, limite: int = OPTIMIZAR_PDF_LOTE, progreso=None) -> dict:
+    """Optimiza con baja prioridad, bajo un lock entre procesos."""
+    with bloqueo_exclusivo("optimizacion-pdf"):
+        return en_hilo_de_baja_prioridad(optimizar, upload_dir, dias, limite, progreso)
+
+
+def resumen_optimizaciones(db, ultimos: int = 50) -> dict:
+    """Totales por estado, bytes ahorrados y los últimos registros."""
+    por_estado = dict(db.query(OptimizacionPdf.estado, func.count(OptimizacionPdf.id))
+                      .group_by(OptimizacionPdf.estado).all())
+    original, resultado = db.query(
+        func.sum(OptimizacionPdf.tamano_original), func.sum(OptimizacionPdf.tamano_resultado)
+    ).filter(OptimizacionPdf.estado == "optimizado").one()
+    registros = db.query(OptimizacionPdf).order_by(OptimizacionPdf.id.desc()).limit(ultimos).all()
+    return {
+        "activado": OPTIMIZAR_PDF_DIAS > 0,
+        "por_estado": por_estado,
+        "bytes_ahorrados": int((original or 0) - (resultado or 0)),
+        "ultimos": [
+            {c: getattr(r, c) for c in ("archivo", "estado", "sha256_original", "tamano_original",
+                                        "sha256_resultado", "tamano_resultado", "imagenes", "cpu_ms",
+                                        "detalle", "created_at")}
+            for r in registros
+        ],
+    }
+
+
+@tarea("optimizar_pdfs")
+def _tarea_optimizar(parametros: dict, trabajo_id: int) -> dict:
+    return ejecutar(parametros["upload_dir"], parametros.get("dias"),
+                    parametros.get("limite") or OPTIMIZAR_PDF_LOTE,
+                    progreso=lambda avance: registrar_progreso(trabajo_id, avance))
+
+
+class ProgramadorOptimizacion:
+    """Hilo que optimiza un lote de PDFs cada OPTIMIZAR_PDF_INTERVALO_HORAS (si está activado)."""
+
+    def __init__(self):
+        self._detener = threading.Event()
+        self._hilo = None
+        self._upload_dir = None
+
+    def _bucle(self):
+        while not self._detener.wait(OPTIMIZAR_PDF_INTERVALO_HORAS * 3600):
+            try:
+                ejecutar(self._upload_dir)
+            except Exception as e:
+                print(f"Error en optimización programada de PDFs: {e}")
+
+    def iniciar(self, upload_dir: str):
+        if OPTIMIZAR_PDF_DIAS <= 0 or OPTIMIZAR_PDF_INTERVALO_HORAS <= 0 or self._hilo is not None:
+            return
+        self._upload_dir = upload_dir
+        self._hilo = threading.Thread(target=self._bucle, name="optimizacion-pdf", daemon=True)
+        self._hilo.start()
+
+    def detener(self):
+        self._detener.set()
+
+
+# Instancia global del programador
+programador_optimizacion = ProgramadorOptimizacion()
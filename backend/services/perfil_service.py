@@ -0,0 +1,303 @@
+"""
+Perfilado por muestreo de requests individuales.
+Un administrador agrega el header 'X-Perfilar: 1' (o el parámetro ?perfilar=1) a un request
+autenticado; mientras se atiende, un hilo toma muestras de las pilas de ejecución y al
+terminar se guarda un perfil compatible con flame graphs (speedscope o pilas colapsadas).
+El id del perfil se retorna en el header 'X-Perfil-Id'.
+Con varios workers los perfiles se guardan en STATE_DIR/perfiles, para que cualquier
+proceso pueda servir un perfil tomado por otro.
+"""
+import os
+import pickle
+import sys
+import threading
+import time
+import uuid
+from collections import Counter, OrderedDict
+from datetime import datetime
+from typing import Optional
+
+import anyio
+
+from database import STATE_DIR, WEB_CONCURRENCY
+from .auth_service import verify_token, extraer_token_bearer
+
+# Intervalo de muestreo en milisegundos
+PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", "5"))
+# Cantidad máxima de perfiles guardados en memoria (se descartan los más antiguos)
+PROFILE_MAX_STORED = int(os.getenv("PROFILE_MAX_STORED", "20"))
+# Duración máxima de muestreo por request (segundos)
+PROFILE_MAX_SECONDS = float(os.getenv("PROFILE_MAX_SECONDS", "300"))
+
+# Solo se conservan pilas que pasan por código del backend (descarta hilos ociosos)
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+_ARCHIVO_PROPIO = os.path.abspath(__file__)
+
+
+def _nombre_archivo(ruta: str) -> str:
+    """Ruta relativa al backend o, para librerías, desde site-packages."""
+    if ruta.startswith(BACKEND_DIR):
+        return os.path.relpath(ruta, BACKEND_DIR)
+    marcador = "site-packages" + os.sep
+    if marcador in ruta:
+        return ruta.split(marcador, 1)[1]
+    return os.path.basename(ruta)
+
+
+class Perfil:
+    """Muestras acumuladas de un request."""
+
+    def __init__(self, perfil_id: str, metodo: str, ruta: str, usuario: str):
+        self.id = perfil_id
+        self.metodo = metodo
+        self.ruta = ruta
+        self.usuario = usuario
+        self.inicio = datetime.now()
+        self.duracion = 0.0
+        self.estado = None
+        self.intervalo_ms = PROFILE_INTERVAL_MS
+        # pila (tupla de frames raíz -> hoja) -> cantidad de muestras
+        self.pilas = Counter()
+
+    @property
+    def muestras(self) -> int:
+        return sum(self.pilas.values())
+
+    def resumen(self) -> dict:
+        return {
+            "id": self.id,
+            "metodo": self.metodo,
+            "ruta": self.ruta,
+            "usuario": self.usuario,
+            "inicio": self.inicio.isoformat(),
+            "duracion_ms": round(self.duracion * 1000, 1),
+            "estado": self.estado,
+            "muestras": self.muestras,
+            "intervalo_ms": self.intervalo_ms,
+        }
+
+    def colapsado(self) -> str:
+        """Formato de pilas colapsadas (flamegraph.pl / speedscope / inferno)."""
+        lineas = []
+        for pila, cantidad in sorted(self.pilas.items()):
+            nombres = [f"{nombre} ({archivo}:{linea})" if archivo else nombre for archivo, nombre, linea in pila]
+            lineas.append(f"{';'.join(nombres)} {cantidad}")
+        return "\n".join(lineas) + "\n"
+
+    def speedscope(self) -> dict:
+        """Perfil 'sampled' en el formato de archivo de speedscope."""
+        frames, indices = [], {}
+        muestras, pesos = [], []
+        for pila, cantidad in sorted(self.pilas.items()):
+            fila = []
+            for frame in pila:
+                if frame not in indices:
+                    archivo, nombre, linea = frame
+                    indices[frame] = len(frames)
+                    frames.append({"name": nombre, "file": archivo, "line": linea})
+                fila.append(indices[frame])
+            muestras.append(fila)
+            pesos.append(cantidad * self.intervalo_ms)
+        return {
+            "$schema": "https://www.speedscope.app/file-format-schema.json",
+            "shared": {"frames": frames},
+            "profiles": [{
+                "type": "sampled",
+                "name": f"{self.metodo} {self.ruta}",
+                "unit": "milliseconds",
+                "startValue": 0,
+                "endValue": sum(pesos),
+                "samples": muestras,
+                "weights": pesos,
+            }],
+            "name": f"{self.metodo} {self.ruta} ({self.id})",
+            "activeProfileIndex": 0,
+            "exporter": "gestor-documentario",
+        }
+
+
+class Muestreador(threading.Thread):
+    """
+    Hilo que toma muestras de todas las pilas con sys._current_frames().
+    Los endpoints async corren en el hilo del event loop y los síncronos en el threadpool,
+    así que se muestrean todos los hilos y se conservan las pilas que pasan por el backend.
+    Con requests concurrentes pueden colarse muestras de otros requests.
+    """
+
+    def __init__(self, perfil: Perfil):
+        super().__init__(name=f"perfil-{perfil.id}", daemon=True)
+        self.perfil = perfil
+        self._detener = threading.Event()
+
+    def run(self):
+        intervalo = self.perfil.intervalo_ms / 1000
+        limite = time.perf_counter() + PROFILE_MAX_SECONDS
+        propio = threading.get_ident()
+        nombres_hilos = {}
+        while not self._detener.wait(intervalo) and time.perf_counter() < limite:
+            for hilo_id, frame in sys._current_frames().items():
+                if hilo_id == propio:
+                    continue
+                pila = []
+                en_backend = False
+                while frame is not None:
+                    codigo = frame.f_code
+                    if codigo.co_filename == _ARCHIVO_PROPIO:
+                        break
+                    if codigo.co_filename.startswith(BACKEND_DIR):
+                        en_backend = True
+                    pila.append((_nombre_archivo(codigo.co_filename), codigo.co_name, codigo.co_firstlineno))
+                    frame = frame.f_back
+                if not en_backend or not pila:
+                    continue
+                if hilo_id not in nombres_hilos:
+                    nombres_hilos.update({h.ident: h.name for h in threading.enumerate()})
+                pila.append(("", f"[{nombres_hilos.get(hilo_id, hilo_id)}]", 0))
+                pila.reverse()
+                self.perfil.pilas[tuple(pila)] += 1
+
+    def detener(self):
+        """Pide al hilo que termine; quien necesite las muestras completas debe esperar con join()."""
+        self._detener.set()
+
+
+class AlmacenPerfiles:
+    """Perfiles guardados en memoria, con tope PROFILE_MAX_STORED."""
+
+    def __init__(self, maximo: int = PROFILE_MAX_STORED):
+        self.maximo = maximo
+        self._perfiles = OrderedDict()
+        self._lock = threading.Lock()
+
+    def guardar(self, perfil: Perfil):
+        with self._lock:
+            self._perfiles[perfil.id] = perfil
+            while len(self._perfiles) > self.maximo:
+                self._perfiles.popitem(last=False)
+
+    def obtener(self, perfil_id: str) -> Optional[Perfil]:
+        with self._lock:
+            return self._perfiles.get(perfil_id)
+
+    def listar(self) -> list:
+        with self._lock:
+            perfiles = list(self._perfiles.values())
+        return [p.resumen() for p in reversed(perfiles)]
+
+
+class AlmacenPerfilesDisco(AlmacenPerfiles):
+    """Perfiles guardados como archivos (un pickle por perfil), visibles desde todos los workers."""
+
+    def __init__(self, carpeta: str, maximo: int = PROFILE_MAX_STORED):
+        super().__init__(maximo)
+        self.carpeta = carpeta
+
+    def _ruta(self, perfil_id: str) -> str:
+        return os.path.join(self.carpeta, f"{perfil_id}.pickle")
+
+    def _archivos(self) -> list:
+        """Rutas de los perfiles guardados, del más nuevo al más antiguo."""
+        if not os.path.isdir(self.carpeta):
+            return []
+        rutas = [os.path.join(self.carpeta, n) for n in os.listdir(self.carpeta) if n.endswith(".pickle")]
+        return sorted(rutas, key=lambda r: os.stat(r).st_mtime, reverse=True)
+
+    def guardar(self, perfil: Perfil):
+        os.makedirs(self.carpeta, exist_ok=True)
+        temporal = f"{self._ruta(perfil.id)}.tmp"
+        with open(temporal, "wb") as f:
+            pickle.dump(perfil, f)
+        os.replace(temporal, self._ruta(perfil.id))
+        for ruta in self._archivos()[self.maximo:]:
+            try:
+                os.remove(ruta)
+            except OSError:
+                pass
+
+    def obtener(self, perfil_id: str) -> Optional[Perfil]:
+        if not perfil_id.isalnum():
+            return None
+        try:
+            with open(self._ruta(perfil_id), "rb") as f:
+                return pickle.load(f)
+        except OSError:
+            return None
+
+    def listar(self) -> list:
+        resumenes = []
+        for ruta in self._archivos():
+            try:
+                with open(ruta, "rb") as f:
+                    resumenes.append(pickle.load(f).resumen())
+            except (OSError, pickle.UnpicklingError, EOFError):
+                continue
+        return resumenes
+
+
+# Instancia global del almacén
+if WEB_CONCURRENCY > 1:
+    perfiles = AlmacenPerfilesDisco(os.path.join(STATE_DIR, "perfiles"))
+else:
+    perfiles = AlmacenPerfiles()
+
+
+def _usuario_perfilador(scope) -> Optional[str]:
+    """Retorna el usuario si el request pide perfilado y trae un token válido."""
+    headers = dict(scope.get("headers") or [])
+    pedido = headers.get(b"x-perfilar", b"").strip() in (b"1", b"true")
+    if not pedido:
+        query = scope.get("query_string", b"").decode("latin-1")
+        pedido = any(p in ("perfilar=1", "perfilar=true") for p in query.split("&"))
+    if not pedido:
+        return None
+
+    token = extraer_token_bearer(headers.get(b"authorization", b"").decode("latin-1"))
+    if token is None:
+        return None
+    payload = verify_token(token)
+    return payload.get("sub") if payload else None
+
+
+class PerfilMiddleware:
+    """
+    Middleware ASGI que perfila los requests marcados con 'X-Perfilar: 1' (o ?perfilar=1)
+    de usuarios autenticados. Sin el header no agrega costo más allá de revisar los headers.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        usuario = _usuario_perfilador(scope)
+        if usuario is None:
+            await self.app(scope, receive, send)
+            return
+
+        perfil = Perfil(uuid.uuid4().hex[:16], scope.get("method", ""), scope.get("path", ""), usuario)
+        muestreador = Muestreador(perfil)
+
+        async def send_con_perfil(message):
+            if message["type"] == "http.response.start":
+                perfil.estado = message["status"]
+                message["headers"] = list(message.get("headers", [])) + [
+                    (b"x-perfil-id", perfil.id.encode("latin-1"))
+                ]
+            await send(message)
+
+        inicio = time.perf_counter()
+        muestreador.start()
+        try:
+            await self.app(scope, receive, send_con_perfil)
+        finally:
+            perfil.duracion = time.perf_counter() - inicio
+            muestreador.detener()
+            # join() bloquea hasta que termine la muestra en curso: fuera del event loop
+            await anyio.to_thread.run_sync(muestreador.join)
+            perfil.ruta = getattr(scope.get("route"), "path", None) or perfil.ruta
+            perfiles.guardar(perfil)
+            print(f"Perfil {perfil.id}: {perfil.metodo} {perfil.ruta} "
+                  f"{perfil.duracion * 1000:.0f} ms, {perfil.muestras} muestras")
@@ -0,0 +1,255 @@
+"""
+Restauración de uploads desde un ZIP, en segundo plano y con memoria acotada.
+- El endpoint copia el ZIP subido a RESTAURACION_DIR de a bloques y encola un trabajo
+  "restaurar_uploads"; el avance se consulta en /api/trabajos/{id}.
+- Los archivos se extraen en paralelo (RESTAURAR_HILOS hilos, cada uno con su propio
+  handle del ZIP) copiando de a bloques a un temporal que se enlaza con el nombre final
+  solo si no existe: nunca se sobrescribe un archivo ni queda uno a medio escribir.
+- Manifiesto opcional (manifiesto.json dentro del ZIP o enviado aparte) con el sha256 de
+  cada archivo: {nombre: sha256} o {nombre: {"sha256": ...}} (formato del export de
+  uploads). Con manifiesto cada archivo se verifica mientras se copia y se descarta si no
+  coincide; los que no figuran en el manifiesto se omiten.
+- Con manifiesto se restaura todo lo que lista (PDF, .docx, firmas PNG/JPG, adjuntos del
+  seguimiento de cualquier extensión), en la raíz o en subcarpetas ('plantillas/x.docx',
+  como lo exporta /api/exportar-uploads); lo listado que no se pudo restaurar queda en
+  "faltantes" o "errores". Sin manifiesto solo se restauran PDF y .docx.
+- Se rechazan rutas absolutas, con '..', '\\' o componentes ocultos, y las que resuelven
+  fuera de UPLOAD_DIR.
+"""
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+import zipfile
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Optional
+
+from database import STATE_DIR
+from .trabajos_service import tarea, registrar_progreso
+
+RESTAURACION_DIR = os.getenv("RESTAURACION_DIR", os.path.join(STATE_DIR, "restauraciones"))
+RESTAURAR_HILOS = int(os.getenv("RESTAURAR_HILOS", "4"))
+
+NOMBRE_MANIFIESTO = "manifiesto.json"
+# ZIP sin manifiesto: solo PDF subidos y cartas .docx (con manifiesto, todo lo listado)
+EXTENSIONES_RESTAURABLES = {".pdf", ".docx"}
+BLOQUE = 1024 * 1024
+
+
+class ErrorRestauracion(Exception):
+    pass
+
+
+def leer_manifiesto(datos: bytes) -> dict:
+    """nombre -> sha256 (hex en minúsculas). ValueError si el formato no es válido."""
+    try:
+        contenido = json.loads(datos.decode("utf-8-sig"))
+    except (UnicodeDecodeError, ValueError):
+        raise ValueError("El manifiesto no es un JSON válido")
+    if isinstance(contenido, dict) and isinstance(contenido.get("archivos"), dict):
+        contenido = contenido["archivos"]
+    if not isinstance(contenido, dict):
+        raise ValueError("El manifiesto debe ser un objeto {nombre: sha256}")
+    manifiesto = {}
+    for nombre, valor in contenido.items():
+        sha = valor.get("sha256") if isinstance(valor, dict) else valor
+        if not isinstance(sha, str) or len(sha) != 64:
+            raise ValueError(f"sha256 inválido para {nombre}")
+        manifiesto[nombre] = sha.lower()
+    return manifiesto
+
+
+def guardar_zip(origen, nombre: str) -> str:
+    """Copia el ZIP subido (file-like) a RESTAURACION_DIR de a bloques. Retorna la ruta."""
+    os.makedirs(RESTAURACION_DIR, exist_ok=True)
+    ruta = os.path.join(RESTAURACION_DIR, f"{time.strftime('%Y%m%d_%H%M%S')}_{os.getpid()}_{nombre}")
+    with open(ruta, "wb") as destino:
+        shutil.copyfileobj(origen, destino, BLOQUE)
+    try:
+        with zipfile.ZipFile(ruta):
+            pass
+    except zipfile.BadZipFile:
+        os.remove(ruta)
+        raise
+    return ruta
+
+
+def _ruta_segura(nombre: str) -> bool:
+    """Ruta relativa con '/' sin componentes vacíos, ocultos ni '..'."""
+    if "\\" in nombre or ":" in nombre or nombre.startswith("/"):
+        return False
+    return all(p and not p.startswith(".") for p in nombre.split("/"))
+
+
+def _restaurable(nombre: str) -> bool:
+    """Sin manifiesto: ruta segura y con extensión permitida."""
+    return _ruta_segura(nombre) and os.path.splitext(nombre)[1].lower() in EXTENSIONES_RESTAURABLES
+
+
+def _destino(upload_dir: str, nombre: str) -> Optional[str]:
+    """Ruta final en upload_dir, o None si (por enlaces simbólicos) resuelve fuera de él."""
+    base = os.path.realpath(upload_dir)
+    destino = os.path.realpath(os.path.join(base, nombre))
+    if os.path.commonpath([base, destino]) != base:
+        return None
+    return destino
+
+
+def _extraer(zips: "_ZipPorHilo", info: zipfile.ZipInfo, destino: str, sha_esperado: Optional[str]) -> tuple:
+    """Copia un miembro a destino sin sobrescribir. Retorna (estado, bytes)."""
+    if os.path.exists(destino):
+        return "existente", 0
+    os.makedirs(os.path.dirname(destino), exist_ok=True)
+    temporal = f"{destino}.restaurando.{threading.get_ident()}"
+    sha = hashlib.sha256()
+    try:
+        with zips.obtener().open(info) as src, open(temporal, "wb") as dst:
+            while True:
+                bloque = src.read(BLOQUE)
+                if not bloque:
+                    break
+                sha.update(bloque)
+                dst.write(bloque)
+        if sha_esperado and sha.hexdigest() != sha_esperado:
+            return "invalido", 0
+        try:
+            # link() falla si el destino ya existe: otra restauración no se pisa con esta
+            os.link(temporal, destino)
+        except FileExistsError:
+            return "existente", 0
+        except OSError:
+            # Sistema de archivos sin enlaces duros
+            if os.path.exists(destino):
+                return "existente", 0
+            os.replace(temporal, destino)
+        return "restaurado", info.file_size
+    finally:
+        if os.path.exists(temporal):
+            os.remove(temporal)
+
+
+class _ZipPorHilo:
+    """Un ZipFile abierto por hilo: el lector de zipfile no admite lecturas en paralelo."""
+
+    def __init__(self, ruta: str):
+        self.ruta = ruta
+        self._local = threading.local()
+        self._abiertos = []
+        self._lock = threading.Lock()
+
+    def obtener(self) -> zipfile.ZipFile:
+        archivo = getattr(self._local, "zip", None)
+        if archivo is None:
+            archivo = self._local.zip = zipfile.ZipFile(self.ruta)
+            with self._lock:
+                self._abiertos.append(archivo)
+        return archivo
+
+    def cerrar(self):
+        for archivo in self._abiertos:
+            archivo.close()
+
+
+def restaurar(ruta_zip: str, upload_dir: str, manifiesto: Optional[dict] = None,
+              hilos: int = RESTAURAR_HILOS, progreso=None) -> dict:
+    """Extrae los archivos restaurables del ZIP en upload_dir. `progreso(dict)` recibe avances."""
+    inicio = time.perf_counter()
+    with zipfile.ZipFile(ruta_zip) as archivo:
+        miembros = archivo.infolist()
+        if manifiesto is None and NOMBRE_MANIFIESTO in archivo.namelist():
+            manifiesto = leer_manifiesto(archivo.read(NOMBRE_MANIFIESTO))
+
+    rechazados = []
+    no_listados = []
+    faltantes = []
+    if manifiesto is None:
+        candidatos = [m for m in miembros if _restaurable(m.filename) and _destino(upload_dir, m.filename)]
+        ignorados = len(miembros) - len(candidatos)
+    else:
+        # Lo listado se restaura sea cual sea la extensión; lo que no se puede, se informa
+        en_zip = {m.filename: m for m in miembros}
+        candidatos = []
+        for nombre in sorted(manifiesto):
+            if nombre not in en_zip:
+                faltantes.append(nombre)
+            elif not (_ruta_segura(nombre) and _destino(upload_dir, nombre)):
+                rechazados.append(f"{nombre}: ruta no permitida")
+            else:
+                candidatos.append(en_zip[nombre])
+        no_listados = [n for n in en_zip if n not in manifiesto and n != NOMBRE_MANIFIESTO]
+        ignorados = 0
+
+    pendientes = [m for m in candidatos if not os.path.exists(_destino(upload_dir, m.filename))]
+    necesario = sum(m.file_size for m in pendientes)
+    libre = shutil.disk_usage(upload_dir).free
+    if necesario > libre:
+        raise ErrorRestauracion(f"Espacio insuficiente: se necesitan {necesario} bytes y hay {libre} libres")
+
+    resultado = {"total": len(candidatos), "procesados": 0, "restaurados": 0, "existentes": 0,
+                 "invalidos": [], "errores": rechazados, "bytes": 0}
+    lista = []
+    ultimo_aviso = 0.0
+    zips = _ZipPorHilo(ruta_zip)
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, hilos), thread_name_prefix="restaurar") as ejecutor:
+            futuros = {
+                ejecutor.submit(_extraer, zips, m, _destino(upload_dir, m.filename),
+                                manifiesto.get(m.filename) if manifiesto else None): m.filename
+                for m in candidatos
+            }
+            for futuro in as_completed(futuros):
+                nombre = futuros[futuro]
+                try:
+                    estado, escritos = futuro.result()
+                except Exception as e:
+                    resultado["errores"].append(f"{nombre}: {e}")
+                else:
+                    if estado == "restaurado":
+                        resultado["restaurados"] += 1
+                        resultado["bytes"] += escritos
+                        if len(lista) < 20:
+                            lista.append(nombre)
+                    elif estado == "existente":
+                        resultado["existentes"] += 1
+                    else:
+                        resultado["invalidos"].append(nombre)
+                resultado["procesados"] += 1
+                if progreso and time.monotonic() - ultimo_aviso >= 0.5:
+                    ultimo_aviso = time.monotonic()
+                    progreso({k: resultado[k] for k in ("total", "procesados", "restaurados", "bytes")})
+    finally:
+        zips.cerrar()
+
+    resultado.update({
+        "ignorados": ignorados,
+        "con_manifiesto": manifiesto is not None,
+        "no_listados": len(no_listados),
+        "faltantes": faltantes[:100],
+        "invalidos": resultado["invalidos"][:100],
+        "errores": resultado["errores"][:100],
+        "lista": lista,
+        "duracion_ms": round((time.perf_counter() - inicio) * 1000, 1),
+    })
+    print(f"Restauración de uploads: {resultado['restaurados']} restaurados, {resultado['existentes']} existentes, "
+          f"{len(resultado['invalidos'])} con hash distinto, {resultado['bytes'] / 1024 / 1024:.1f} MB "
+          f"en {resultado['duracion_ms']:.0f} ms")
+    return resultado
+
+
+@tarea("restaurar_uploads")
+def _tarea_restaurar(parametros: dict, trabajo_id: int) -> dict:
+    ruta_zip = parametros["zip"]
+    ruta_manifiesto = parametros.get("manifiesto")
+    try:
+        manifiesto = None
+        if ruta_manifiesto:
+            with open(ruta_manifiesto, "rb") as f:
+                manifiesto = leer_manifiesto(f.read())
+        return restaurar(ruta_zip, parametros["upload_dir"], manifiesto,
+                         progreso=lambda avance: registrar_progreso(trabajo_id, avance))
+    finally:
+        for ruta in (ruta_zip, ruta_manifiesto):
+            if ruta and os.path.exists(ruta):
+                os.remove(ruta)
@@ -0,0 +1,323 @@
+"""
+Servicio de seguimiento de liquidación por comisaría.
+Historial de cambios por celda, reconstrucción de la grilla a una fecha pasada
+y agregados materializados de avance por etapa.
+"""
+from datetime import datetime
+from typing import Optional
+
+from sqlalchemy.orm import Session
+
+from models import SeguimientoComisaria, SeguimientoCeldaDetalle, SeguimientoCambio, SeguimientoAgregado
+
+
+CAMPOS_SIONO = {
+    'acta_revisada', 'acta_remitida_ugpe',
+    'mod_presentado_ne', 'mod_revisado_aprobado', 'mod_remitido_ugpe',
+    'amp_presentado_ne', 'amp_revisado_aprobado', 'amp_adenda_firmada', 'amp_remitido_ugpe',
+    'dossier_presentado_ne', 'dossier_revisado_aprobado', 'dossier_remitido_ugpe', 'dossier_remitido_pago',
+    'liq_presentado_ne', 'liq_revisado_aprobado', 'liq_remitido_pago',
+}
+
+# Etapas del proceso de liquidación (mismo orden que el Excel)
+ETAPAS = [
+    ('acta', '1. Acta de Conformidad', ['acta_revisada', 'acta_remitida_ugpe']),
+    ('mod', '2. Informe de Modificación de Partidas',
+     ['mod_presentado_ne', 'mod_revisado_aprobado', 'mod_remitido_ugpe']),
+    ('amp', '3. Informe de Ampliación de Plazo',
+     ['amp_presentado_ne', 'amp_revisado_aprobado', 'amp_adenda_firmada', 'amp_remitido_ugpe']),
+    ('dossier', '4. Informe de Culminación y Entrega de Obra (Dossier)',
+     ['dossier_presentado_ne', 'dossier_revisado_aprobado', 'dossier_remitido_ugpe', 'dossier_remitido_pago']),
+    ('liq', '5. Informe de Liquidación (Final)',
+     ['liq_presentado_ne', 'liq_revisado_aprobado', 'liq_remitido_pago']),
+]
+VALORES_NO_APLICA = {'NA', '-'}
+ETAPA_TOTAL = 'total'
+COMISARIA_GLOBAL = 0
+
+CAMPOS_FECHA = {'fecha_fin_contractual', 'acta_fecha_firma'}
+CAMPOS_FLOAT = {'avance_fisico', 'avance_programado', 'dossier_monto_pagado'}
+CAMPOS_BOOL = {'dossier_monto_merge'}
+CAMPOS_ENTERO = {'numero'}
+
+# Códigos enteros de los campos editables para el historial.
+# IMPORTANTE: son persistentes en seguimiento_cambios — solo agregar al final, nunca renumerar.
+CODIGOS_CAMPO = {
+    'numero': 1,
+    'comisaria': 2,
+    'avance_programado': 3,
+    'avance_fisico': 4,
+    'fecha_fin_contractual': 5,
+    'acta_fecha_firma': 6,
+    'acta_revisada': 7,
+    'acta_remitida_ugpe': 8,
+    'mod_presentado_ne': 9,
+    'mod_revisado_aprobado': 10,
+    'mod_remitido_ugpe': 11,
+    'amp_presentado_ne': 12,
+    'amp_revisado_aprobado': 13,
+    'amp_adenda_firmada': 14,
+    'amp_remitido_ugpe': 15,
+    'dossier_presentado_ne': 16,
+    'dossier_revisado_aprobado': 17,
+    'dossier_remitido_ugpe': 18,
+    'dossier_remitido_pago': 19,
+    'dossier_monto_pagado': 20,
+    'dossier_monto_merge': 21,
+    'liq_presentado_ne': 22,
+    'liq_revisado_aprobado': 23,
+    'liq_remitido_pago': 24,
+    'observaciones': 25,
+}
+CAMPOS_POR_CODIGO = {codigo: campo for campo, codigo in CODIGOS_CAMPO.items()}
+
+
+def serializar_valor(valor) -> Optional[str]:
+    """Normaliza un valor de celda a texto para el historial."""
+    if valor is None:
+        return None
+    if isinstance(valor, datetime):
+        return valor.strftime('%Y-%m-%d')
+    if isinstance(valor, bool):
+        return '1' if valor else '0'
+    if isinstance(valor, float):
+        return repr(valor)
+    return str(valor)
+
+
+def deserializar_valor(campo: str, texto: Optional[str]):
+    """Inverso de serializar_valor según el tipo de la columna."""
+    if texto is None:
+        return None
+    if campo in CAMPOS_FECHA:
+        return datetime.strptime(texto[:10], '%Y-%m-%d')
+    if campo in CAMPOS_FLOAT:
+        return float(texto)
+    if campo in CAMPOS_BOOL:
+        return texto == '1'
+    if campo in CAMPOS_ENTERO:
+        return int(texto)
+    return texto
+
+
+def registrar_cambio(db: Session, comisaria_id: int, campo: str, valor_anterior, valor_nuevo,
+                     usuario: str, fecha: Optional[datetime] = None) -> SeguimientoCambio:
+    """Agrega una entrada al historial (no hace commit)."""
+    cambio = SeguimientoCambio(
+        comisaria_id=comisaria_id,
+        campo_codigo=CODIGOS_CAMPO[campo],
+        valor_anterior=serializar_valor(valor_anterior),
+        valor_nuevo=serializar_valor(valor_nuevo),
+        usuario=usuario,
+        fecha=fecha or datetime.now(),
+    )
+    db.add(cambio)
+    return cambio
+
+
+def listar_historial(db: Session, comisaria_id: int, campo: Optional[str] = None,
+                     limite: int = 200) -> list:
+    """
+    Historial de una comisaría, más reciente primero.
+    Usa el índice (comisaria_id, campo_codigo, fecha).
+    """
+    query = db.query(SeguimientoCambio).filter(SeguimientoCambio.comisaria_id == comisaria_id)
+    if campo:
+        query = query.filter(SeguimientoCambio.campo_codigo == CODIGOS_CAMPO[campo])
+    cambios = query.order_by(SeguimientoCambio.fecha.desc(), SeguimientoCambio.id.desc()).limit(limite).all()
+    return [
+        {
+            "id": c.id,
+            "comisaria_id": c.comisaria_id,
+            "campo": CAMPOS_POR_CODIGO.get(c.campo_codigo, str(c.campo_codigo)),
+            "valor_anterior": c.valor_anterior,
+            "valor_nuevo": c.valor_nuevo,
+            "usuario": c.usuario,
+            "fecha": c.fecha,
+        }
+        for c in cambios
+    ]
+
+
+def reconstruir_grilla(db: Session, fecha_corte: datetime) -> list:
+    """
+    Reconstruye la grilla de seguimiento tal como estaba en fecha_corte.
+
+    Parte del estado actual y deshace solo los cambios posteriores al corte:
+    para cada (comisaría, campo) el primer cambio después del corte trae en
+    valor_anterior el valor vigente en esa fecha. El costo es proporcional a
+    los cambios posteriores al corte (índice por fecha), no al historial completo.
+    """
+    filas = db.query(SeguimientoComisaria).order_by(SeguimientoComisaria.numero).all()
+
+    valores_al_corte = {}
+    cambios = (
+        db.query(SeguimientoCambio.comisaria_id, SeguimientoCambio.campo_codigo, SeguimientoCambio.valor_anterior)
+        .filter(SeguimientoCambio.fecha > fecha_corte)
+        .order_by(SeguimientoCambio.fecha.asc(), SeguimientoCambio.id.asc())
+    )
+    for comisaria_id, codigo, valor_anterior in cambios:
+        valores_al_corte.setdefault((comisaria_id, codigo), valor_anterior)
+
+    detalles_por_comisaria = {}
+    detalles = (
+        db.query(SeguimientoCeldaDetalle)
+        .filter(SeguimientoCeldaDetalle.fecha_actualizacion <= fecha_corte)
+        .order_by(SeguimientoCeldaDetalle.fecha_actualizacion.asc())
+    )
+    for d in detalles:
+        detalles_por_comisaria.setdefault(d.comisaria_id, []).append(d)
+
+    grilla = []
+    for fila in filas:
+        if fila.created_at and fila.created_at > fecha_corte:
+            continue
+        datos = {col.name: getattr(fila, col.name) for col in SeguimientoComisaria.__table__.columns}
+        for campo, codigo in CODIGOS_CAMPO.items():
+            if (fila.id, codigo) in valores_al_corte:
+                datos[campo] = deserializar_valor(campo, valores_al_corte[(fila.id, codigo)])
+        datos["detalles"] = detalles_por_comisaria.get(fila.id, [])
+        grilla.append(datos)
+
+    grilla.sort(key=lambda d: d["numero"] or 0)
+    return grilla
+
+
+# ============================================
+# AGREGADOS MATERIALIZADOS
+# ============================================
+
+_COLUMNAS_TOTALES = (
+    'n_comisarias', 'suma_avance_programado', 'n_avance_programado',
+    'suma_avance_fisico', 'n_avance_fisico', 'suma_monto_pagado',
+)
+
+
+def contribucion(fila) -> dict:
+    """
+    Aporte de una fila de seguimiento a los agregados: {etapa: {columna: valor}}.
+    Costo constante (no consulta la BD).
+    """
+    aporte = {}
+    total_si = total_aplicables = 0
+    todas_completas = True
+    for etapa, _nombre, campos in ETAPAS:
+        valores = [getattr(fila, campo) for campo in campos]
+        aplicables = sum(1 for v in valores if v not in VALORES_NO_APLICA)
+        si = sum(1 for v in valores if v == 'SI')
+        completa = si == aplicables
+        aporte[etapa] = {'si': si, 'aplicables': aplicables, 'completas': int(completa)}
+        total_si += si
+        total_aplicables += aplicables
+        todas_completas = todas_completas and completa
+
+    aporte[ETAPA_TOTAL] = {
+        'si': total_si,
+        'aplicables': total_aplicables,
+        'completas': int(todas_completas),
+        'n_comisarias': 1,
+        'suma_avance_programado': fila.avance_programado or 0.0,
+        'n_avance_programado': int(fila.avance_programado is not None),
+        'suma_avance_fisico': fila.avance_fisico or 0.0,
+        'n_avance_fisico': int(fila.avance_fisico is not None),
+        'suma_monto_pagado': fila.dossier_monto_pagado or 0.0,
+    }
+    return aporte
+
+
+def recalcular_agregados(db: Session) -> None:
+    """Reconstruye la tabla de agregados desde cero (inicialización o reparación)."""
+    db.query(SeguimientoAgregado).delete(synchronize_session=False)
+    etapas = [e[0] for e in ETAPAS] + [ETAPA_TOTAL]
+    globales = {etapa: SeguimientoAgregado(comisaria_id=COMISARIA_GLOBAL, etapa=etapa) for etapa in etapas}
+    for registro in globales.values():
+        for columna in ('si', 'aplicables', 'completas') + _COLUMNAS_TOTALES:
+            setattr(registro, columna, 0)
+
+    for fila in db.query(SeguimientoComisaria).all():
+        for etapa, valores in contribucion(fila).items():
+            propio = SeguimientoAgregado(comisaria_id=fila.id, etapa=etapa)
+            for columna in ('si', 'aplicables', 'completas') + _COLUMNAS_TOTALES:
+                setattr(propio, columna, valores.get(columna, 0))
+                setattr(globales[etapa], columna, getattr(globales[etapa], columna) + valores.get(columna, 0))
+            db.add(propio)
+
+    for registro in globales.values():
+        db.add(registro)
+    db.commit()
+
+
+def inicializar_agregados(db: Session) -> None:
+    """Construye los agregados solo si la tabla está vacía."""
+    if db.query(SeguimientoAgregado.id).first() is None:
+        recalcular_agregados(db)
+
+
+def aplicar_delta_agregados(db: Session, comisaria_id: int, antes: dict, despues: dict) -> bool:
+    """
+    Aplica la diferencia entre dos contribuciones a la fila de la comisaría y a la global.
+    Usa UPDATE col = col + delta para ser seguro con escrituras concurrentes.
+    Retorna False si faltan filas de agregados (hay que recalcular).
+    """
+    for etapa, valores_despues in despues.items():
+        valores_antes = antes[etapa]
+        delta = {
+            getattr(SeguimientoAgregado, columna): getattr(SeguimientoAgregado, columna) + (valor - valores_antes[columna])
+            for columna, valor in valores_despues.items()
+            if valor != valores_antes[columna]
+        }
+        if not delta:
+            continue
+        actualizadas = (
+            db.query(SeguimientoAgregado)
+            .filter(
+                SeguimientoAgregado.comisaria_id.in_([comisaria_id, COMISARIA_GLOBAL]),
+                SeguimientoAgregado.etapa == etapa,
+            )
+            .update(delta, synchronize_session=False)
+        )
+        if actualizadas != 2:
+            return False
+    return True
+
+
+def obtener_resumen(db: Session, comisaria_id: int = COMISARIA_GLOBAL) -> Optional[dict]:
+    """Resumen de avance leído de los agregados (6 filas, sin recorrer el seguimiento)."""
+    filas = {
+        a.etapa: a
+        for a in db.query(SeguimientoAgregado).filter(SeguimientoAgregado.comisaria_id == comisaria_id)
+    }
+    total = filas.get(ETAPA_TOTAL)
+    if total is None:
+        return None
+
+    def porcentaje(si, aplicables):
+        return round(si / aplicables, 4) if aplicables else None
+
+    return {
+        "comisaria_id": comisaria_id or None,
+        "n_comisarias": total.n_comisarias,
+        "avance_programado_promedio": (
+            total.suma_avance_programado / total.n_avance_programado if total.n_avance_programado else None
+        ),
+        "avance_fisico_promedio": (
+            total.suma_avance_fisico / total.n_avance_fisico if total.n_avance_fisico else None
+        ),
+        "monto_pagado_total": round(total.suma_monto_pagado, 2),
+        "celdas_si": total.si,
+        "celdas_aplicables": total.aplicables,
+        "porcentaje_avance": porcentaje(total.si, total.aplicables),
+        "comisarias_completas": total.completas,
+        "etapas": [
+            {
+                "etapa": etapa,
+                "nombre": nombre,
+                "si": filas[etapa].si,
+                "aplicables": filas[etapa].aplicables,
+                "porcentaje": porcentaje(filas[etapa].si, filas[etapa].aplicables),
+                "completas": filas[etapa].completas,
+            }
+            for etapa, nombre, _campos in ETAPAS
+            if etapa in filas
+        ],
+    }
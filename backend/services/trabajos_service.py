@@ -0,0 +1,222 @@
+"""
+Cola de trabajos en segundo plano sobre la tabla trabajos.
+- encolar() registra un trabajo pendiente y retorna su id; el cliente consulta el
+  estado con GET /api/trabajos/{id}.
+- Cada proceso corre un EjecutorTrabajos que reclama trabajos con un UPDATE ... RETURNING.
+  En PostgreSQL la subconsulta usa FOR UPDATE SKIP LOCKED: varios workers (o réplicas)
+  toman trabajos distintos sin esperarse entre sí. En SQLite las escrituras ya están
+  serializadas y el mismo UPDATE condicional basta.
+- Las funciones se registran con @tarea("tipo"), reciben (parametros, trabajo_id) y lo
+  que retornan se guarda como resultado (JSON).
+- Mientras un trabajo corre, su worker actualiza latido_en cada TRABAJOS_LATIDO_SEGUNDOS.
+  Solo se reencolan los trabajos en curso sin latido por más de TRABAJOS_ABANDONO_SEGUNDOS
+  (worker caído): uno largo pero vivo nunca se ejecuta dos veces.
+"""
+import json
+import os
+import socket
+import threading
+from datetime import datetime, timedelta
+from typing import Optional
+
+from sqlalchemy import bindparam, text
+from sqlalchemy.orm import Session
+
+from database import engine, ES_POSTGRES
+from models import Trabajo
+
+# Hilos por proceso que ejecutan trabajos
+TRABAJOS_HILOS = int(os.getenv("TRABAJOS_HILOS", "2"))
+# Espera entre consultas cuando no hay trabajos pendientes (segundos)
+TRABAJOS_ESPERA_SEGUNDOS = float(os.getenv("TRABAJOS_ESPERA_SEGUNDOS", "1"))
+# Cada cuánto el worker marca como vivos los trabajos que está ejecutando
+TRABAJOS_LATIDO_SEGUNDOS = float(os.getenv("TRABAJOS_LATIDO_SEGUNDOS", "30"))
+# Un trabajo en curso sin latido por más de esto se considera abandonado (worker caído) y se reencola
+TRABAJOS_ABANDONO_SEGUNDOS = float(os.getenv("TRABAJOS_ABANDONO_SEGUNDOS", "300"))
+TRABAJOS_MAX_INTENTOS = 3
+
+# tipo -> función(parametros: dict, trabajo_id: int) -> resultado serializable
+TAREAS = {}
+
+
+def tarea(tipo: str):
+    """Registra la función que ejecuta los trabajos de un tipo."""
+    def registrar(funcion):
+        TAREAS[tipo] = funcion
+        return funcion
+    return registrar
+
+
+def encolar(db: Session, tipo: str, parametros: dict = None, usuario: str = None) -> int:
+    """Registra un trabajo pendiente y retorna su id."""
+    trabajo = Trabajo(
+        tipo=tipo,
+        parametros=json.dumps(parametros or {}, ensure_ascii=False),
+        estado='pendiente',
+        creado_por=usuario,
+    )
+    db.add(trabajo)
+    db.commit()
+    return trabajo.id
+
+
+def registrar_progreso(trabajo_id: int, progreso: dict):
+    """Guarda un avance parcial en 'resultado' mientras el trabajo sigue en curso (cuenta como latido)."""
+    with engine.begin() as conn:
+        conn.execute(text("""
+            UPDATE trabajos SET resultado = :resultado, latido_en = :ahora
+            WHERE id = :id AND estado = 'en_curso'
+        """), {"id": trabajo_id, "resultado": json.dumps(progreso, ensure_ascii=False), "ahora": datetime.now()})
+
+
+def _latir(ids: list):
+    """Marca como vivos los trabajos en curso de este worker."""
+    consulta = text("UPDATE trabajos SET latido_en = :ahora WHERE id IN :ids AND estado = 'en_curso'")
+    with engine.begin() as conn:
+        conn.execute(consulta.bindparams(bindparam("ids", expanding=True)), {"ids": ids, "ahora": datetime.now()})
+
+
+def obtener(db: Session, trabajo_id: int) -> Optional[dict]:
+    trabajo = db.query(Trabajo).filter(Trabajo.id == trabajo_id).first()
+    if trabajo is None:
+        return None
+    return {
+        "id": trabajo.id,
+        "tipo": trabajo.tipo,
+        "estado": trabajo.estado,
+        "intentos": trabajo.intentos,
+        "resultado": json.loads(trabajo.resultado) if trabajo.resultado else None,
+        "error": trabajo.error,
+        "creado_por": trabajo.creado_por,
+        "created_at": trabajo.created_at.isoformat() if trabajo.created_at else None,
+        "iniciado_en": trabajo.iniciado_en.isoformat() if trabajo.iniciado_en else None,
+        "latido_en": trabajo.latido_en.isoformat() if trabajo.latido_en else None,
+        "terminado_en": trabajo.terminado_en.isoformat() if trabajo.terminado_en else None,
+    }
+
+
+def _reclamar(worker: str, tipos: list) -> Optional[tuple]:
+    """Marca como en curso el trabajo pendiente más antiguo de los tipos dados. Retorna (id, tipo, parametros)."""
+    bloqueo = " FOR UPDATE SKIP LOCKED" if ES_POSTGRES else ""
+    consulta = text(f"""
+        UPDATE trabajos
+        SET estado = 'en_curso', intentos = intentos + 1, worker = :worker, iniciado_en = :ahora, latido_en = :ahora
+        WHERE id = (
+            SELECT id FROM trabajos
+            WHERE estado = 'pendiente' AND tipo IN :tipos
+            ORDER BY id LIMIT 1{bloqueo}
+        ) AND estado = 'pendiente'
+        RETURNING id, tipo, parametros
+    """).bindparams(bindparam("tipos", expanding=True))
+    with engine.begin() as conn:
+        return conn.execute(consulta, {"worker": worker, "ahora": datetime.now(), "tipos": tipos}).first()
+
+
+def _terminar(trabajo_id: int, estado: str, resultado=None, error: str = None):
+    with engine.begin() as conn:
+        conn.execute(text("""
+            UPDATE trabajos SET estado = :estado, resultado = :resultado, error = :error, terminado_en = :ahora
+            WHERE id = :id
+        """), {
+            "id": trabajo_id,
+            "estado": estado,
+            "resultado": json.dumps(resultado, ensure_ascii=False) if resultado is not None else None,
+            "error": error,
+            "ahora": datetime.now(),
+        })
+
+
+def reencolar_abandonados() -> int:
+    """
+    Devuelve a pendiente los trabajos en curso sin latido reciente (worker caído), o los
+    marca con error tras varios intentos.
+    """
+    limite = datetime.now() - timedelta(seconds=TRABAJOS_ABANDONO_SEGUNDOS)
+    # Trabajos reclamados antes de existir latido_en: se usa iniciado_en
+    vencido = "estado = 'en_curso' AND COALESCE(latido_en, iniciado_en) < :limite"
+    with engine.begin() as conn:
+        conn.execute(text(f"""
+            UPDATE trabajos SET estado = 'error', error = 'Abandonado tras varios intentos', terminado_en = :ahora
+            WHERE {vencido} AND intentos >= :maximo
+        """), {"ahora": datetime.now(), "limite": limite, "maximo": TRABAJOS_MAX_INTENTOS})
+        return conn.execute(text(f"""
+            UPDATE trabajos SET estado = 'pendiente', worker = NULL
+            WHERE {vencido}
+        """), {"limite": limite}).rowcount
+
+
+class EjecutorTrabajos:
+    """Hilos que reclaman y ejecutan trabajos de los tipos registrados en este proceso."""
+
+    def __init__(self, hilos: int = TRABAJOS_HILOS):
+        self.hilos = hilos
+        self._detener = threading.Event()
+        self._hilos = []
+        # ids de los trabajos que este proceso está ejecutando (para el latido)
+        self._en_curso = set()
+        self._lock = threading.Lock()
+
+    def iniciar(self):
+        if not TAREAS or self.hilos <= 0 or self._hilos:
+            return
+        reencolados = reencolar_abandonados()
+        if reencolados:
+            print(f"Trabajos: {reencolados} trabajo(s) abandonado(s) vueltos a la cola")
+        base = f"{socket.gethostname()}:{os.getpid()}"
+        for i in range(self.hilos):
+            hilo = threading.Thread(target=self._bucle, args=(f"{base}:{i}",), name=f"trabajos-{i}", daemon=True)
+            hilo.start()
+            self._hilos.append(hilo)
+        latido = threading.Thread(target=self._bucle_latido, name="trabajos-latido", daemon=True)
+        latido.start()
+        self._hilos.append(latido)
+
+    def detener(self, timeout: float = 5):
+        self._detener.set()
+        for hilo in self._hilos:
+            hilo.join(timeout)
+        self._hilos = []
+
+    def _bucle(self, worker: str):
+        while not self._detener.is_set():
+            try:
+                reclamado = _reclamar(worker, sorted(TAREAS))
+            except Exception as e:
+                print(f"Trabajos: error reclamando trabajo: {e}")
+                reclamado = None
+            if reclamado is None:
+                self._detener.wait(TRABAJOS_ESPERA_SEGUNDOS)
+                continue
+            self._ejecutar(*reclamado)
+
+    def _bucle_latido(self):
+        """Latido de los trabajos en curso y reencolado de los de workers caídos."""
+        while not self._detener.wait(TRABAJOS_LATIDO_SEGUNDOS):
+            try:
+                with self._lock:
+                    ids = sorted(self._en_curso)
+                if ids:
+                    _latir(ids)
+                reencolados = reencolar_abandonados()
+                if reencolados:
+                    print(f"Trabajos: {reencolados} trabajo(s) sin latido vueltos a la cola")
+            except Exception as e:
+                print(f"Trabajos: error en el latido: {e}")
+
+    def _ejecutar(self, trabajo_id: int, tipo: str, parametros: str):
+        with self._lock:
+            self._en_curso.add(trabajo_id)
+        try:
+            resultado = TAREAS[tipo](json.loads(parametros or "{}"), trabajo_id)
+        except Exception as e:
+            print(f"Trabajo {trabajo_id} ({tipo}) falló: {e}")
+            _terminar(trabajo_id, 'error', error=str(e)[:2000])
+            return
+        finally:
+            with self._lock:
+                self._en_curso.discard(trabajo_id)
+        _terminar(trabajo_id, 'completado', resultado=resultado)
+
+
+# Instancia global del ejecutor
+ejecutor_trabajos = EjecutorTrabajos()
@@ -0,0 +1,330 @@
+"""
+ZIP (y tar) generados al vuelo, sin archivo temporal y con memoria constante.
+- Las entradas van sin comprimir (STORED): los PDF ya vienen comprimidos y así el tamaño
+  total y la posición de cada byte se conocen antes de leer los archivos. Eso permite
+  responder Content-Length y pedidos Range (descargas reanudables) generando solo el tramo
+  pedido.
+- El CRC de cada archivo se calcula mientras se envía y se escribe en el descriptor de datos
+  que va después del contenido (bit 3), así una descarga completa lee cada archivo una vez.
+  Si un tramo empieza después de un archivo, su CRC se calcula aparte (con caché).
+- La salida es determinista (nombres, fechas de modificación y orden fijos): la misma
+  lista de archivos produce los mismos bytes y el mismo ETag.
+- Más de 4 GiB o 65535 entradas usan las extensiones ZIP64.
+- TarEnStreaming sigue el mismo esquema para tar (formato POSIX/pax, sin comprimir).
+"""
+import hashlib
+import os
+import struct
+import tarfile
+import threading
+import zlib
+from collections import OrderedDict
+from datetime import datetime
+from typing import Iterator, Optional
+
+BLOQUE = 256 * 1024
+
+_FLAGS = 0x0808  # bit 3: CRC y tamaños en el descriptor; bit 11: nombres en UTF-8
+_LIMITE_32 = 0xFFFFFFFF
+_LIMITE_ENTRADAS = 0xFFFF
+_ATRIBUTOS_ARCHIVO = 0o100644 << 16
+
+# CRC de archivos ya leídos: (ruta, tamaño, mtime_ns) -> crc
+_CACHE_CRC_MAX = 10000
+_cache_crc = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+class ErrorZip(Exception):
+    pass
+
+
+def _fecha_dos(timestamp: float) -> tuple:
+    """(hora, fecha) en formato MS-DOS; el formato no admite fechas antes de 1980."""
+    fecha = datetime.fromtimestamp(max(timestamp, 315532800))
+    hora_dos = (fecha.hour << 11) | (fecha.minute << 5) | (fecha.second // 2)
+    fecha_dos = ((fecha.year - 1980) << 9) | (fecha.month << 5) | fecha.day
+    return hora_dos, fecha_dos
+
+
+def _crc_archivo(ruta: str, tamano: int, mtime_ns: int) -> int:
+    clave = (ruta, tamano, mtime_ns)
+    with _cache_lock:
+        if clave in _cache_crc:
+            _cache_crc.move_to_end(clave)
+            return _cache_crc[clave]
+    crc = 0
+    with open(ruta, "rb") as f:
+        for bloque in iter(lambda: f.read(BLOQUE), b""):
+            crc = zlib.crc32(bloque, crc)
+    _guardar_crc(clave, crc)
+    return crc
+
+
+def _guardar_crc(clave: tuple, crc: int):
+    with _cache_lock:
+        _cache_crc[clave] = crc
+        _cache_crc.move_to_end(clave)
+        while len(_cache_crc) > _CACHE_CRC_MAX:
+            _cache_crc.popitem(last=False)
+
+
+class EntradaZip:
+    """Un archivo del ZIP: un archivo en disco (ruta) o bytes ya generados (contenido)."""
+
+    def __init__(self, nombre: str, ruta: Optional[str] = None, contenido: Optional[bytes] = None,
+                 modificado: Optional[float] = None):
+        if (ruta is None) == (contenido is None):
+            raise ValueError("Indicar ruta o contenido")
+        self.nombre = nombre.replace("\\", "/").lstrip("/")
+        self.nombre_bytes = self.nombre.encode("utf-8")
+        self.ruta = ruta
+        self.contenido = contenido
+        if ruta is not None:
+            estado = os.stat(ruta)
+            self.tamano = estado.st_size
+            self.mtime_ns = estado.st_mtime_ns
+            self.modificado = estado.st_mtime if modificado is None else modificado
+            self.crc = None
+        else:
+            self.tamano = len(contenido)
+            self.mtime_ns = 0
+            self.modificado = modificado or 0
+            self.crc = zlib.crc32(contenido)
+        self.offset = 0
+
+    def obtener_crc(self) -> int:
+        if self.crc is None:
+            self.crc = _crc_archivo(self.ruta, self.tamano, self.mtime_ns)
+        return self.crc
+
+
+def _leer(entrada: EntradaZip, desde: int, hasta: int) -> Iterator[bytes]:
+    """Bytes [desde, hasta) del contenido de una entrada, de a BLOQUE."""
+    if entrada.contenido is not None:
+        yield entrada.contenido[desde:hasta]
+        return
+    with open(entrada.ruta, "rb") as f:
+        f.seek(desde)
+        pendiente = hasta - desde
+        while pendiente > 0:
+            bloque = f.read(min(BLOQUE, pendiente))
+            if not bloque:
+                raise ErrorZip(f"{entrada.nombre} cambió de tamaño durante la descarga")
+            pendiente -= len(bloque)
+            yield bloque
+
+
+class _ArchivoEnStreaming:
+    """
+    Base de los formatos: al construirse cada formato arma `_partes` (inicio, fin, tipo,
+    entrada) y `tamano`; `generar(inicio, fin)` produce cualquier tramo de bytes.
+    """
+
+    entradas: list
+    tamano: int
+    _partes: list
+
+    def _parte(self, tipo: str, entrada: Optional[EntradaZip], a: int, b: int) -> Iterator[bytes]:
+        raise NotImplementedError
+
+    def generar(self, inicio: int = 0, fin: Optional[int] = None) -> Iterator[bytes]:
+        """Genera los bytes [inicio, fin] (fin incluido, como en Range)."""
+        fin = self.tamano - 1 if fin is None else fin
+        for desde, hasta, tipo, entrada in self._partes:
+            if hasta <= inicio:
+                continue
+            if desde > fin:
+                break
+            yield from self._parte(tipo, entrada, max(inicio, desde) - desde, min(fin + 1, hasta) - desde)
+
+    def etag(self) -> str:
+        """Identifica el contenido: cambia si cambia algún nombre, tamaño o fecha de modificación."""
+        h = hashlib.sha256(type(self).__name__.encode())
+        for entrada in self.entradas:
+            h.update(entrada.nombre_bytes + b"\0")
+            h.update(f"{entrada.tamano}:{entrada.mtime_ns}:{entrada.modificado}".encode())
+            if entrada.contenido is not None:
+                h.update(hashlib.sha256(entrada.contenido).digest())
+        return f'"{h.hexdigest()[:32]}"'
+
+
+class ZipEnStreaming(_ArchivoEnStreaming):
+    """
+    Plan de un ZIP: calcula al construirse el tamaño total y dónde cae cada parte, y
+    genera cualquier tramo de bytes con `generar(inicio, fin)`.
+    """
+
+    def __init__(self, entradas: list):
+        nombres = set()
+        for entrada in entradas:
+            if entrada.nombre in nombres:
+                raise ErrorZip(f"Nombre repetido en el ZIP: {entrada.nombre}")
+            nombres.add(entrada.nombre)
+        self.entradas = entradas
+        # Tamaño sin ZIP64: datos + cabecera local + descriptor + entrada del directorio + final
+        tamano_32 = sum(e.tamano + 92 + 2 * len(e.nombre_bytes) for e in entradas) + 22
+        self.zip64 = len(entradas) >= _LIMITE_ENTRADAS or tamano_32 >= _LIMITE_32
+
+        # Partes en orden: (inicio, fin, tipo, entrada); fin excluido
+        self._partes = []
+        posicion = 0
+        for entrada in entradas:
+            entrada.offset = posicion
+            for tipo, largo in (("cabecera", self._largo_cabecera(entrada)),
+                                ("datos", entrada.tamano),
+                                ("descriptor", 24 if self.zip64 else 16)):
+                if largo:
+                    self._partes.append((posicion, posicion + largo, tipo, entrada))
+                posicion += largo
+        self._inicio_directorio = posicion
+        self._largo_directorio = sum(self._largo_central(e) for e in entradas)
+        # Directorio central y registro final (con ZIP64: registro ZIP64 y localizador)
+        posicion += self._largo_directorio + (56 + 20 if self.zip64 else 0) + 22
+        self._partes.append((self._inicio_directorio, posicion, "final", None))
+        self.tamano = posicion
+
+    # -- Tamaños -------------------------------------------------------------
+
+    def _largo_cabecera(self, entrada: EntradaZip) -> int:
+        return 30 + len(entrada.nombre_bytes) + (20 if self.zip64 else 0)
+
+    def _largo_central(self, entrada: EntradaZip) -> int:
+        return 46 + len(entrada.nombre_bytes) + (28 if self.zip64 else 0)
+
+    # -- Estructuras ---------------------------------------------------------
+
+    def _cabecera_local(self, entrada: EntradaZip) -> bytes:
+        hora, fecha = _fecha_dos(entrada.modificado)
+        if self.zip64:
+            extra = struct.pack("<HHQQ", 0x0001, 16, entrada.tamano, entrada.tamano)
+            tamano = _LIMITE_32
+        else:
+            extra = b""
+            tamano = entrada.tamano
+        return struct.pack(
+            "<IHHHHHIIIHH", 0x04034B50, 45 if self.zip64 else 20, _FLAGS, 0, hora, fecha,
+            0, tamano, tamano, len(entrada.nombre_bytes), len(extra)
+        ) + entrada.nombre_bytes + extra
+
+    def _descriptor(self, entrada: EntradaZip) -> bytes:
+        if self.zip64:
+            return struct.pack("<IIQQ", 0x08074B50, entrada.obtener_crc(), entrada.tamano, entrada.tamano)
+        return struct.pack("<IIII", 0x08074B50, entrada.obtener_crc(), entrada.tamano, entrada.tamano)
+
+    def _final(self) -> bytes:
+        partes = []
+        version = 45 if self.zip64 else 20
+        for entrada in self.entradas:
+            hora, fecha = _fecha_dos(entrada.modificado)
+            if self.zip64:
+                extra = struct.pack("<HHQQQ", 0x0001, 24, entrada.tamano, entrada.tamano, entrada.offset)
+                tamano, offset = _LIMITE_32, _LIMITE_32
+            else:
+                extra = b""
+                tamano, offset = entrada.tamano, entrada.offset
+            partes.append(struct.pack(
+                "<IHHHHHHIIIHHHHHII", 0x02014B50, (3 << 8) | version, version, _FLAGS, 0, hora, fecha,
+                entrada.obtener_crc(), tamano, tamano, len(entrada.nombre_bytes), len(extra), 0, 0, 0,
+                _ATRIBUTOS_ARCHIVO, offset
+            ) + entrada.nombre_bytes + extra)
+        cantidad = len(self.entradas)
+        if self.zip64:
+            fin_directorio = self._inicio_directorio + self._largo_directorio
+            partes.append(struct.pack(
+                "<IQHHIIQQQQ", 0x06064B50, 44, 45, 45, 0, 0, cantidad, cantidad,
+                self._largo_directorio, self._inicio_directorio))
+            partes.append(struct.pack("<IIQI", 0x07064B50, 0, fin_directorio, 1))
+            # Con ZIP64 el registro final lleva los máximos y los valores se leen del registro ZIP64
+            partes.append(struct.pack("<IHHHHIIH", 0x06054B50, 0, 0, _LIMITE_ENTRADAS, _LIMITE_ENTRADAS,
+                                      _LIMITE_32, _LIMITE_32, 0))
+        else:
+            partes.append(struct.pack("<IHHHHIIH", 0x06054B50, 0, 0, cantidad, cantidad,
+                                      self._largo_directorio, self._inicio_directorio, 0))
+        return b"".join(partes)
+
+    # -- Generación ----------------------------------------------------------
+
+    def _datos(self, entrada: EntradaZip, desde: int, hasta: int) -> Iterator[bytes]:
+        """Contenido de la entrada; si se lee el archivo completo calcula el CRC al pasar."""
+        if entrada.crc is not None or desde != 0 or hasta != entrada.tamano:
+            yield from _leer(entrada, desde, hasta)
+            return
+        crc = 0
+        for bloque in _leer(entrada, desde, hasta):
+            crc = zlib.crc32(bloque, crc)
+            yield bloque
+        entrada.crc = crc
+        _guardar_crc((entrada.ruta, entrada.tamano, entrada.mtime_ns), crc)
+
+    def _parte(self, tipo: str, entrada: Optional[EntradaZip], a: int, b: int) -> Iterator[bytes]:
+        if tipo == "datos":
+            yield from self._datos(entrada, a, b)
+        elif tipo == "cabecera":
+            yield self._cabecera_local(entrada)[a:b]
+        elif tipo == "descriptor":
+            yield self._descriptor(entrada)[a:b]
+        else:
+            yield self._final()[a:b]
+
+
+class TarEnStreaming(_ArchivoEnStreaming):
+    """Plan de un tar (pax, sin comprimir) con las mismas operaciones que ZipEnStreaming."""
+
+    def __init__(self, entradas: list):
+        self.entradas = entradas
+        self._partes = []
+        posicion = 0
+        for entrada in entradas:
+            # Solo se guarda el largo de la cabecera; se vuelve a generar al enviarla
+            for tipo, largo in (("cabecera", len(self._cabecera(entrada))),
+                                ("datos", entrada.tamano),
+                                ("relleno", -entrada.tamano % tarfile.BLOCKSIZE)):
+                if largo:
+                    self._partes.append((posicion, posicion + largo, tipo, entrada))
+                posicion += largo
+        # Fin del archivo: dos bloques en cero
+        self._partes.append((posicion, posicion + 2 * tarfile.BLOCKSIZE, "final", None))
+        self.tamano = posicion + 2 * tarfile.BLOCKSIZE
+
+    def _cabecera(self, entrada: EntradaZip) -> bytes:
+        info = tarfile.TarInfo(entrada.nombre)
+        info.size = entrada.tamano
+        info.mtime = int(entrada.modificado)
+        info.mode = 0o644
+        return info.tobuf(tarfile.PAX_FORMAT, "utf-8", "surrogateescape")
+
+    def _parte(self, tipo: str, entrada: Optional[EntradaZip], a: int, b: int) -> Iterator[bytes]:
+        if tipo == "datos":
+            yield from _leer(entrada, a, b)
+        elif tipo == "cabecera":
+            yield self._cabecera(entrada)[a:b]
+        else:
+            yield bytes(b - a)
+
+
+def parsear_rango(cabecera: Optional[str], total: int) -> Optional[tuple]:
+    """
+    Interpreta un header Range de un solo tramo ("bytes=a-b", "bytes=a-", "bytes=-n").
+    Retorna (inicio, fin) con fin incluido, None si no hay rango usable (se responde
+    completo) o lanza ValueError si el rango no es satisfacible.
+    """
+    if not cabecera or not cabecera.startswith("bytes=") or "," in cabecera:
+        return None
+    inicio_txt, _, fin_txt = cabecera[len("bytes="):].strip().partition("-")
+    try:
+        inicio = int(inicio_txt) if inicio_txt else None
+        fin = int(fin_txt) if fin_txt else None
+    except ValueError:
+        return None
+    if inicio is None:
+        # "bytes=-n": los últimos n bytes
+        if fin is None:
+            return None
+        if fin == 0:
+            raise ValueError("Rango vacío")
+        return max(total - fin, 0), total - 1
+    fin = total - 1 if fin is None else fin
+    if inicio >= total or fin < inicio:
+        raise ValueError("Rango fuera del archivo")
+    return inicio, min(fin, total - 1)
@@ -13,7 +13,10 @@ mkdir -p $DATA_DIR
 mkdir -p $UPLOADS_DIR
 
 # Si no existe la base de datos en el volumen, copiar la inicial
-if [ ! -f "$DB_FILE" ]; then
+# (con DATABASE_URL apuntando a PostgreSQL no se usa el archivo SQLite)
+if [ -n "$DATABASE_URL" ]; then
+    echo "Usando la base de datos de DATABASE_URL"
+elif [ ! -f "$DB_FILE" ]; then
     echo "Base de datos no encontrada en $DB_FILE"
     if [ -f "$INITIAL_DB" ]; then
         echo "Copiando base de datos inicial..."
@@ -27,6 +30,15 @@ else
 fi
 
 # Iniciar el servidor
-echo "Iniciando servidor..."
+# WEB_CONCURRENCY > 1 levanta varios procesos worker (el trabajo de CPU deja de compartir
+# un solo GIL). La inicialización de la base corre una sola vez bajo un lock de archivo
+# y el estado compartido entre workers se guarda en la base y en $STATE_DIR.
+WORKERS="${WEB_CONCURRENCY:-1}"
+echo "Iniciando servidor con $WORKERS worker(s)..."
 cd /app/backend
-exec uvicorn main:app --host 0.0.0.0 --port 8000
+# Detrás del proxy de Easypanel (Traefik) la IP del cliente llega en X-Forwarded-For.
+# uvicorn solo confía en ese header si la conexión viene de FORWARDED_ALLOW_IPS (variable
+# de entorno que lee uvicorn; por defecto 127.0.0.1): fijarla en Easypanel a la IP o red
+# del proxy (p. ej. 10.0.1.0/24). Nunca *: cualquier cliente podría inventar su IP y
+# saltarse el límite de login por IP. Sin configurarla, todos comparten la IP del proxy.
+exec uvicorn main:app --host 0.0.0.0 --port 8000 --workers "$WORKERS"
@@ -134,6 +134,10 @@ async function apiLogin(username, password) {
  * Logout de usuario
  */
 function apiLogout() {
+    // Revocar el token en el servidor (sin esperar la respuesta)
+    if (getToken()) {
+        fetchAPI('/logout', { method: 'POST' }).catch(() => {});
+    }
     removeToken();
 }
 
@@ -434,6 +438,14 @@ async function apiEliminarExpediente(itemId) {
     });
 }
 
+async function apiSolicitarDossier(contratoId) {
+    return await fetchAPI(`/contratos/${contratoId}/dossier`, { method: 'POST' });
+}
+
+async function apiObtenerTrabajo(trabajoId) {
+    return await fetchAPI(`/trabajos/${trabajoId}`);
+}
+
 // ============================================
 // UTILIDADES
 // ============================================
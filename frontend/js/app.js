@@ -528,6 +528,26 @@ async function cargarDocumentos() {
     }
 }
 
+// Vista previa de la primera página. Si la miniatura se está generando (202) se reintenta
+// unas veces; si el archivo no tiene miniatura la imagen se quita
+function miniaturaHtml(url, clases) {
+    if (!url) return '';
+    return `<img src="${url}" loading="lazy" alt="" onerror="reintentarMiniatura(this)" data-url="${url}"
+                 class="${clases} inline-block align-middle object-cover object-top border border-gray-200 rounded bg-white">`;
+}
+
+function reintentarMiniatura(img) {
+    const intentos = Number(img.dataset.intentos || 0);
+    if (intentos >= 3) {
+        img.remove();
+        return;
+    }
+    img.dataset.intentos = intentos + 1;
+    setTimeout(() => {
+        img.src = `${img.dataset.url}?r=${intentos + 1}`;
+    }, 2000 * (intentos + 1));
+}
+
 function renderizarDocumentos(data) {
     const container = document.getElementById('lista-documentos');
     const totalEl = document.getElementById('total-docs');
@@ -586,7 +606,7 @@ function renderizarDocumentos(data) {
         return `
         <tr class="documento-row hover:bg-gray-50">
             <td class="px-4 py-3 text-sm text-gray-900 font-medium cursor-pointer" onclick="verDetalle(${doc.id})">${offset + index + 1}</td>
-            <td class="px-4 py-3 text-sm text-blue-600 font-medium cursor-pointer" onclick="verDetalle(${doc.id})">${doc.numero || 'Sin número'}</td>
+            <td class="px-4 py-3 text-sm text-blue-600 font-medium cursor-pointer" onclick="verDetalle(${doc.id})">${miniaturaHtml(doc.archivo_local ? `/api/documentos/${doc.id}/miniatura` : null, 'w-8 h-10 mr-2')}${doc.numero || 'Sin número'}</td>
             <td class="px-4 py-3 text-sm text-purple-600 cursor-pointer ${claseReferencia}" onclick="verDetalle(${doc.id})" title="Oficio de referencia">${oficioRef}</td>
             <td class="px-4 py-3 text-sm text-gray-600 cursor-pointer" onclick="verDetalle(${doc.id})">${formatearFecha(doc.fecha)}</td>
             <td class="px-4 py-3 text-sm text-gray-900 cursor-pointer" onclick="verDetalle(${doc.id})">${doc.asunto || 'Sin asunto'}</td>
@@ -693,6 +713,9 @@ async function renderizarDetalle(doc) {
         let enlaces = '';
         if (doc.archivo_local) {
             enlaces += `
+            <a href="${window.location.origin}/uploads/${doc.archivo_local}" target="_blank" class="block mb-2">
+                ${miniaturaHtml(`/api/documentos/${doc.id}/miniatura`, 'w-40 h-52')}
+            </a>
             <a href="${window.location.origin}/uploads/${doc.archivo_local}" target="_blank"
                class="link-documento flex items-center gap-2">
                 <svg class="w-5 h-5" fill="none" stroke="currentColor" viewBox="0 0 24 24">
@@ -2701,11 +2724,40 @@ async function verExpedienteContrato() {
     if (!contrato) return;
     document.getElementById('exp-contrato-nombre').textContent =
         `${contrato.numero || 'Sin número'} — ${contrato.contratado || ''}`;
+    document.getElementById('btn-zip-expediente').href = `${API_BASE}/contratos/${contrato.id}/expediente/zip`;
     mostrarVista('vista-expediente-contrato');
     await cargarExpediente(contrato.id);
-    const btnNuevo = document.getElementById('btn-nuevo-expediente');
-    if (estaAutenticado()) btnNuevo.classList.remove('hidden');
-    else btnNuevo.classList.add('hidden');
+    for (const id of ['btn-nuevo-expediente', 'btn-dossier-expediente']) {
+        const btn = document.getElementById(id);
+        if (estaAutenticado()) btn.classList.remove('hidden');
+        else btn.classList.add('hidden');
+    }
+}
+
+async function generarDossierExpediente() {
+    const contrato = state.contratoActual;
+    if (!contrato) return;
+    const btn = document.getElementById('btn-dossier-expediente');
+    btn.disabled = true;
+    try {
+        let respuesta = await apiSolicitarDossier(contrato.id);
+        if (respuesta.trabajo_id) {
+            mostrarToast('Generando dossier PDF...');
+            let trabajo;
+            do {
+                await new Promise(r => setTimeout(r, 1000));
+                trabajo = await apiObtenerTrabajo(respuesta.trabajo_id);
+            } while (trabajo.estado === 'pendiente' || trabajo.estado === 'en_curso');
+            if (trabajo.estado === 'error') throw new Error(trabajo.error || 'Error al generar el dossier');
+        }
+        // Fuera del clic (tras esperar el trabajo) window.open lo bloquean los navegadores;
+        // la respuesta es un adjunto, así que navegar en la misma pestaña solo lo descarga
+        window.location.href = `${API_BASE}/contratos/${contrato.id}/dossier`;
+    } catch (error) {
+        mostrarToast('Error al generar dossier: ' + error.message, 'error');
+    } finally {
+        btn.disabled = false;
+    }
 }
 
 async function cargarExpediente(contratoId) {
@@ -2771,7 +2823,9 @@ function renderizarExpediente(items) {
 
         let archivoLink = '';
         if (item.archivo_local) {
-            archivoLink = `<a href="${window.location.origin}/uploads/${item.archivo_local}" target="_blank"
+            archivoLink = `<a href="${window.location.origin}/uploads/${item.archivo_local}" target="_blank">
+                ${miniaturaHtml(`/api/expediente/${item.id}/miniatura`, 'w-10 h-12')}</a>
+            <a href="${window.location.origin}/uploads/${item.archivo_local}" target="_blank"
                 class="text-blue-600 hover:text-blue-800 text-xs flex items-center gap-1">
                 <svg class="w-3 h-3" fill="none" stroke="currentColor" viewBox="0 0 24 24">
                     <path stroke-linecap="round" stroke-linejoin="round" stroke-width="2" d="M7 21h10a2 2 0 002-2V9.414a1 1 0 00-.293-.707l-5.414-5.414A1 1 0 0012.586 3H7a2 2 0 00-2 2v14a2 2 0 002 2z"/>